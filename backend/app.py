@@ -1,7 +1,8 @@
 """
 主应用程序 - Flask REST API
 """
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
+import json
 from flask_cors import CORS
 import traceback
 from config import Config
@@ -9,20 +10,29 @@ from config import Config
 # 导入服务
 from services.llm_service import llm_service
 from services.retrieval_service import retrieval_service
-from services.load_prediction import load_prediction
+from services.load_prediction import load_prediction, lttb_indices
 from services.gis_service import gis_service
 from services.scorer import scorer
 from services.power_flow import power_flow
 from werkzeug.utils import secure_filename
 import os
-from services.doc_ingest import extract_text, rag_select
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from services.doc_ingest import CONSTRAINT_QUERIES, extract_text, rag_select
 from services.settings_service import settings
+from services.ingest_jobs import get_ingest_jobs
 
 
 app = Flask(__name__)
 CORS(app)  # 允许跨域请求
 
 
+@app.before_request
+def _start_ingest_jobs():
+    """在实际处理请求的进程中创建摄取队列并恢复未完成任务（重载器父进程不处理请求）"""
+    get_ingest_jobs()
+
+
 @app.route('/')
 def index():
     """首页"""
@@ -36,7 +46,10 @@ def index():
 # --------------------- 上传/解析/应用 约束（基础版） ---------------------
 @app.route('/api/uploads', methods=['POST'])
 def upload_document():
-    """接收文件上传，保存到 data/documents/uploads，并返回 doc_id、基本信息。"""
+    """接收文件上传，保存到 data/documents/uploads，提交后台摄取任务并立即返回 job_id。
+
+    表单字段 parse=1 时，摄取流水线在索引后继续调用 LLM 解析约束（结果见任务 result.constraints）。
+    """
     try:
         if 'file' not in request.files:
             return jsonify({'success': False, 'error': '缺少文件字段 file'}), 400
@@ -44,33 +57,48 @@ def upload_document():
         if file.filename == '':
             return jsonify({'success': False, 'error': '文件名为空'}), 400
         fname = secure_filename(file.filename)
+        ext = os.path.splitext(fname)[1].lower()
+        if ext not in ('.pdf', '.txt'):
+            return jsonify({'success': False, 'error': f'不支持的文件类型: {ext}'}), 400
         uploads_dir = os.path.join(Config.DATA_DIR, 'documents', 'uploads')
         os.makedirs(uploads_dir, exist_ok=True)
         save_path = os.path.join(uploads_dir, fname)
         file.save(save_path)
 
-        # 基础文本化（PDF/TXT）
-        text, pages = extract_text(save_path)
-        # 将文本保存为同名txt，便于检索与后续处理
-        try:
-            txt_out = os.path.join(uploads_dir, fname + '.txt')
-            with open(txt_out, 'w', encoding='utf-8') as f:
-                f.write(text)
-        except Exception:
-            pass
-        # 为避免响应过大，返回前 10000 字预览
-        preview = text[:10000]
-        doc_id = fname
+        parse = str(request.form.get('parse', '0')).lower() in ('1', 'true', 'yes')
+        job_id = get_ingest_jobs().submit(save_path, fname, parse=parse)
 
         return jsonify({
             'success': True,
-            'doc_id': doc_id,
+            'job_id': job_id,
+            'doc_id': fname,
             'filename': fname,
             'path': save_path,
-            'pages': pages,
-            'text_preview': preview,
-            'text_length': len(text)
-        })
+            'status': 'queued'
+        }), 202
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/api/jobs', methods=['GET'])
+def list_ingest_jobs():
+    """最近的文档摄取任务（?status=queued|running|succeeded|failed&limit=20）"""
+    try:
+        limit = int(request.args.get('limit', 20))
+        status = request.args.get('status')
+        return jsonify({'success': True, 'jobs': get_ingest_jobs().list(limit=limit, status=status)})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_ingest_job(job_id):
+    """摄取任务状态与进度（stage/progress/pages_done/pages_total），完成后含 result"""
+    try:
+        job = get_ingest_jobs().get(job_id)
+        if job is None:
+            return jsonify({'success': False, 'error': f'未找到任务: {job_id}'}), 404
+        return jsonify({'success': True, 'job': job})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -90,15 +118,7 @@ def parse_constraints_from_file():
 
         text, _ = extract_text(file_path)
         # 简易RAG：从文档中筛选与约束相关的片段再解析，提升长文稳定性
-        queries = [
-            '电压 偏差 允许 范围 kV %',
-            '线路 负载 率 限值 % 运行 N-1',
-            '变压器 负载 限值 % 主变',
-            'N-1 安全 准则 校验',
-            '安全 距离 线路 建筑 变电站 km',
-            '电压 等级 kV 范围'
-        ]
-        selected = rag_select(text, queries, per_query=3, max_chars=7000)
+        selected = rag_select(text, CONSTRAINT_QUERIES, per_query=3, max_chars=7000)
         constraints = llm_service.parse_constraints(selected)
         return jsonify({'success': True, 'constraints': constraints, 'rag': True, 'selected_len': len(selected)})
     except Exception as e:
@@ -172,6 +192,29 @@ def get_documents():
         }), 500
 
 
+@app.route('/api/documents/<doc_id>', methods=['DELETE'])
+def delete_document(doc_id):
+    """删除已上传文档：移出检索索引并删除文件"""
+    try:
+        fname = secure_filename(doc_id)
+        uploads_dir = os.path.join(Config.DATA_DIR, 'documents', 'uploads')
+        file_path = os.path.join(uploads_dir, fname)
+        txt_path = file_path + '.txt'  # 上传时抽取的文本副本
+
+        removed = retrieval_service.remove_document(txt_path)
+        deleted_files = []
+        for p in {file_path, txt_path}:
+            if os.path.exists(p):
+                os.remove(p)
+                deleted_files.append(os.path.basename(p))
+        if not removed and not deleted_files:
+            return jsonify({'success': False, 'error': f'未找到文件: {doc_id}'}), 404
+
+        return jsonify({'success': True, 'removed_from_index': removed, 'deleted_files': deleted_files})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
 @app.route('/api/documents/search', methods=['POST'])
 def search_documents():
     """搜索文档"""
@@ -179,14 +222,17 @@ def search_documents():
         data = request.json
         query = data.get('query', '')
         top_k = data.get('top_k', 3)
+        mode = data.get('mode')  # sparse / dense / hybrid，默认按配置
 
-        results = retrieval_service.search(query, top_k)
+        results = retrieval_service.search(query, top_k, mode=mode)
 
         return jsonify({
             'success': True,
             'query': query,
             'results': results
         })
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({
             'success': False,
@@ -196,9 +242,15 @@ def search_documents():
 
 @app.route('/api/constraints/parse', methods=['POST'])
 def parse_constraints():
-    """解析约束条件"""
+    """解析约束条件（document_texts 为列表时批量解析，constraints 与之一一对应）"""
     try:
         data = request.json
+        document_texts = data.get('document_texts')
+        if isinstance(document_texts, list):
+            return jsonify({
+                'success': True,
+                'constraints': llm_service.parse_constraints_batch([str(t) for t in document_texts])
+            })
         document_text = data.get('document_text', '')
 
         constraints = llm_service.parse_constraints(document_text)
@@ -215,16 +267,84 @@ def parse_constraints():
         }), 500
 
 
+def _sse(event: str, payload) -> str:
+    """编码一条 Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+def _sse_response(events) -> Response:
+    return Response(
+        stream_with_context(events),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # 关闭反向代理缓冲，保证逐块送达
+        }
+    )
+
+
+@app.route('/api/constraints/parse/stream', methods=['POST'])
+def parse_constraints_stream():
+    """流式解析约束（SSE）：先推送规则抽取结果（rules 事件），再逐段推送 LLM 对未解析条款的输出（delta 事件），
+    结束时推送合并后的约束（done 事件）"""
+    from services.rule_extractor import merge_constraints
+    data = request.json or {}
+    document_text = data.get('document_text', '')
+
+    def events():
+        parts = []
+        try:
+            rules, pending = llm_service.rule_prepass(document_text)
+            if rules is not None:
+                yield _sse('rules', {'constraints': rules})
+                if not pending:
+                    yield _sse('done', {'success': True, 'constraints': rules})
+                    return
+            for delta in llm_service.parse_constraints_stream(pending):
+                parts.append(delta)
+                yield _sse('delta', {'delta': delta})
+            constraints = llm_service.parse_json_output("".join(parts))
+            if rules is not None:
+                constraints = merge_constraints(rules, constraints)
+            yield _sse('done', {'success': True, 'constraints': constraints})
+        except Exception as e:
+            yield _sse('error', {'success': False, 'error': str(e)})
+
+    return _sse_response(events())
+
+
 @app.route('/api/load/summary', methods=['GET'])
 def get_load_summary():
-    """获取负载摘要"""
+    """获取负载摘要（可选 ?region=）"""
     try:
-        summary = load_prediction.get_load_summary()
+        region = request.args.get('region')
+        summary = load_prediction.for_region(region).get_load_summary()
 
         return jsonify({
             'success': True,
             'summary': summary
         })
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@app.route('/api/load/summary/all', methods=['GET'])
+def get_load_summary_all():
+    """并发获取多个地区的负载摘要（可选 ?regions=a,b）"""
+    try:
+        regions = [r for r in (request.args.get('regions') or '').split(',') if r] or None
+        summaries = load_prediction.summaries_all(regions)
+
+        return jsonify({
+            'success': True,
+            'summaries': summaries,
+            'loaded_regions': load_prediction.loaded_regions()
+        })
     except Exception as e:
         return jsonify({
             'success': False,
@@ -232,14 +352,43 @@ def get_load_summary():
         }), 500
 
 
+def _int_param(value, name: str, minimum: int = 0) -> int:
+    """解析整数请求参数，非法时抛出 ValueError（由路由返回 400）"""
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{name} 必须为整数: {value!r}')
+    if value < minimum:
+        raise ValueError(f'{name} 不能小于 {minimum}')
+    return value
+
+
 @app.route('/api/load/predict', methods=['POST'])
 def predict_load():
     """预测负载"""
     try:
-        data = request.json
+        data = request.json or {}
         horizon_days = data.get('horizon_days', 365)
-
-        prediction = load_prediction.predict_future_load(horizon_days)
+        max_points = data.get('max_points')
+        if max_points is not None:
+            max_points = _int_param(max_points, 'max_points')
+        service = load_prediction.for_region(data.get('region'))
+
+        prediction = service.predict_future_load(horizon_days)
+
+        # 指定 max_points 时服务端降采样并返回列式数组
+        if max_points:
+            columns = service.downsample_prediction(
+                prediction,
+                max_points,
+                method=data.get('downsample', 'lttb')
+            )
+            return jsonify({
+                'success': True,
+                'format': 'columnar',
+                'total_points': len(prediction),
+                'prediction': columns
+            })
 
         # pandas 的 Timestamp 无法直接 JSON 序列化，转换为 ISO 字符串
         # 仅对该接口做最小侵入式处理，保持前端字段名不变
@@ -256,6 +405,112 @@ def predict_load():
             'success': True,
             'prediction': pred_serializable.to_dict(orient='records')
         })
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@app.route('/api/load/ingest', methods=['POST'])
+def ingest_load():
+    """增量追加负载量测数据"""
+    try:
+        data = request.json or {}
+        measurements = data.get('measurements')
+        if not measurements:
+            return jsonify({'success': False, 'error': '缺少 measurements'}), 400
+
+        service = load_prediction.for_region(data.get('region'))
+        result = service.append_measurements(measurements)
+
+        return jsonify({
+            'success': True,
+            'region': service.region,
+            'ingest': result,
+            'features': service.current_features()
+        })
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@app.route('/api/load/spatial', methods=['GET'])
+def predict_spatial_load():
+    """按母线/区域分解的空间负荷预测"""
+    try:
+        level = request.args.get('level') or Config.SPATIAL_FORECAST_LEVEL
+        horizon_days = _int_param(request.args.get('horizon_days', 365), 'horizon_days', 1)
+        include_hourly = request.args.get('include_hourly', 'false').lower() == 'true'
+
+        service = load_prediction.for_region(request.args.get('region'))
+        prediction = service.predict_future_load(horizon_days)
+        spatial = service.predict_spatial_load(prediction, level=level)
+        matrix = spatial['matrix']
+
+        result = {
+            'level': spatial['level'],
+            'areas': spatial['areas'],
+            'shares': spatial['shares'].tolist(),
+            'peak_load': matrix.max(axis=1).tolist() if matrix.size else [],
+            'avg_load': matrix.mean(axis=1).tolist() if matrix.size else []
+        }
+        if include_hourly:
+            result['timestamps'] = spatial['timestamps'].dt.strftime('%Y-%m-%dT%H:%M:%S').tolist()
+            result['matrix'] = matrix.tolist()
+
+        return jsonify({
+            'success': True,
+            'spatial': result
+        })
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@app.route('/api/load/scenarios', methods=['POST'])
+def load_scenarios():
+    """概率负荷场景：分位数带与峰值分布"""
+    try:
+        data = request.json or {}
+        horizon_days = _int_param(data.get('horizon_days', 365), 'horizon_days', 1)
+        n_scenarios = data.get('n_scenarios')
+        quantiles = data.get('quantiles')
+        max_points = _int_param(data.get('max_points', 500), 'max_points')
+
+        service = load_prediction.for_region(data.get('region'))
+        scenarios = service.generate_load_scenarios(horizon_days, n_scenarios)
+        summary = service.summarize_scenarios(scenarios, quantiles)
+
+        # 分位数带按中位数曲线做 LTTB 降采样，统一取相同下标
+        bands = summary['bands']
+        median = bands[len(bands) // 2]
+        idx = lttb_indices(median, max_points)
+        timestamps = scenarios['timestamps'].iloc[idx].dt.strftime('%Y-%m-%dT%H:%M:%S').tolist()
+
+        return jsonify({
+            'success': True,
+            'n_scenarios': int(scenarios['scenarios'].shape[0]),
+            'total_points': int(scenarios['scenarios'].shape[1]),
+            'bands': {
+                'timestamp': timestamps,
+                'deterministic': np.round(scenarios['deterministic'][idx], 3).tolist(),
+                **{f'q{q}': np.round(b[idx].astype(float), 3).tolist() for q, b in zip(summary['quantiles'], bands)}
+            },
+            'peak_distribution': summary['peak_distribution']
+        })
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({
             'success': False,
@@ -316,23 +571,27 @@ def clear_zones():
 def analyze_planning():
     """完整的规划分析流程"""
     try:
-        # 1. 获取负载摘要
-        load_summary = load_prediction.get_load_summary()
-        load_features = load_summary['current_features']
-        overload_areas = load_summary['overload_areas']
+        # 3+4. 搜索相关约束文档并批量解析（一次LLM请求覆盖多份文档；与负载摘要、拓扑分析互不依赖，并行执行）
+        def parse_constraint_docs():
+            constraint_docs = retrieval_service.search_documents("电网规划标准约束", top_k=3)
+            parsed = llm_service.parse_constraints_batch([doc['content'] for doc in constraint_docs])
+            return {doc['filename']: c for doc, c in zip(constraint_docs, parsed)}
 
-        # 2. 获取GIS数据和拓扑
-        network = gis_service.get_network_summary()
-        topology = network['topology']
+        with ThreadPoolExecutor(max_workers=3, thread_name_prefix='analyze') as pool:
+            constraints_future = pool.submit(parse_constraint_docs)
+            load_future = pool.submit(load_prediction.get_load_summary)
+            network_future = pool.submit(gis_service.get_network_summary)
 
-        # 3. 搜索相关约束文档
-        constraint_docs = retrieval_service.search("电网规划标准约束", top_k=3)
+            # 1. 获取负载摘要
+            load_summary = load_future.result()
+            load_features = load_summary['current_features']
+            overload_areas = load_summary['overload_areas']
 
-        # 4. 使用LLM解析约束
-        all_constraints = {}
-        for doc in constraint_docs:
-            constraints = llm_service.parse_constraints(doc['content'])
-            all_constraints[doc['filename']] = constraints
+            # 2. 获取GIS数据和拓扑
+            network = network_future.result()
+            topology = network['topology']
+
+            all_constraints = constraints_future.result()
 
         # 5. 生成候选方案
         candidates = gis_service.get_expansion_candidates(overload_areas)
@@ -482,6 +741,45 @@ def run_powerflow():
         }), 500
 
 
+@app.route('/api/powerflow/probabilistic', methods=['POST'])
+def run_probabilistic_screening():
+    """按负荷场景峰值分布做概率潮流筛查，候选方案按过载概率排序"""
+    try:
+        data = request.json or {}
+        horizon_days = int(data.get('horizon_days', 365))
+        candidates = data.get('candidates')
+        if not candidates:
+            load_summary = load_prediction.get_load_summary()
+            candidates = gis_service.get_expansion_candidates(load_summary['overload_areas'])
+
+        scenarios = load_prediction.generate_load_scenarios(horizon_days, data.get('n_scenarios'))
+        summary = load_prediction.summarize_scenarios(scenarios)
+        mapping = load_prediction.network_load_factors(summary['peaks'])
+
+        results = power_flow.screen_candidates_probabilistic(
+            candidates,
+            mapping['factors'],
+            data.get('n_levels')
+        )
+
+        return jsonify({
+            'success': True,
+            'peak_distribution': summary['peak_distribution'],
+            'load_mapping': {
+                'reference': mapping['reference'],
+                'reference_mw': mapping['reference_mw'],
+                'min_factor': float(mapping['factors'].min()),
+                'max_factor': float(mapping['factors'].max())
+            },
+            'results': results
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
 @app.route('/api/powerflow/n-minus-1', methods=['POST'])
 def run_n_minus_1():
     """运行N-1校验"""
@@ -520,6 +818,37 @@ def llm_chat():
         }), 500
 
 
+@app.route('/api/llm/chat/stream', methods=['POST'])
+def llm_chat_stream():
+    """LLM流式聊天接口（SSE）：delta 事件推送增量文本，done 事件附完整回复"""
+    data = request.json or {}
+    messages = data.get('messages', [])
+
+    def events():
+        parts = []
+        try:
+            for delta in llm_service.chat_completion_stream(messages):
+                parts.append(delta)
+                yield _sse('delta', {'delta': delta})
+            yield _sse('done', {'success': True, 'response': "".join(parts)})
+        except Exception as e:
+            yield _sse('error', {'success': False, 'error': str(e)})
+
+    return _sse_response(events())
+
+
+@app.route('/api/llm/metrics', methods=['GET'])
+def llm_metrics():
+    """LLM 调用指标：调用数、重试、token 用量、延迟分位数、最近调用明细与响应缓存命中率"""
+    try:
+        metrics = llm_service.metrics.snapshot()
+        if llm_service.cache is not None:
+            metrics['cache'] = llm_service.cache.stats()
+        return jsonify({'success': True, 'metrics': metrics})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
 if __name__ == '__main__':
     print("=" * 60)
     print("Grid Planning System - Starting")
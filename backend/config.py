@@ -11,18 +11,75 @@ class Config:
 
     # LLM配置 - 阿里Qwen（从环境变量读取，避免泄露）
     QWEN_API_KEY = os.getenv("QWEN_API_KEY", "")
-    QWEN_API_BASE = "https://dashscope.aliyuncs.com/compatible-mode/v1"
     QWEN_MODEL = "qwen-plus"  # 可选: qwen-turbo, qwen-plus, qwen-max
 
+    # 本地模拟 LLM 服务（python -m services.mock_llm），用于离线压测/CI；LLM_MOCK=1 时 QWEN_API_BASE 指向它
+    LLM_MOCK = os.getenv("LLM_MOCK", "0") == "1"
+    LLM_MOCK_HOST = "127.0.0.1"
+    LLM_MOCK_PORT = int(os.getenv("LLM_MOCK_PORT", "8090"))
+    LLM_MOCK_LATENCY_MS = 200.0  # 每次请求的平均附加延迟（毫秒）
+    LLM_MOCK_ERROR_RATE = 0.0  # 随机返回 429/500/503 的概率
+    QWEN_API_BASE = (
+        f"http://{LLM_MOCK_HOST}:{LLM_MOCK_PORT}/v1" if LLM_MOCK
+        else os.getenv("QWEN_API_BASE", "https://dashscope.aliyuncs.com/compatible-mode/v1")
+    )
+
+    # LLM HTTP 客户端配置
+    LLM_CONNECT_TIMEOUT = 5.0  # 建立连接超时（秒）
+    LLM_READ_TIMEOUT = 60.0  # 读取响应超时（秒）
+    LLM_MAX_RETRIES = 3  # 429/5xx/连接错误的最大重试次数
+    LLM_BACKOFF_BASE = 0.5  # 指数退避基数（秒），实际等待在 [0, base*2^n] 内随机
+    LLM_BACKOFF_MAX = 8.0  # 单次退避等待上限（秒）
+    LLM_MAX_CONCURRENCY = 4  # 同时在途的 LLM 请求数（亦为连接池大小）
+    LLM_METRICS_WINDOW = 200  # 保留明细的最近调用数
+
     # 数据路径
     DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
     DOCUMENTS_DIR = os.path.join(DATA_DIR, 'documents')
     GIS_DIR = os.path.join(DATA_DIR, 'gis')
     LOAD_DATA_DIR = os.path.join(DATA_DIR, 'load_data')
+    EXTRACT_CACHE_DIR = os.path.join(DATA_DIR, 'extract_cache')  # 按文件SHA-256缓存的逐页抽取文本
+    RAG_CACHE_DIR = os.path.join(DATA_DIR, 'rag_cache')  # 按文本SHA-256缓存的单文档chunk词频矩阵
+    LLM_MOCK_FIXTURES_DIR = os.path.join(DATA_DIR, 'llm_fixtures')  # 模拟 LLM 服务录制/回放的响应夹具
+
+    # 文档抽取配置
+    PDF_EXTRACT_WORKERS = min(4, os.cpu_count() or 1)  # PDF 并行抽取进程数
+    PDF_PAGES_PER_TASK = 16  # 每个抽取任务的页数（页数不足两段时单进程抽取）
+    RAG_CACHE_MEMORY_DOCS = 32  # 内存中保留的文档chunk矩阵数（LRU）
+    INGEST_JOBS_DB = os.path.join(DATA_DIR, 'ingest_jobs.sqlite3')  # 文档摄取任务状态
+    INGEST_WORKERS = 2  # 并发执行的摄取任务数
+
+    # LLM 响应缓存配置
+    LLM_CACHE_ENABLED = True
+    LLM_CACHE_DB = os.path.join(DATA_DIR, 'llm_cache.sqlite3')
+    LLM_CACHE_TTL_SECONDS = 7 * 24 * 3600  # 缓存条目有效期
+    LLM_CACHE_MAX_ENTRIES = 5000  # 超出后按最近访问时间淘汰
+
+    # 约束解析：确定性规则抽取先行，仅未解析的条款交给 LLM
+    RULE_EXTRACTOR_ENABLED = True
+    RULE_EXTRACTOR_LLM_FALLBACK = True  # 存在未解析条款时是否调用 LLM 补充
+
+    # 提示词 token 预算（本地近似分词计数）
+    PROMPT_DOC_TOKEN_BUDGET = 2000  # 约束解析时装填的文档片段上限
+    PROMPT_SUMMARY_TOKEN_BUDGET = 400  # 方案评估/规划建议中每段 JSON 摘要的上限
+    LLM_BATCH_MAX_DOCS = 4  # 批量约束解析时单次请求合并的文档数上限
+    LLM_BATCH_TOKEN_BUDGET = 6000  # 批量约束解析时单次请求的文档片段 token 上限
 
     # 向量数据库配置
-    VECTOR_DB_PATH = os.path.join(DATA_DIR, 'vector_db')
+    VECTOR_DB_PATH = os.path.join(DATA_DIR, 'vector_store')
     EMBEDDING_MODEL = "text-embedding-v1"
+    EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "hashing")  # api（EMBEDDING_MODEL）/ hashing（本地哈希桩）
+    EMBEDDING_DIM = 256  # 本地哈希桩的向量维度
+    EMBEDDING_BATCH_SIZE = 25  # 每次嵌入请求的文本数
+    EMBEDDING_CACHE_SIZE = 50000  # 按chunk内容哈希缓存的嵌入向量数
+    DENSE_NPROBE = 8  # IVF 检索时扫描的簇数
+    DENSE_IVF_MIN_CHUNKS = 1000  # chunk数低于该值时稠密检索直接精确计算
+    RETRIEVAL_MODE = "hybrid"  # sparse（BM25）/ dense（向量）/ hybrid（加权融合）
+    HYBRID_DENSE_WEIGHT = 0.5  # 混合检索中稠密分的权重
+    HYBRID_CANDIDATES = 4  # 混合检索每路召回 top_k × 该倍数的候选
+    INDEX_COMPACT_DELETED_RATIO = 0.2  # 已删除chunk占比超过该值时后台压缩索引
+    INDEX_COMPACT_DELTA_CHUNKS = 2000  # 增量段chunk数超过该值时后台合并
+    INDEX_SAVE_DELAY_SECONDS = 2.0  # 增删文档后延迟保存，期间的多次变更合并为一次写盘
 
     # 评分器配置
     SCORER_WEIGHTS = {
@@ -31,6 +88,22 @@ class Config:
         'topology': 0.2,         # 拓扑权重
         'constraint': 0.3        # 约束满足权重
     }
+    SCORER_FEATURE_CACHE_COLUMNS = 64  # 特征列缓存上限（按 特征×候选集×依赖版本 计，LRU）
+
+    # 负载预测配置
+    LOAD_REGIONS = {  # 地区 -> 名称，数据文件为 load_data/realistic_<地区>_load.csv
+        'guangdong': '广东省',
+        'beijing': '北京市',
+        'shanghai': '上海市',
+    }
+    DEFAULT_LOAD_REGION = 'guangdong'
+    LOAD_MAX_LOADED_REGIONS = 3  # 同时驻留内存的地区数上限（超出按最近最少使用释放）
+    LOAD_REGION_IDLE_SECONDS = 1800  # 地区空闲超过该时长后释放其历史数据
+    LOAD_TIMEZONE = 'Asia/Shanghai'  # 负载数据时间戳为该时区的本地时间（无时区）；带时区的量测换算到此时区
+    SPATIAL_FORECAST_LEVEL = 'bus'  # 空间负荷分解粒度: bus（按母线负荷占比）/ zone（按区域网格聚合）
+    LOAD_SCENARIO_COUNT = 1000  # 概率场景数（残差自助法）
+    LOAD_SCENARIO_SEED = 42  # 固定种子，保证场景可复现
+    SCENARIO_SCREENING_LEVELS = 8  # 概率潮流筛查时将峰值分布离散为的负荷水平数
 
     # 潮流计算配置
     VOLTAGE_LEVELS = [10, 35, 110, 220, 500]  # kV
@@ -50,6 +123,7 @@ class Config:
     # 机器学习评分配置
     ENABLE_ML_SCORING = True
     ML_MODEL_PATH = os.path.join(os.path.dirname(__file__), 'data', 'ml', 'gbdt_ieee14.joblib')
+    ML_TREES_PATH = os.path.join(os.path.dirname(__file__), 'data', 'ml', 'gbdt_ieee14.npz')  # 展平的树数组，优先于 joblib 加载（无需 sklearn）
     ML_SCORE_WEIGHT = 0.3  # ML分数在总分中的权重 (0~1)
 
     # Flask配置
@@ -14,9 +14,17 @@ import numpy as np
 from typing import List, Dict, Tuple
 from services.gis_service import gis_service
 from services.load_prediction import load_prediction
-from services.scorer import scorer
+from services.scorer import scorer, CandidateTable
 from config import Config
 
+# 单特征消融：结果名 -> 注册表中的特征名
+SINGLE_FEATURES = {
+    'load_only': 'load_growth',
+    'distance_only': 'distance',
+    'topology_only': 'topology',
+    'constraint_only': 'constraint',
+}
+
 
 class AblationStudy:
     """消融实验类"""
@@ -80,134 +88,36 @@ class AblationStudy:
         self.results['full_model'] = result
         return result
 
-    def run_load_only_scoring(
+    def run_single_feature_scoring(
         self,
+        model_name: str,
         candidates: List[Dict],
-        load_features: Dict
-    ) -> Dict:
-        """
-        仅使用负载特征评分
-        """
-        print("\n" + "=" * 60)
-        print("消融实验：仅负载特征")
-        print("=" * 60)
-
-        start_time = time.time()
-
-        scores = []
-        for candidate in candidates:
-            # 仅计算负载相关得分
-            load_score = self._calculate_load_score(candidate, load_features)
-            scores.append({
-                'candidate': candidate,
-                'scores': {'load_growth': load_score, 'total': load_score},
-                'rank': 0
-            })
-
-        # 排序
-        scores.sort(key=lambda x: x['scores']['total'], reverse=True)
-        for i, item in enumerate(scores, 1):
-            item['rank'] = i
-
-        elapsed_time = time.time() - start_time
-
-        total_scores = [s['scores']['total'] for s in scores]
-
-        result = {
-            'ranked_candidates': scores,
-            'total_scores': total_scores,
-            'top_5_scores': total_scores[:5],
-            'avg_score': np.mean(total_scores),
-            'std_score': np.std(total_scores),
-            'time': elapsed_time
-        }
-
-        print(f"✓ 评分完成")
-        print(f"  - 平均得分: {result['avg_score']:.2f}")
-        print(f"  - 得分标准差: {result['std_score']:.2f}")
-        print(f"  - Top-1得分: {total_scores[0]:.2f}")
-
-        self.results['load_only'] = result
-        return result
-
-    def run_distance_only_scoring(
-        self,
-        candidates: List[Dict],
-        network: Dict
-    ) -> Dict:
-        """
-        仅使用距离特征评分
-        """
-        print("\n" + "=" * 60)
-        print("消融实验：仅距离特征")
-        print("=" * 60)
-
-        start_time = time.time()
-
-        scores = []
-        for candidate in candidates:
-            # 仅计算距离相关得分
-            distance_score = self._calculate_distance_score(candidate, network)
-            scores.append({
-                'candidate': candidate,
-                'scores': {'distance': distance_score, 'total': distance_score},
-                'rank': 0
-            })
-
-        # 排序
-        scores.sort(key=lambda x: x['scores']['total'], reverse=True)
-        for i, item in enumerate(scores, 1):
-            item['rank'] = i
-
-        elapsed_time = time.time() - start_time
-
-        total_scores = [s['scores']['total'] for s in scores]
-
-        result = {
-            'ranked_candidates': scores,
-            'total_scores': total_scores,
-            'top_5_scores': total_scores[:5],
-            'avg_score': np.mean(total_scores),
-            'std_score': np.std(total_scores),
-            'time': elapsed_time
-        }
-
-        print(f"✓ 评分完成")
-        print(f"  - 平均得分: {result['avg_score']:.2f}")
-        print(f"  - 得分标准差: {result['std_score']:.2f}")
-        print(f"  - Top-1得分: {total_scores[0]:.2f}")
-
-        self.results['distance_only'] = result
-        return result
-
-    def run_topology_only_scoring(
-        self,
-        candidates: List[Dict],
-        topology: Dict
+        load_features: Dict,
+        network: Dict,
+        topology: Dict,
+        constraints: Dict
     ) -> Dict:
         """
-        仅使用拓扑特征评分
+        仅使用单一特征评分（复用评分器特征注册表缓存的特征列，总分即该特征列）
         """
+        feature = SINGLE_FEATURES[model_name]
         print("\n" + "=" * 60)
-        print("消融实验：仅拓扑特征")
+        print(f"消融实验：仅 {feature} 特征")
         print("=" * 60)
 
         start_time = time.time()
 
-        scores = []
-        for candidate in candidates:
-            # 仅计算拓扑相关得分
-            topology_score = self._calculate_topology_score(candidate, topology)
-            scores.append({
-                'candidate': candidate,
-                'scores': {'topology': topology_score, 'total': topology_score},
-                'rank': 0
-            })
-
-        # 排序
-        scores.sort(key=lambda x: x['scores']['total'], reverse=True)
-        for i, item in enumerate(scores, 1):
-            item['rank'] = i
+        table = CandidateTable(candidates)
+        column = scorer.feature_columns(table, load_features, network, topology, constraints, names=[feature])[feature]
+        order = np.argsort(-column, kind='stable')
+        scores = [
+            {
+                'candidate': candidates[i],
+                'scores': {feature: float(column[i]), 'total': float(column[i])},
+                'rank': rank
+            }
+            for rank, i in enumerate(order.tolist(), 1)
+        ]
 
         elapsed_time = time.time() - start_time
 
@@ -227,33 +137,9 @@ class AblationStudy:
         print(f"  - 得分标准差: {result['std_score']:.2f}")
         print(f"  - Top-1得分: {total_scores[0]:.2f}")
 
-        self.results['topology_only'] = result
+        self.results[model_name] = result
         return result
 
-    def _calculate_load_score(self, candidate: Dict, load_features: Dict) -> float:
-        """计算负载得分"""
-        area_name = candidate.get('area_name', '')
-        base_score = 50.0
-
-        # 根据区域负载增长率调整得分
-        growth_rate = load_features.get('growth_rate', 0.05)
-        base_score += growth_rate * 200  # growth_rate typically 0-0.2
-
-        return min(100, base_score)
-
-    def _calculate_distance_score(self, candidate: Dict, network: Dict) -> float:
-        """计算距离得分"""
-        # 简化：随机模拟距离得分
-        return np.random.uniform(40, 90)
-
-    def _calculate_topology_score(self, candidate: Dict, topology: Dict) -> float:
-        """计算拓扑得分"""
-        # 简化：基于拓扑指标计算得分
-        avg_degree = topology.get('avg_degree', 2.0)
-        base_score = 50.0
-        base_score += (avg_degree - 2) * 10
-        return min(100, base_score)
-
     def compare_models(self) -> Dict:
         """
         对比不同模型的性能
@@ -269,8 +155,8 @@ class AblationStudy:
 
         comparison = {}
 
-        for model_name in ['load_only', 'distance_only', 'topology_only']:
-            if model_name not in self.results:
+        for model_name in SINGLE_FEATURES:
+            if not self.results.get(model_name):
                 continue
 
             model_result = self.results[model_name]
@@ -358,9 +244,8 @@ def run_ablation_study():
 
     # 运行各种评分实验
     ablation.run_full_model_scoring(candidates, load_features, network, topology, constraints)
-    ablation.run_load_only_scoring(candidates, load_features)
-    ablation.run_distance_only_scoring(candidates, network)
-    ablation.run_topology_only_scoring(candidates, topology)
+    for model_name in SINGLE_FEATURES:
+        ablation.run_single_feature_scoring(model_name, candidates, load_features, network, topology, constraints)
 
     # 对比模型性能
     comparison = ablation.compare_models()
@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+"""
+Benchmark the IVF dense index against exact (brute-force) inner-product search.
+
+Usage (from backend/):
+  python -m experiments.bench_dense_recall --n 50000 --dim 256 --queries 200 --outdir experiments/results
+Outputs:
+  - dense_recall.json  (recall@k and mean query latency per nprobe)
+"""
+
+import os
+import json
+import time
+import argparse
+from typing import Dict, List
+
+import numpy as np
+
+from services.dense_index import IVFIndex
+
+
+def synthetic_vectors(n: int, dim: int, n_clusters: int, seed: int) -> np.ndarray:
+    """Clustered unit vectors (mimics topical structure of chunk embeddings)."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(n_clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, n_clusters, size=n)
+    x = centers[labels] + 1.5 * rng.normal(size=(n, dim)).astype(np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def recall_at_k(index: IVFIndex, queries: np.ndarray, k: int, nprobe: int) -> Dict[str, float]:
+    hits = 0
+    t_ann = t_exact = 0.0
+    for q in queries:
+        t0 = time.perf_counter()
+        exact, _ = index.search(q, k, exact=True)
+        t1 = time.perf_counter()
+        approx, _ = index.search(q, k, nprobe=nprobe)
+        t2 = time.perf_counter()
+        t_exact += t1 - t0
+        t_ann += t2 - t1
+        hits += len(np.intersect1d(exact, approx))
+    n = len(queries)
+    return {
+        'nprobe': nprobe,
+        f'recall@{k}': hits / (n * k),
+        'ann_ms': 1000 * t_ann / n,
+        'exact_ms': 1000 * t_exact / n,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--n', type=int, default=50000)
+    ap.add_argument('--dim', type=int, default=256)
+    ap.add_argument('--clusters', type=int, default=200)
+    ap.add_argument('--queries', type=int, default=200)
+    ap.add_argument('--k', type=int, nargs='+', default=[1, 5, 10])
+    ap.add_argument('--nprobe', type=int, nargs='+', default=[1, 4, 8, 16, 32])
+    ap.add_argument('--seed', type=int, default=42)
+    ap.add_argument('--outdir', default='experiments/results')
+    args = ap.parse_args()
+
+    vectors = synthetic_vectors(args.n + args.queries, args.dim, args.clusters, args.seed)
+    base, queries = vectors[:args.n], vectors[args.n:]
+
+    t0 = time.perf_counter()
+    index = IVFIndex(args.dim, min_train=1).build(base)
+    build_s = time.perf_counter() - t0
+    print(f"IVF build: n={args.n} nlist={len(index.centroids)} in {build_s:.2f}s")
+
+    rows: List[Dict[str, float]] = []
+    for k in args.k:
+        for nprobe in args.nprobe:
+            row = {'k': k, **recall_at_k(index, queries, k, nprobe)}
+            rows.append(row)
+            print(f"k={k:<3d} nprobe={nprobe:<3d} recall={row[f'recall@{k}']:.3f} "
+                  f"ann={row['ann_ms']:.2f}ms exact={row['exact_ms']:.2f}ms")
+
+    os.makedirs(args.outdir, exist_ok=True)
+    out = os.path.join(args.outdir, 'dense_recall.json')
+    with open(out, 'w', encoding='utf-8') as f:
+        json.dump({'n': args.n, 'dim': args.dim, 'nlist': int(len(index.centroids)),
+                   'build_s': build_s, 'results': rows}, f, indent=2)
+    print(f"Saved {out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -2,6 +2,8 @@ from __future__ import annotations
 
 """
 Scorer ablation: zero-out specific features and compare NDCG/Hit.
+Feature columns are computed once (cached by the scoring feature store); every
+weight variant is then one row of a single weight-matrix product.
 
 Usage:
   python -m experiments.quick_eval_ablation --candidates experiments/results/candidates.json \
@@ -14,23 +16,28 @@ import json
 import os
 from typing import Any, Dict, List, Tuple
 import matplotlib.pyplot as plt
+import numpy as np
 
-from services.scorer import scorer
+from services.scorer import scorer, CandidateTable
 from services.load_prediction import load_prediction
 from services.gis_service import gis_service
 from experiments.quick_eval_bruteforce import compute_ground_truth, ndcg_at_k
 
 
-def rank_with_weights(cands: List[Dict[str, Any]], weights: Dict[str, float]) -> List[int]:
+def weighted_totals(cands: List[Dict[str, Any]], weight_sets: List[Dict[str, float]]) -> np.ndarray:
+    """Total scores of every candidate under each weight set, shape (len(weight_sets), len(cands))."""
     summary = load_prediction.get_load_summary()
     network = gis_service.get_network_summary()
-    # backup and set
-    old = dict(scorer.weights)
-    scorer.weights.update(weights)
-    ranked = scorer.rank_candidates(cands, summary['current_features'], network, network['topology'], constraints={}, top_k=len(cands))
-    scorer.weights = old
-    indices = [cands.index(r['candidate']) for r in ranked]
-    return indices
+    table = CandidateTable(cands)
+    names = list(dict.fromkeys([*scorer.feature_names(), *(k for w in weight_sets for k in w)]))
+    columns = scorer.feature_columns(table, summary['current_features'], network, network['topology'],
+                                     constraints={}, names=names)
+    return scorer.sweep(columns, weight_sets)
+
+
+def rank_with_weights(cands: List[Dict[str, Any]], weights: Dict[str, float]) -> List[int]:
+    total = weighted_totals(cands, [weights])[0]
+    return scorer.top_k_order(total, len(cands)).tolist()
 
 
 def main():
@@ -47,26 +54,24 @@ def main():
     # Ground truth baseline (sampled PF from earlier function)
     gt_sorted = compute_ground_truth(cands, sample=min(60, len(cands)))
 
-    # Baseline weights
-    base_indices = rank_with_weights(cands, scorer.weights)
-    base_ndcg = ndcg_at_k(gt_sorted, base_indices, args.topk)
-
-    # Ablations: set a weight to zero (and renormalize inside function)
+    # Baseline weights + ablations (set a weight to zero and renormalize), scored in one matrix op
     variants = {
         'No LoadGrowth': {'load_growth': 0.0},
         'No Distance': {'distance': 0.0},
         'No Topology': {'topology': 0.0},
         'No Constraint': {'constraint': 0.0},
+        '+LineRelief': {'line_relief': 0.1},
     }
-    scores = []
-    for name, patch in variants.items():
+    weight_sets = [dict(scorer.weights)]
+    for patch in variants.values():
         w = dict(scorer.weights)
         w.update(patch)
         s = sum(w.values()) or 1.0
-        w = {k: v/s for k, v in w.items()}
-        idx = rank_with_weights(cands, w)
-        nd = ndcg_at_k(gt_sorted, idx, args.topk)
-        scores.append((name, nd))
+        weight_sets.append({k: v/s for k, v in w.items()})
+    totals = weighted_totals(cands, weight_sets)
+    ndcgs = [ndcg_at_k(gt_sorted, scorer.top_k_order(t, len(cands)).tolist(), args.topk) for t in totals]
+    base_ndcg = ndcgs[0]
+    scores = list(zip(variants, ndcgs[1:]))
 
     plt.figure(figsize=(6,4))
     names = [n for n,_ in scores]
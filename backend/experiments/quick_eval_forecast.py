@@ -67,7 +67,7 @@ def main():
     os.makedirs(args.outdir, exist_ok=True)
 
     # Load full historical df
-    df = load_prediction.load_historical_data()
+    df = load_prediction.for_region(args.region).load_historical_data()
     train, test = split_train_test(df, test_days=args.test_days)
     pred = predict_from_df(train, horizon_hours=len(test))
 
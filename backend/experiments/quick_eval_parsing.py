@@ -3,6 +3,7 @@ from __future__ import annotations
 """
 Evaluate rule extraction accuracy with tiny ground truth.
 If QWEN_API_KEY is not available, fall back to regex parser to produce a prediction.
+With LLM_MOCK=1 the LLM path runs against the local mock server (python -m services.mock_llm).
 
 Outputs: fig3_llm_parsing_accuracy.png (per-field accuracy bars)
 
@@ -17,6 +18,7 @@ import argparse
 from typing import Dict, Any, List
 import matplotlib.pyplot as plt
 
+from config import Config
 from services.retrieval_service import retrieval_service
 from services.llm_service import llm_service
 
@@ -103,7 +105,7 @@ def main():
     os.makedirs(args.outdir, exist_ok=True)
 
     docs = load_docs()
-    has_key = bool(os.getenv('QWEN_API_KEY'))
+    has_key = bool(os.getenv('QWEN_API_KEY')) or Config.LLM_MOCK
     rows = []
     for d in docs:
         text = d['content']
@@ -1,35 +1,53 @@
 """
 Runtime ML scorer integration.
-- Loads a joblib model saved by ml/train_baseline.py
+- Loads the flattened trees (.npz) saved by ml/train_baseline.py and evaluates them with
+  ml.tree_ensemble (NumPy only); falls back to the joblib model, importing sklearn lazily
 - Computes features from candidate + current network/topology/powerflow baseline
+- Baseline power-flow metrics are warmed up in the background and keyed by
+  (network version, settings version); a change triggers an asynchronous recompute
+- Scores whole candidate batches with one feature matrix and a single predict call
 """
 from __future__ import annotations
 
 import os
-import math
-from typing import Dict, Any, List
+import threading
+import weakref
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Any, List, Sequence, Tuple
 
-try:
-    import joblib
-except Exception:  # pragma: no cover
-    try:
-        from sklearn.externals import joblib  # type: ignore
-    except Exception:  # pragma: no cover
-        joblib = None  # type: ignore
+import numpy as np
 
 try:
     from ..config import Config  # when imported as package
 except Exception:  # pragma: no cover
     from config import Config    # when imported as module from backend cwd
 
+try:
+    from .tree_ensemble import TreeEnsemble
+except Exception:  # pragma: no cover
+    from ml.tree_ensemble import TreeEnsemble
+
 
 class MLScorer:
-    def __init__(self, model_path: str | None = None):
+    def __init__(self, model_path: str | None = None, trees_path: str | None = None):
         self.model_path = model_path or Config.ML_MODEL_PATH
+        # Flattened trees live next to the joblib model (see ml/train_baseline.py)
+        if trees_path is None:
+            trees_path = Config.ML_TREES_PATH if model_path is None else os.path.splitext(model_path)[0] + '.npz'
+        self.trees_path = trees_path
         self._model = None
         self._features: List[str] | None = None
         self._base_metrics: Dict[str, float] | None = None
+        self._base_key: Tuple[int, int] | None = None
+        self._base_future: Future | None = None
+        self._base_lock = threading.Lock()
+        self._executor: ThreadPoolExecutor | None = None
         self._load()
+        if self.available():
+            # Weak reference: the settings listener must not keep this scorer and its executor alive
+            _settings().on_change(_weak_callback(self.warm_up))
+            # Warm up on construction so `flask run` and WSGI servers get it too, not only app.py
+            self.warm_up()
 
     def available(self) -> bool:
         return self._model is not None and self._features is not None
@@ -37,11 +55,20 @@ class MLScorer:
     def _load(self):
         if not Config.ENABLE_ML_SCORING:
             return
-        if joblib is None:
-            return
+        # Preferred: flat tree arrays, no sklearn import at serve time
+        if self.trees_path and os.path.exists(self.trees_path):
+            try:
+                trees = TreeEnsemble.load(self.trees_path)
+                self._model = trees
+                self._features = trees.features
+                return
+            except Exception:
+                self._model = None
+                self._features = None
         if not os.path.exists(self.model_path):
             return
         try:
+            import joblib
             data = joblib.load(self.model_path)
             self._model = data.get('model')
             self._features = data.get('features')
@@ -49,15 +76,51 @@ class MLScorer:
             self._model = None
             self._features = None
 
+    @staticmethod
+    def _baseline_key() -> Tuple[int, int]:
+        """(network version, settings version) the baseline metrics depend on."""
+        return (_power_flow().network_version, _settings().version)
+
+    def warm_up(self) -> Future | None:
+        """
+        Recompute baseline metrics in the background unless they are current or a recompute
+        is already running. Returns the pending future, or None when nothing needs doing.
+        """
+        if not self.available():
+            return None
+        key = self._baseline_key()
+        with self._base_lock:
+            if self._base_metrics is not None and self._base_key == key:
+                return None
+            if self._base_future is not None and not self._base_future.done():
+                return self._base_future
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ml-baseline')
+            self._base_future = self._executor.submit(self._refresh_base_metrics)
+            return self._base_future
+
+    def _refresh_base_metrics(self) -> Dict[str, float]:
+        # Key is read before computing: a change during the run leaves the result stale,
+        # so the next access schedules another refresh
+        key = self._baseline_key()
+        metrics = self._compute_base_metrics()
+        with self._base_lock:
+            self._base_metrics = metrics
+            self._base_key = key
+        return metrics
+
     def _get_base_metrics(self) -> Dict[str, float]:
-        if self._base_metrics is not None:
-            return self._base_metrics
-        # Lazy import to avoid circulars
-        try:
-            from ..services.power_flow import power_flow  # package import
-        except Exception:
-            from services.power_flow import power_flow      # module import from backend cwd
-        res = power_flow.run_power_flow()
+        pending = self.warm_up()
+        if self._base_metrics is None and pending is not None:
+            # Nothing computed yet: wait for the warm-up instead of running a second power flow
+            return pending.result()
+        # Otherwise serve the last metrics while a stale-key refresh runs in the background
+        return self._base_metrics  # type: ignore[return-value]
+
+    def _compute_base_metrics(self) -> Dict[str, float]:
+        power_flow = _power_flow()
+        # Run on a copy so the shared base network is not mutated from the background thread
+        res = power_flow._run_power_flow_on(power_flow._clone_network())
         violations = 0
         if res.get('violations'):
             violations = len(res['violations'])
@@ -66,12 +129,11 @@ class MLScorer:
         for line in res.get('lines', []) or []:
             max_loading = max(max_loading, float(line.get('loading_percent', 0.0)))
             total_losses += float(line.get('pl_mw', 0.0))
-        self._base_metrics = {
+        return {
             'base_violations': float(violations),
             'base_max_loading_percent': float(max_loading),
             'base_total_losses_mw': float(total_losses),
         }
-        return self._base_metrics
 
     @staticmethod
     def _degree_of(node_id: str, topology: Dict[str, Any]) -> int:
@@ -82,55 +144,152 @@ class MLScorer:
 
     @staticmethod
     def _nearest_bus_id_by_location(gis_data: Dict[str, Any], lat: float, lon: float) -> str | None:
-        subs = gis_data.get('substations') or []
-        best_id, best_d = None, 1e18
-        for s in subs:
-            loc = s.get('location')
-            if not loc:
-                continue
-            d = (float(loc['lat']) - lat) ** 2 + (float(loc['lon']) - lon) ** 2
-            if d < best_d:
-                best_d = d
-                best_id = s.get('id')
-        return best_id
+        return _BusLocator(gis_data).nearest([(lat, lon)])[0]
+
+    def _feature_matrix(
+        self,
+        candidates: Sequence[Dict[str, Any]],
+        gis_data: Dict[str, Any],
+        topology: Dict[str, Any],
+    ) -> np.ndarray:
+        """One row per candidate, columns in the order of self._features."""
+        n = len(candidates)
+        vn_kv = np.array([_as_float(c.get('voltage_level'), 110.0) for c in candidates], dtype=np.float64)
+        columns: Dict[str, np.ndarray] = {
+            'vn_kv': vn_kv,
+            'length_km': np.array(
+                [_as_float(c.get('length_km') or c.get('distance_to_existing'), 5.0) for c in candidates],
+                dtype=np.float64,
+            ),
+            'max_i_ka': np.where(vn_kv >= 100, 0.5, 0.35),
+        }
+
+        # Endpoint ids; candidates that only carry a to_location are resolved in one spatial query
+        from_ids = [c.get('from_substation_id') or c.get('substation_id') for c in candidates]
+        to_ids = [c.get('to_substation_id') or None for c in candidates]
+        # (a malformed to_location leaves that row unresolved, i.e. deg_to=0, without affecting others)
+        pending: List[int] = []
+        points: List[Tuple[float, float]] = []
+        for i, c in enumerate(candidates):
+            if to_ids[i] is None:
+                point = _location_point(c.get('to_location'))
+                if point is not None:
+                    pending.append(i)
+                    points.append(point)
+        if pending:
+            for i, bus_id in zip(pending, _BusLocator(gis_data).nearest(points)):
+                to_ids[i] = bus_id
+
+        degs = (topology or {}).get('node_degrees') or {}
+        columns['deg_from'] = np.array(
+            [float(int(degs.get(i, 0))) if isinstance(i, str) else 0.0 for i in from_ids], dtype=np.float64)
+        columns['deg_to'] = np.array(
+            [float(int(degs.get(i, 0))) if isinstance(i, str) else 0.0 for i in to_ids], dtype=np.float64)
 
-    def score(self, candidate: Dict[str, Any], gis_data: Dict[str, Any], topology: Dict[str, Any]) -> float | None:
-        if not self.available():
-            return None
-        feats = self._features or []
         base = self._get_base_metrics()
+        X = np.empty((n, len(self._features or [])), dtype=np.float64)
+        for j, name in enumerate(self._features or []):
+            X[:, j] = columns[name] if name in columns else float(base.get(name, 0.0))
+        return X
 
-        # Build feature dict with safe defaults
-        f: Dict[str, float] = {
-            'vn_kv': float(candidate.get('voltage_level') or 110),
-            'length_km': float(candidate.get('length_km') or candidate.get('distance_to_existing') or 5.0),
-            'max_i_ka': 0.5 if float(candidate.get('voltage_level') or 110) >= 100 else 0.35,
-            'deg_from': 0.0,
-            'deg_to': 0.0,
-            **base,
-        }
+    def score_batch(
+        self,
+        candidates: Sequence[Dict[str, Any]],
+        gis_data: Dict[str, Any],
+        topology: Dict[str, Any],
+    ) -> np.ndarray | None:
+        """
+        Score a batch of candidates: build one feature matrix, resolve nearest buses with a
+        KD-tree query, run a single predict call.
 
-        # Estimate degrees using topology node ids
-        from_id = candidate.get('from_substation_id') or candidate.get('substation_id')
-        to_id = None
-        if candidate.get('to_substation_id'):
-            to_id = candidate.get('to_substation_id')
-        elif candidate.get('to_location'):
-            loc = candidate['to_location']
-            to_id = self._nearest_bus_id_by_location(gis_data, float(loc['lat']), float(loc['lon']))
-
-        if isinstance(from_id, str):
-            f['deg_from'] = float(self._degree_of(from_id, topology))
-        if isinstance(to_id, str):
-            f['deg_to'] = float(self._degree_of(to_id, topology))
-
-        # Arrange vector
-        x = [float(f.get(name, 0.0)) for name in feats]
+        Returns an array of 0-100 scores aligned with `candidates`, or None when no model is
+        loaded or prediction fails.
+        """
+        if not self.available():
+            return None
+        if not candidates:
+            return np.zeros(0, dtype=np.float64)
+        X = self._feature_matrix(candidates, gis_data, topology)
         try:
-            pred = float(self._model.predict([x])[0])  # type: ignore[attr-defined]
+            pred = np.asarray(self._model.predict(X), dtype=np.float64)  # type: ignore[attr-defined]
         except Exception:
             return None
 
         # Map raw prediction to 0-100 via tanh squashing
-        ml_score = max(0.0, min(100.0, (math.tanh(pred) + 1.0) * 50.0))
-        return ml_score
+        return np.clip((np.tanh(pred) + 1.0) * 50.0, 0.0, 100.0)
+
+    def score(self, candidate: Dict[str, Any], gis_data: Dict[str, Any], topology: Dict[str, Any]) -> float | None:
+        scores = self.score_batch([candidate], gis_data, topology)
+        if scores is None:
+            return None
+        return float(scores[0])
+
+
+def _weak_callback(method):
+    """Listener that calls ``method`` while its instance is alive and is a no-op afterwards."""
+    ref = weakref.WeakMethod(method)
+
+    def callback(*_args):
+        bound = ref()
+        if bound is not None:
+            bound()
+    return callback
+
+
+def _power_flow():
+    # Lazy import to avoid circulars
+    try:
+        from ..services.power_flow import power_flow  # package import
+    except Exception:
+        from services.power_flow import power_flow      # module import from backend cwd
+    return power_flow
+
+
+def _settings():
+    try:
+        from ..services.settings_service import settings  # package import
+    except Exception:
+        from services.settings_service import settings      # module import from backend cwd
+    return settings
+
+
+def _as_float(value: Any, default: float) -> float:
+    """float(value or default); unparsable values fall back to the default."""
+    try:
+        return float(value or default)
+    except (TypeError, ValueError):
+        return default
+
+
+def _location_point(loc: Any) -> Tuple[float, float] | None:
+    """(lat, lon) from a location dict; None when missing, unparsable or non-finite."""
+    try:
+        point = (float(loc['lat']), float(loc['lon']))
+    except (TypeError, ValueError, KeyError):
+        return None
+    return point if np.isfinite(point).all() else None
+
+
+class _BusLocator:
+    """Nearest-substation lookup over (lat, lon) using a KD-tree (squared Euclidean, as before)."""
+
+    def __init__(self, gis_data: Dict[str, Any]):
+        ids: List[Any] = []
+        coords: List[Tuple[float, float]] = []
+        for s in (gis_data or {}).get('substations') or []:
+            point = _location_point(s.get('location'))
+            if point is None:
+                continue
+            ids.append(s.get('id'))
+            coords.append(point)
+        self.ids = ids
+        self._tree = None
+        if coords:
+            from scipy.spatial import cKDTree
+            self._tree = cKDTree(np.asarray(coords, dtype=np.float64))
+
+    def nearest(self, points: Sequence[Tuple[float, float]]) -> List[Any]:
+        if self._tree is None:
+            return [None] * len(points)
+        _, idx = self._tree.query(np.asarray(points, dtype=np.float64).reshape(-1, 2), k=1)
+        return [self.ids[int(i)] for i in np.atleast_1d(idx)]
@@ -1,6 +1,7 @@
 """
 Train a simple GradientBoostingRegressor on generated samples.
 Input CSV must contain feature columns and label 'y'.
+Writes the joblib model and, next to it, a .npz with the trees flattened for ml.tree_ensemble.
 """
 from __future__ import annotations
 
@@ -14,6 +15,8 @@ from sklearn.model_selection import train_test_split
 from sklearn.metrics import r2_score, mean_absolute_error
 from sklearn.ensemble import GradientBoostingRegressor
 
+from ml.tree_ensemble import TreeEnsemble, export_gbdt, save_npz
+
 
 FEATURES = [
     'vn_kv', 'length_km', 'max_i_ka',
@@ -46,7 +49,16 @@ def main():
     os.makedirs(os.path.dirname(args.model), exist_ok=True)
     joblib.dump({'model': model, 'features': FEATURES}, args.model)
 
-    print(json.dumps({'r2': r2, 'mae': mae, 'n_train': len(X_train), 'n_test': len(X_test)}, indent=2))
+    # Flat-array export for sklearn-free serving; check it reproduces sklearn's predictions
+    trees = export_gbdt(model, FEATURES)
+    max_abs_diff = float(np.abs(TreeEnsemble(trees).predict(X) - model.predict(X)).max())
+    if max_abs_diff > 1e-9:
+        raise RuntimeError(f'tree export mismatch: {max_abs_diff}')
+    trees_path = os.path.splitext(args.model)[0] + '.npz'
+    save_npz(trees_path, trees)
+
+    print(json.dumps({'r2': r2, 'mae': mae, 'n_train': len(X_train), 'n_test': len(X_test),
+                      'trees': trees_path, 'export_max_abs_diff': max_abs_diff}, indent=2))
 
 
 if __name__ == '__main__':
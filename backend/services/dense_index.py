@@ -0,0 +1,350 @@
+"""
+稠密向量检索 - 批量嵌入（远程嵌入模型 / 本地哈希桩）、按chunk内容哈希缓存、IVF 近似最近邻索引
+"""
+from __future__ import annotations
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import Config
+from services.sparse_index import normalize_text, top_k_indices
+
+
+def content_hash(text: str) -> bytes:
+    """chunk 内容哈希（嵌入缓存键）"""
+    return hashlib.sha1(text.encode('utf-8')).digest()
+
+
+def _l2_normalize(x: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    return (x / np.maximum(norms, 1e-12)).astype(np.float32)
+
+
+class HashingEmbedder:
+    """
+    本地桩嵌入：字符n-gram特征哈希到低维空间（等价于随机投影），无需模型与网络
+
+    语义能力有限，用于离线环境与测试；接口与远程嵌入模型一致。
+    """
+
+    def __init__(self, dim: int = 256):
+        from sklearn.feature_extraction.text import HashingVectorizer
+        self.dim = dim
+        self.name = f"hashing-char13-{dim}"
+        self._vectorizer = HashingVectorizer(
+            analyzer='char',
+            ngram_range=(1, 3),
+            preprocessor=normalize_text,
+            n_features=dim,
+            alternate_sign=True,
+            norm=None,
+            dtype=np.float32
+        )
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        x = self._vectorizer.transform(texts).toarray()
+        return _l2_normalize(np.sign(x) * np.log1p(np.abs(x)))
+
+
+class APIEmbedder:
+    """OpenAI 兼容的 /embeddings 接口（DashScope text-embedding-* 模型），按批请求，复用 LLM 连接池"""
+
+    def __init__(self, model: str, batch_size: int):
+        self.model = model
+        self.name = model
+        self.batch_size = batch_size
+        self.dim = None
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        from services.llm_client import llm_http_client
+        out = []
+        for start in range(0, len(texts), self.batch_size):
+            batch = texts[start:start + self.batch_size]
+            response, _ = llm_http_client.post_json(
+                f"{Config.QWEN_API_BASE}/embeddings",
+                {"model": self.model, "input": batch},
+                headers={
+                    "Authorization": f"Bearer {Config.QWEN_API_KEY}",
+                    "Content-Type": "application/json"
+                }
+            )
+            data = sorted(response.json()['data'], key=lambda d: d['index'])
+            out.append(np.asarray([d['embedding'] for d in data], dtype=np.float32))
+        vectors = _l2_normalize(np.vstack(out)) if out else np.zeros((0, self.dim or 0), dtype=np.float32)
+        self.dim = vectors.shape[1] if len(vectors) else self.dim
+        return vectors
+
+
+def get_embedder():
+    """按配置选择嵌入提供方；未配置 API Key 时退回本地哈希桩"""
+    if Config.EMBEDDING_PROVIDER == 'api':
+        if Config.QWEN_API_KEY:
+            return APIEmbedder(Config.EMBEDDING_MODEL, Config.EMBEDDING_BATCH_SIZE)
+        print("未配置 QWEN_API_KEY，嵌入模型退回本地哈希桩")
+    return HashingEmbedder(Config.EMBEDDING_DIM)
+
+
+class EmbeddingCache:
+    """
+    按内容哈希缓存嵌入向量（LRU），未命中的文本合并成批次调用嵌入模型
+
+    attach() 挂接已持久化的 (哈希, 向量) 数组，首次未命中时才建立查找表。
+    """
+
+    def __init__(self, embedder, max_size: int = 50000):
+        self.embedder = embedder
+        self.max_size = max_size
+        self._cache: OrderedDict = OrderedDict()
+        self._attached: Optional[Tuple[np.ndarray, np.ndarray]] = None
+        self._attached_map: Optional[Dict[bytes, int]] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def model(self) -> str:
+        return self.embedder.name
+
+    def attach(self, hashes: np.ndarray, vectors: np.ndarray):
+        with self._lock:
+            self._attached = (hashes, vectors)
+            self._attached_map = None
+
+    def _lookup(self, key: bytes) -> Optional[np.ndarray]:
+        vec = self._cache.get(key)
+        if vec is not None:
+            self._cache.move_to_end(key)
+            return vec
+        if self._attached is not None:
+            if self._attached_map is None:
+                hashes = self._attached[0]
+                self._attached_map = {bytes(h): i for i, h in enumerate(hashes)}
+            row = self._attached_map.get(key)
+            if row is not None:
+                return np.asarray(self._attached[1][row])
+        return None
+
+    def _put(self, key: bytes, vec: np.ndarray):
+        self._cache[key] = vec
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+
+    def embed(self, texts: List[str], hashes: Optional[List[bytes]] = None) -> np.ndarray:
+        """
+        批量获取嵌入（缓存优先）
+
+        Args:
+            texts: 文本列表
+            hashes: 预先算好的内容哈希（可选）
+
+        Returns:
+            (n, dim) float32，已 L2 归一化
+        """
+        if not texts:
+            return np.zeros((0, self.embedder.dim or 0), dtype=np.float32)
+        hashes = hashes if hashes is not None else [content_hash(t) for t in texts]
+        out: List[Optional[np.ndarray]] = [None] * len(texts)
+        with self._lock:
+            for i, key in enumerate(hashes):
+                out[i] = self._lookup(key)
+        missing = [i for i, v in enumerate(out) if v is None]
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            # 同一批次中重复的文本只嵌入一次
+            unique: Dict[bytes, int] = {}
+            for i in missing:
+                unique.setdefault(hashes[i], i)
+            vectors = self.embedder.embed([texts[i] for i in unique.values()])
+            with self._lock:
+                for key, vec in zip(unique, vectors):
+                    self._put(key, vec)
+            by_key = dict(zip(unique, vectors))
+            for i in missing:
+                out[i] = by_key[hashes[i]]
+        return np.vstack(out).astype(np.float32, copy=False)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            'model': self.model,
+            'cached': len(self._cache),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / total if total else 0.0
+        }
+
+
+class IVFIndex:
+    """
+    IVF 近似最近邻索引（内积 / 余弦）
+
+    - main: 已合并段向量，按 KMeans 粗聚类划分倒排表，查询只扫描最近的 nprobe 个簇
+    - delta: 增量段向量，查询时精确扫描
+    - alive: 墓碑标记，compact() 时物理移除
+    向量数少于 min_train 时不训练聚类，直接精确检索。
+    """
+
+    def __init__(self, dim: int, nprobe: int = 8, min_train: int = 1000):
+        self.dim = dim
+        self.nprobe = nprobe
+        self.min_train = min_train
+        self.main = np.zeros((0, dim), dtype=np.float32)
+        self.delta = np.zeros((0, dim), dtype=np.float32)
+        self.alive = np.zeros(0, dtype=bool)
+        self.centroids: Optional[np.ndarray] = None
+        self.list_ids = np.zeros(0, dtype=np.int64)
+        self.list_offsets = np.zeros(1, dtype=np.int64)
+        self.n_trained = 0
+
+    @property
+    def n_vectors(self) -> int:
+        return len(self.alive)
+
+    @property
+    def n_main(self) -> int:
+        return len(self.main)
+
+    def vectors(self, ids: np.ndarray) -> np.ndarray:
+        ids = np.asarray(ids, dtype=np.int64)
+        out = np.empty((len(ids), self.dim), dtype=np.float32)
+        in_main = ids < self.n_main
+        out[in_main] = self.main[ids[in_main]]
+        out[~in_main] = self.delta[ids[~in_main] - self.n_main]
+        return out
+
+    def add(self, vectors: np.ndarray) -> range:
+        start = self.n_vectors
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        self.delta = np.vstack([self.delta, vectors])
+        self.alive = np.concatenate([self.alive, np.ones(len(vectors), dtype=bool)])
+        return range(start, self.n_vectors)
+
+    def remove(self, ids) -> int:
+        ids = np.asarray(ids, dtype=np.int64)
+        ids = ids[(ids >= 0) & (ids < self.n_vectors)]
+        removed = int(self.alive[ids].sum())
+        self.alive[ids] = False
+        return removed
+
+    def _train(self, vectors: np.ndarray):
+        from sklearn.cluster import MiniBatchKMeans
+        nlist = max(int(np.sqrt(len(vectors))), 1)
+        km = MiniBatchKMeans(n_clusters=nlist, random_state=0, n_init=3, batch_size=4096)
+        km.fit(vectors)
+        self.centroids = _l2_normalize(km.cluster_centers_)
+        self.n_trained = len(vectors)
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        labels = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), 65536):
+            labels[start:start + 65536] = np.argmax(vectors[start:start + 65536] @ self.centroids.T, axis=1)
+        return labels
+
+    def compact(self, keep: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        合并增量段、移除墓碑向量并更新倒排表；规模翻倍后重新训练聚类中心
+
+        Args:
+            keep: 保留的向量下标（默认取 alive），需与稀疏索引的压缩结果一致
+
+        Returns:
+            保留的旧下标
+        """
+        keep = np.flatnonzero(self.alive) if keep is None else np.asarray(keep, dtype=np.int64)
+        merged = self.vectors(keep)
+        self.main = merged
+        self.delta = np.zeros((0, self.dim), dtype=np.float32)
+        self.alive = np.ones(len(merged), dtype=bool)
+
+        if len(merged) < self.min_train:
+            self.centroids = None
+        elif self.centroids is None or len(merged) > 2 * self.n_trained:
+            self._train(merged)
+        if self.centroids is None:
+            self.list_ids = np.zeros(0, dtype=np.int64)
+            self.list_offsets = np.zeros(1, dtype=np.int64)
+        else:
+            labels = self._assign(merged)
+            self.list_ids = np.argsort(labels, kind='stable')
+            self.list_offsets = np.searchsorted(labels[self.list_ids], np.arange(len(self.centroids) + 1))
+        return keep
+
+    def build(self, vectors: np.ndarray) -> 'IVFIndex':
+        self.__init__(self.dim, self.nprobe, self.min_train)
+        self.add(vectors)
+        self.compact()
+        return self
+
+    def _candidates(self, query: np.ndarray, nprobe: int) -> np.ndarray:
+        probe = top_k_indices(self.centroids @ query, nprobe)
+        return np.concatenate(
+            [self.list_ids[self.list_offsets[p]:self.list_offsets[p + 1]] for p in probe]
+            + [np.arange(self.n_main, self.n_vectors)]
+        )
+
+    def search(self, query: np.ndarray, top_k: int = 3, nprobe: Optional[int] = None,
+               exact: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        检索内积最大的向量
+
+        Args:
+            query: 已归一化的查询向量
+            top_k: 返回数量
+            nprobe: 扫描的簇数（默认 self.nprobe）
+            exact: 强制精确检索（用于评估召回率）
+
+        Returns:
+            (下标, 相似度)，按相似度降序，不含已删除向量
+        """
+        if self.n_vectors == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        query = np.asarray(query, dtype=np.float32).ravel()
+        if exact or self.centroids is None:
+            ids = np.arange(self.n_vectors)
+            scores = np.concatenate([self.main @ query, self.delta @ query])
+        else:
+            ids = self._candidates(query, nprobe or self.nprobe)
+            scores = self.vectors(ids) @ query
+        mask = self.alive[ids]
+        ids, scores = ids[mask], scores[mask]
+        order = top_k_indices(scores, top_k)
+        return ids[order], scores[order]
+
+    def similarity(self, query: np.ndarray, ids: np.ndarray) -> np.ndarray:
+        """指定向量与查询的相似度（混合检索时为稀疏候选补齐稠密分）"""
+        return self.vectors(ids) @ np.asarray(query, dtype=np.float32).ravel()
+
+    def params(self) -> Dict[str, Any]:
+        return {'dim': self.dim, 'nprobe': self.nprobe, 'min_train': self.min_train, 'n_trained': self.n_trained}
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        arrays = {
+            'dense_main': self.main,
+            'dense_delta': self.delta,
+            'dense_alive': self.alive,
+            'dense_list_ids': self.list_ids,
+            'dense_list_offsets': self.list_offsets,
+        }
+        if self.centroids is not None:
+            arrays['dense_centroids'] = self.centroids
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, params: Dict[str, Any], arrays: Dict[str, np.ndarray]) -> 'IVFIndex':
+        """由扁平数组还原；dense_main 可以是 mmap 数组，查询时只读入被探测的簇"""
+        index = cls(int(params['dim']), int(params['nprobe']), int(params['min_train']))
+        index.main = arrays['dense_main']
+        index.delta = np.array(arrays['dense_delta'], dtype=np.float32).reshape(-1, index.dim)
+        index.alive = np.array(arrays['dense_alive'], dtype=bool)
+        index.list_ids = arrays['dense_list_ids']
+        index.list_offsets = np.array(arrays['dense_list_offsets'])
+        centroids = arrays.get('dense_centroids')
+        index.centroids = np.array(centroids) if centroids is not None else None
+        index.n_trained = int(params.get('n_trained', 0))
+        return index
@@ -4,17 +4,37 @@
 """
 from __future__ import annotations
 
+import hashlib
+import json
+import multiprocessing
 import os
-from typing import Tuple, List
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Tuple, List
+
+import numpy as np
+
+from config import Config
+from services.sparse_index import make_vectorizer
 
 def _normalize_space(s: str) -> str:
     return "\n".join(line.strip() for line in s.splitlines() if line.strip())
 
-def split_into_chunks(text: str, chunk_chars: int = 800, overlap: int = 120) -> List[str]:
-    """将长文本按字符数切块，尽量在段落边界切分。"""
-    t = _normalize_space(text)
-    paras = t.split("\n")
-    chunks: List[str] = []
+def iter_paragraphs(pages: Iterable[str]) -> Iterator[str]:
+    """逐页文本 → 去空白的非空行（与 _normalize_space 后按行切分一致）"""
+    for page in pages:
+        for line in page.splitlines():
+            line = line.strip()
+            if line:
+                yield line
+
+
+def iter_chunks(paras: Iterable[str], chunk_chars: int = 800, overlap: int = 120) -> Iterator[str]:
+    """流式切块：段落逐个输入，块满即产出（供摄取流水线边抽取边切块）"""
+    last: Optional[str] = None
     cur: List[str] = []
     cur_len = 0
     for p in paras:
@@ -22,65 +42,358 @@ def split_into_chunks(text: str, chunk_chars: int = 800, overlap: int = 120) ->
             cur.append(p); cur_len += len(p) + 1
         else:
             if cur:
-                chunks.append("\n".join(cur))
+                last = "\n".join(cur)
+                yield last
             # 处理重叠：将末尾一部分带入下一块
-            if overlap > 0 and chunks:
-                tail = chunks[-1][-overlap:]
+            if overlap > 0 and last is not None:
+                tail = last[-overlap:]
                 cur = [tail, p]
                 cur_len = len(tail) + len(p) + 1
             else:
                 cur = [p]; cur_len = len(p)
     if cur:
-        chunks.append("\n".join(cur))
-    return chunks
+        yield "\n".join(cur)
+
+
+def split_into_chunks(text: str, chunk_chars: int = 800, overlap: int = 120) -> List[str]:
+    """将长文本按字符数切块，尽量在段落边界切分。"""
+    t = _normalize_space(text)
+    return list(iter_chunks(t.split("\n"), chunk_chars, overlap))
+
+# parse_file 使用的标准约束查询集（查询向量只计算一次）
+CONSTRAINT_QUERIES = (
+    '电压 偏差 允许 范围 kV %',
+    '线路 负载 率 限值 % 运行 N-1',
+    '变压器 负载 限值 % 主变',
+    'N-1 安全 准则 校验',
+    '安全 距离 线路 建筑 变电站 km',
+    '电压 等级 kV 范围'
+)
+
+
+class _ChunkMatrix:
+    """单文档的chunk文本与词频矩阵（chunk × 哈希词项），按文档内出现的词项压缩列并加权为 TF-IDF"""
+
+    def __init__(self, chunks: List[str], counts):
+        from scipy import sparse
+        from sklearn.preprocessing import normalize
+        self.chunks = chunks
+        self.counts = counts
+        # 只保留文档中出现过的词项列，idf 与加权矩阵的大小与文档规模成正比
+        self.terms = np.unique(counts.indices)
+        local = sparse.csr_matrix(
+            (counts.data, np.searchsorted(self.terms, counts.indices), counts.indptr),
+            shape=(counts.shape[0], len(self.terms))
+        )
+        df = np.bincount(local.indices, minlength=len(self.terms)).astype(np.float32)
+        n = counts.shape[0]
+        # 与 TfidfVectorizer 默认一致的平滑 idf
+        self.idf = (np.log((1.0 + n) / (1.0 + df)) + 1.0).astype(np.float32)
+        self.weighted = normalize(local.multiply(self.idf).tocsr())
+
+    def scores(self, queries: Iterable[str]) -> np.ndarray:
+        """一次稀疏矩阵乘得到 (chunk × 查询) 相似度（查询词频矩阵按查询集缓存）"""
+        q = _query_counts(tuple(queries))[:, self.terms].multiply(self.idf)
+        return (self.weighted @ q.T).toarray()
+
+
+_chunk_cache: "OrderedDict[str, _ChunkMatrix]" = OrderedDict()
+_chunk_cache_lock = threading.Lock()
+_query_cache: Dict[Tuple[str, ...], Any] = {}
+
+
+def _query_counts(queries: Tuple[str, ...]):
+    """查询集的哈希词频矩阵（与文档无关，按查询集缓存）"""
+    counts = _query_cache.get(queries)
+    if counts is None:
+        counts = make_vectorizer().transform(list(queries)).tocsr()
+        _query_cache[queries] = counts
+    return counts
+
+
+def _save_chunk_matrix(path: str, chunks: List[str], counts) -> None:
+    blobs = [c.encode('utf-8') for c in chunks]
+    offsets = np.zeros(len(blobs) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(b) for b in blobs])
+    tmp = path + '.tmp.npz'
+    np.savez(
+        tmp,
+        data=counts.data, indices=counts.indices, indptr=counts.indptr,
+        shape=np.asarray(counts.shape, dtype=np.int64),
+        text=np.frombuffer(b''.join(blobs), dtype=np.uint8), offsets=offsets
+    )
+    os.replace(tmp, path)
+
+
+def _load_chunk_matrix(path: str) -> _ChunkMatrix:
+    from scipy import sparse
+    with np.load(path, allow_pickle=False) as z:
+        counts = sparse.csr_matrix((z['data'], z['indices'], z['indptr']), shape=tuple(z['shape']))
+        text, offsets = z['text'].tobytes(), z['offsets']
+    chunks = [text[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(len(offsets) - 1)]
+    return _ChunkMatrix(chunks, counts)
+
+
+def get_chunk_matrix(text: str) -> Optional[_ChunkMatrix]:
+    """
+    取文档的chunk矩阵：内存LRU → 磁盘缓存（Config.RAG_CACHE_DIR/<文本sha256>.npz）→ 现算并落盘
+
+    Returns:
+        文档为空（无chunk）时返回 None
+    """
+    key = hashlib.sha256(text.encode('utf-8')).hexdigest()
+    with _chunk_cache_lock:
+        cm = _chunk_cache.get(key)
+        if cm is not None:
+            _chunk_cache.move_to_end(key)
+            return cm
+
+    path = os.path.join(Config.RAG_CACHE_DIR, key + '.npz')
+    cm = None
+    if os.path.exists(path):
+        try:
+            cm = _load_chunk_matrix(path)
+        except Exception as e:
+            print(f"读取chunk缓存失败，重新计算: {e}")
+    if cm is None:
+        chunks = split_into_chunks(text, chunk_chars=800, overlap=120)
+        if not chunks:
+            return None
+        counts = make_vectorizer().transform(chunks).tocsr()
+        counts.sum_duplicates()
+        os.makedirs(Config.RAG_CACHE_DIR, exist_ok=True)
+        _save_chunk_matrix(path, chunks, counts)
+        cm = _ChunkMatrix(chunks, counts)
+
+    with _chunk_cache_lock:
+        _chunk_cache[key] = cm
+        while len(_chunk_cache) > Config.RAG_CACHE_MEMORY_DOCS:
+            _chunk_cache.popitem(last=False)
+    return cm
+
 
 def rag_select(text: str, queries: List[str], per_query: int = 3, max_chars: int = 6000) -> str:
-    """在单文档内做简易RAG：按TF-IDF在chunk级别选与查询最相关的片段，合并返回。"""
-    from sklearn.feature_extraction.text import TfidfVectorizer
-    chunks = split_into_chunks(text, chunk_chars=800, overlap=120)
-    if not chunks:
+    """在单文档内做简易RAG：按TF-IDF（字符n-gram）在chunk级别选与查询最相关的片段，合并返回。
+
+    文档的chunk与词频矩阵按内容哈希缓存，所有查询在一次稀疏矩阵乘中打分。
+    """
+    cm = get_chunk_matrix(text)
+    if cm is None:
         return text[:max_chars]
-    vec = TfidfVectorizer(max_features=768)
-    X = vec.fit_transform(chunks)
+    sims = cm.scores(queries)
     selected_idx: List[int] = []
-    import numpy as np
-    for q in queries:
-        qv = vec.transform([q])
-        sims = (X @ qv.T).toarray().ravel()
-        top = np.argsort(sims)[-per_query:][::-1]
-        for i in top:
+    for j in range(sims.shape[1]):
+        col = sims[:, j]
+        k = min(per_query, len(col))
+        top = np.argpartition(col, len(col) - k)[len(col) - k:]
+        for i in top[np.argsort(col[top])[::-1]]:
             if i not in selected_idx:
                 selected_idx.append(int(i))
     # 组装文本，保留顺序
     selected_idx.sort()
     out_parts: List[str] = []
     for k, i in enumerate(selected_idx, 1):
-        part = chunks[i]
+        part = cm.chunks[i]
         out_parts.append(f"【片段{k}】\n{part}\n")
         if sum(len(p) for p in out_parts) >= max_chars:
             break
     return "\n".join(out_parts)[:max_chars]
 
 
-def extract_text(file_path: str) -> Tuple[str, int]:
-    """从文件中抽取文本（基础版）。返回(text, pages)。
-    - PDF: 使用 pdfminer.six
-    - TXT: 直接读取
-    其他类型暂不支持。
+def file_sha256(file_path: str, block_size: int = 1 << 20) -> str:
+    """流式计算文件 SHA-256（抽取缓存键）"""
+    h = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _page_file(out_dir: str, page: int) -> str:
+    return os.path.join(out_dir, f'page_{page:05d}.txt')
+
+
+def _import_pymupdf():
+    """PyMuPDF 新版模块名为 pymupdf，旧版仅提供 fitz；均未安装时返回 None"""
+    try:
+        import pymupdf
+        return pymupdf
+    except ImportError:
+        pass
+    try:
+        import fitz
+        return fitz
+    except ImportError:
+        return None
+
+
+def _extract_page_range(file_path: str, start: int, end: int, out_dir: str) -> int:
     """
+    子进程任务：抽取 [start, end) 页，每页写一个文本文件（逐页落盘，不在内存中累积）
+
+    Returns:
+        写出的页数
+    """
+    pymupdf = _import_pymupdf()
+    with pymupdf.open(file_path) as doc:
+        for i in range(start, end):
+            with open(_page_file(out_dir, i), 'w', encoding='utf-8') as f:
+                f.write(doc.load_page(i).get_text('text'))
+    return end - start
+
+
+_extract_pool: Optional[ProcessPoolExecutor] = None
+_extract_pool_lock = threading.Lock()
+
+
+def _get_extract_pool() -> ProcessPoolExecutor:
+    """
+    进程内共享的 PDF 抽取进程池（首次使用时创建，之后复用）
+
+    以 spawn 启动子进程：服务进程是多线程的，fork 会把其他线程持有的锁原样复制进子进程。
+    """
+    global _extract_pool
+    with _extract_pool_lock:
+        if _extract_pool is None:
+            _extract_pool = ProcessPoolExecutor(
+                max_workers=Config.PDF_EXTRACT_WORKERS,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _extract_pool
+
+
+def _pdf_page_batches(file_path: str, out_dir: str) -> Iterator[Tuple[int, int, str]]:
+    """
+    PyMuPDF 按页段并行抽取到 out_dir（未安装时退回 pdfminer 逐页抽取），
+    按页序逐段产出 (已完成页数, 总页数, 引擎名)
+    """
+    pymupdf = _import_pymupdf()
+    if pymupdf is None:
+        from pdfminer.high_level import extract_pages
+        from pdfminer.layout import LTTextContainer
+        from pdfminer.pdfpage import PDFPage
+        with open(file_path, 'rb') as f:
+            pages = sum(1 for _ in PDFPage.get_pages(f))
+        for i, layout in enumerate(extract_pages(file_path)):
+            text = "".join(el.get_text() for el in layout if isinstance(el, LTTextContainer))
+            with open(_page_file(out_dir, i), 'w', encoding='utf-8') as f:
+                f.write(text)
+            yield i + 1, pages, 'pdfminer'
+        return
+
+    with pymupdf.open(file_path) as doc:
+        pages = doc.page_count
+    step = Config.PDF_PAGES_PER_TASK
+    ranges = [(start, min(start + step, pages)) for start in range(0, pages, step)]
+    workers = max(1, min(Config.PDF_EXTRACT_WORKERS, pages // step))
+    if workers <= 1:
+        for start, end in ranges:
+            _extract_page_range(file_path, start, end, out_dir)
+            yield end, pages, 'pymupdf'
+        return
+
+    # 页段数多于进程数，先完成的进程继续领取后续页段；按页序等待，保证下游顺序读取
+    pool = _get_extract_pool()
+    futures = [pool.submit(_extract_page_range, file_path, start, end, out_dir) for start, end in ranges]
+    try:
+        for (_, end), fut in zip(ranges, futures):
+            fut.result()
+            yield end, pages, 'pymupdf'
+    finally:
+        # 提前结束（异常或消费方不再迭代）时撤回尚未开始的页段
+        for fut in futures:
+            fut.cancel()
+
+
+def iter_pdf_pages(file_path: str, progress: Optional[Callable[[int, int], None]] = None) -> Iterator[str]:
+    """
+    逐页返回 PDF 文本：命中缓存时按需读盘，否则边抽取边产出，全部完成后写入缓存
+
+    缓存位于 Config.EXTRACT_CACHE_DIR/<sha256>/，同一文件（无论文件名）再次抽取时直接命中；
+    抽取先写入临时目录，完成后整体改名，并发请求不会读到不完整的结果。
+
+    Args:
+        file_path: PDF 路径
+        progress: 进度回调 progress(已完成页数, 总页数)
+    """
+    sha = file_sha256(file_path)
+    out_dir = os.path.join(Config.EXTRACT_CACHE_DIR, sha)
+    meta_path = os.path.join(out_dir, 'meta.json')
+    if os.path.exists(meta_path):
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            pages = json.load(f)['pages']
+        for i in range(pages):
+            with open(_page_file(out_dir, i), 'r', encoding='utf-8') as f:
+                yield f.read()
+            if progress:
+                progress(i + 1, pages)
+        return
+
+    os.makedirs(Config.EXTRACT_CACHE_DIR, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix=f'{sha}.', dir=Config.EXTRACT_CACHE_DIR)
+    try:
+        done, pages, engine = 0, 0, ''
+        for done_now, pages, engine in _pdf_page_batches(file_path, tmp_dir):
+            for i in range(done, done_now):
+                with open(_page_file(tmp_dir, i), 'r', encoding='utf-8') as f:
+                    yield f.read()
+            done = done_now
+            if progress:
+                progress(done, pages)
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump({'sha256': sha, 'pages': done, 'engine': engine}, f)
+        try:
+            os.replace(tmp_dir, out_dir)
+        except OSError:
+            # 并发抽取同一文件时，另一方已先完成
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    except BaseException:
+        # 包括下游提前关闭生成器（GeneratorExit）
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+
+def extract_pdf_cached(file_path: str) -> Dict[str, Any]:
+    """
+    确保 PDF 已按页抽取并缓存
+
+    Returns:
+        {'sha256', 'dir', 'pages', 'engine', 'cached'}
+    """
+    out_dir = os.path.join(Config.EXTRACT_CACHE_DIR, file_sha256(file_path))
+    cached = os.path.exists(os.path.join(out_dir, 'meta.json'))
+    if not cached:
+        for _ in iter_pdf_pages(file_path):
+            pass
+    with open(os.path.join(out_dir, 'meta.json'), 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    return {**meta, 'dir': out_dir, 'cached': cached}
+
+
+def iter_document_pages(file_path: str, progress: Optional[Callable[[int, int], None]] = None) -> Iterator[str]:
+    """按页返回文档文本（TXT 视为单页），不支持的类型抛出 RuntimeError"""
     ext = os.path.splitext(file_path)[1].lower()
     if ext == '.txt':
         with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-            return f.read(), 1
+            text = f.read()
+        if progress:
+            progress(1, 1)
+        yield text
+        return
     if ext == '.pdf':
         try:
-            from pdfminer.high_level import extract_text as pdf_extract_text
-            from pdfminer.pdfpage import PDFPage
-            # 页数
-            with open(file_path, 'rb') as f:
-                pages = sum(1 for _ in PDFPage.get_pages(f))
-            text = pdf_extract_text(file_path) or ''
-            return text, int(pages or 0)
+            yield from iter_pdf_pages(file_path, progress)
         except Exception as e:
             raise RuntimeError(f'PDF文本提取失败: {e}')
+        return
     raise RuntimeError(f'不支持的文件类型: {ext}')
+
+
+def extract_text(file_path: str) -> Tuple[str, int]:
+    """从文件中抽取文本。返回(text, pages)。
+    - PDF: PyMuPDF 并行按页抽取，结果按文件 SHA-256 缓存（见 iter_pdf_pages）
+    - TXT: 直接读取
+    其他类型暂不支持。
+    """
+    pages = list(iter_document_pages(file_path))
+    return "\n".join(pages), len(pages)
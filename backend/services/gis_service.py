@@ -15,6 +15,7 @@ class GISService:
         self.gis_dir = Config.GIS_DIR
         os.makedirs(self.gis_dir, exist_ok=True)
         self.network_data = None
+        self.network_version = 0  # 每次加载拓扑递增，供特征列缓存判断失效
         self.load_network_data()
 
     def load_network_data(self):
@@ -42,6 +43,7 @@ class GISService:
                 self.network_data = self._generate_sample_network()
                 with open(data_file, 'w', encoding='utf-8') as f:
                     json.dump(self.network_data, f, ensure_ascii=False, indent=2)
+        self.network_version += 1
 
     def _generate_sample_network(self) -> Dict[str, Any]:
         """生成示例电网拓扑数据"""
@@ -0,0 +1,235 @@
+"""
+文档摄取任务队列 - 后台线程池执行 抽取 → 切块 → 索引 → 解析 流水线，任务状态持久化在 SQLite
+"""
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from config import Config
+
+# 各阶段在总进度中的区间 [起点, 终点)
+_STAGE_SPAN = {
+    'extract': (0.0, 0.6),
+    'index': (0.6, 0.8),
+    'parse': (0.8, 1.0),
+}
+
+_COLUMNS = (
+    'id', 'filename', 'path', 'status', 'stage', 'progress', 'pages_done', 'pages_total',
+    'chunks', 'parse', 'result', 'error', 'created_at', 'updated_at'
+)
+
+
+class IngestJobQueue:
+    """
+    文档摄取任务队列
+
+    - 任务状态: queued → running → succeeded / failed
+    - 流水线按页流式推进：抽取出的页立即切块，抽取完成时chunk已就绪，随后增量索引、（可选）LLM解析
+    - 进程重启后，未完成的任务重新排队；执行前以条件 UPDATE 原子认领，同一任务只会执行一次
+    """
+
+    def __init__(self, db_path: str, workers: int = 2):
+        self.db_path = db_path
+        self._db_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ingest')
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._init_db()
+        self._resume()
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """短连接：块内为一个事务（正常提交、异常回滚），退出时关闭连接"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _init_db(self):
+        with self._db_lock, self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS ingest_jobs (
+                    id TEXT PRIMARY KEY,
+                    filename TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    stage TEXT,
+                    progress REAL NOT NULL DEFAULT 0,
+                    pages_done INTEGER NOT NULL DEFAULT 0,
+                    pages_total INTEGER,
+                    chunks INTEGER,
+                    parse INTEGER NOT NULL DEFAULT 0,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_ingest_jobs_created ON ingest_jobs(created_at)")
+
+    def _update(self, job_id: str, **fields):
+        fields['updated_at'] = time.time()
+        if 'result' in fields and fields['result'] is not None:
+            fields['result'] = json.dumps(fields['result'], ensure_ascii=False)
+        assignments = ", ".join(f"{k} = ?" for k in fields)
+        with self._db_lock, self._connect() as conn:
+            conn.execute(f"UPDATE ingest_jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    @staticmethod
+    def _row_to_job(row: sqlite3.Row) -> Dict[str, Any]:
+        job = {k: row[k] for k in _COLUMNS}
+        job['parse'] = bool(job['parse'])
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    def _resume(self):
+        """把上次进程退出时未完成的任务重新排队"""
+        with self._db_lock, self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id FROM ingest_jobs WHERE status IN ('queued', 'running') ORDER BY created_at"
+            ).fetchall()
+            conn.execute(
+                "UPDATE ingest_jobs SET status = 'queued', stage = NULL, progress = 0, pages_done = 0 "
+                "WHERE status = 'running'"
+            )
+        for row in rows:
+            self._executor.submit(self._run, row['id'])
+
+    def submit(self, path: str, filename: str, parse: bool = False) -> str:
+        """
+        提交摄取任务，立即返回任务ID
+
+        Args:
+            path: 已保存的上传文件路径
+            filename: 显示用文件名
+            parse: 是否在索引后调用 LLM 解析约束
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._db_lock, self._connect() as conn:
+            conn.execute(
+                "INSERT INTO ingest_jobs (id, filename, path, status, parse, created_at, updated_at) "
+                "VALUES (?, ?, ?, 'queued', ?, ?, ?)",
+                (job_id, filename, path, int(parse), now, now)
+            )
+        self._executor.submit(self._run, job_id)
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._db_lock, self._connect() as conn:
+            row = conn.execute("SELECT * FROM ingest_jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def list(self, limit: int = 20, status: Optional[str] = None) -> List[Dict[str, Any]]:
+        sql = "SELECT * FROM ingest_jobs"
+        args: tuple = ()
+        if status:
+            sql += " WHERE status = ?"
+            args = (status,)
+        sql += " ORDER BY created_at DESC LIMIT ?"
+        with self._db_lock, self._connect() as conn:
+            rows = conn.execute(sql, (*args, int(limit))).fetchall()
+        return [self._row_to_job(r) for r in rows]
+
+    def _stage(self, job_id: str, stage: str, fraction: float = 0.0, **fields):
+        start, end = _STAGE_SPAN[stage]
+        self._update(job_id, stage=stage, progress=round(start + (end - start) * fraction, 4), **fields)
+
+    def _claim(self, job_id: str) -> bool:
+        """queued → running 的原子认领，已被认领或不存在时返回 False"""
+        with self._db_lock, self._connect() as conn:
+            cur = conn.execute(
+                "UPDATE ingest_jobs SET status = 'running', error = NULL, updated_at = ? "
+                "WHERE id = ? AND status = 'queued'",
+                (time.time(), job_id)
+            )
+            return cur.rowcount == 1
+
+    def _run(self, job_id: str):
+        if not self._claim(job_id):
+            return
+        job = self.get(job_id)
+        # 后续阶段失败时仍保留已完成阶段的结果（例如已索引、LLM 解析失败）
+        result: Dict[str, Any] = {}
+        try:
+            self._pipeline(job, result)
+            self._update(job_id, status='succeeded', stage='done', progress=1.0, result=result)
+        except Exception as e:
+            print(f"摄取任务失败 {job_id}: {e}")
+            self._update(job_id, status='failed', error=str(e), result=result or None)
+
+    def _pipeline(self, job: Dict[str, Any], result: Dict[str, Any]):
+        from services.doc_ingest import (
+            CONSTRAINT_QUERIES, iter_chunks, iter_document_pages, iter_paragraphs, rag_select
+        )
+        from services.retrieval_service import retrieval_service
+
+        job_id, path, filename = job['id'], job['path'], job['filename']
+
+        # 抽取 + 切块：页在抽取完成后立即进入切块，不等整份文档
+        pages: List[str] = []
+
+        def on_pages(done: int, total: int):
+            self._stage(job_id, 'extract', done / max(total, 1), pages_done=done, pages_total=total)
+
+        def page_stream():
+            for page in iter_document_pages(path, on_pages):
+                pages.append(page)
+                yield page
+
+        self._stage(job_id, 'extract')
+        chunks = list(iter_chunks(iter_paragraphs(page_stream())))
+        text = "\n".join(pages)
+
+        # 索引：保存同名txt，增量加入检索索引
+        self._stage(job_id, 'index', chunks=len(chunks))
+        txt_out = path + '.txt'
+        with open(txt_out, 'w', encoding='utf-8') as f:
+            f.write(text)
+        indexed = retrieval_service.add_document(txt_out, text, filename=filename, chunks=chunks)
+
+        result.update({
+            'doc_id': os.path.basename(path),
+            'filename': filename,
+            'pages': len(pages),
+            'text_length': len(text),
+            # 为避免响应过大，返回前 10000 字预览
+            'text_preview': text[:10000],
+            'indexed_chunks': indexed['chunks'],
+        })
+
+        if job['parse']:
+            from services.llm_service import llm_service
+            self._stage(job_id, 'parse')
+            selected = rag_select(text, CONSTRAINT_QUERIES, per_query=3, max_chars=7000)
+            result['constraints'] = llm_service.parse_constraints(selected)
+            result['selected_len'] = len(selected)
+
+
+_queue: Optional[IngestJobQueue] = None
+_queue_lock = threading.Lock()
+
+
+def get_ingest_jobs() -> IngestJobQueue:
+    """
+    全局摄取任务队列（首次调用时创建并恢复未完成任务）
+
+    不在导入时创建：调试模式下重载器的父进程也会导入本模块，导入即恢复会让同一任务在两个进程中执行。
+    """
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = IngestJobQueue(Config.INGEST_JOBS_DB, Config.INGEST_WORKERS)
+        return _queue
@@ -0,0 +1,131 @@
+"""
+LLM 响应缓存 - 按 (模型, 提示词模板版本, 温度, 输入哈希) 内容寻址，SQLite 持久化，TTL 过期 + 容量上限 LRU 淘汰
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from config import Config
+
+
+def cache_key(model: str, prompt_version: str, temperature: float, max_tokens: int,
+              messages: List[Dict[str, str]]) -> str:
+    """内容寻址键：输入消息整体哈希，模板/模型/采样参数任一变化即失效"""
+    payload = json.dumps(
+        {
+            'model': model,
+            'prompt_version': prompt_version,
+            'temperature': round(float(temperature), 4),
+            'max_tokens': int(max_tokens),
+            'messages': messages,
+        },
+        ensure_ascii=False, sort_keys=True
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class LLMResponseCache:
+    """SQLite 持久化的 LLM 响应缓存（按方法统计命中率）"""
+
+    def __init__(self, db_path: str, ttl_seconds: float, max_entries: int):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        with self._lock, self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    method TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_access ON llm_cache(last_access)")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """短连接：块内为一个事务（正常提交、异常回滚），退出时关闭连接"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _count(self, method: str, field: str):
+        s = self._stats.setdefault(method, {'hits': 0, 'misses': 0})
+        s[field] += 1
+
+    def get(self, key: str, method: str) -> Optional[str]:
+        """命中返回缓存的响应文本并刷新访问时间；过期条目顺带删除"""
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT response, created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is not None and now - row[1] > self.ttl_seconds:
+                conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self._count(method, 'misses')
+                return None
+            conn.execute("UPDATE llm_cache SET last_access = ?, hits = hits + 1 WHERE key = ?", (now, key))
+            self._count(method, 'hits')
+            return row[0]
+
+    def put(self, key: str, method: str, response: str):
+        """写入响应；超过容量时按最近访问时间淘汰最旧的条目"""
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, method, response, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, method, response, now, now)
+            )
+            conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+            excess = conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0] - self.max_entries
+            if excess > 0:
+                conn.execute(
+                    "DELETE FROM llm_cache WHERE key IN "
+                    "(SELECT key FROM llm_cache ORDER BY last_access ASC LIMIT ?)",
+                    (excess,)
+                )
+
+    def clear(self) -> int:
+        with self._lock, self._connect() as conn:
+            return conn.execute("DELETE FROM llm_cache").rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            by_method = {m: dict(s) for m, s in self._stats.items()}
+            with self._connect() as conn:
+                entries = conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        hits = sum(s['hits'] for s in by_method.values())
+        misses = sum(s['misses'] for s in by_method.values())
+        for s in by_method.values():
+            total = s['hits'] + s['misses']
+            s['hit_ratio'] = s['hits'] / total if total else 0.0
+        return {
+            'entries': entries,
+            'max_entries': self.max_entries,
+            'ttl_seconds': self.ttl_seconds,
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': hits / (hits + misses) if hits + misses else 0.0,
+            'by_method': by_method,
+        }
+
+
+# 全局响应缓存
+llm_cache = LLMResponseCache(Config.LLM_CACHE_DB, Config.LLM_CACHE_TTL_SECONDS, Config.LLM_CACHE_MAX_ENTRIES)
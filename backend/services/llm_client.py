@@ -0,0 +1,200 @@
+"""
+LLM HTTP 客户端 - 连接池复用（keep-alive）、并发上限、429/5xx 指数退避重试，并记录每次调用的延迟/token/重试
+"""
+from __future__ import annotations
+
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import Config
+from services.prompt_builder import count_message_tokens, count_tokens
+
+# 可重试的 HTTP 状态码：限流与服务端临时错误
+RETRY_STATUS = frozenset({429, 500, 502, 503, 504})
+
+
+class LLMMetrics:
+    """LLM 调用指标：累计计数 + 最近 window 次调用明细"""
+
+    def __init__(self, window: int = 200):
+        self._lock = threading.Lock()
+        self._recent: deque = deque(maxlen=window)
+        self._totals = {
+            'calls': 0,
+            'errors': 0,
+            'retries': 0,
+            'prompt_tokens': 0,
+            'completion_tokens': 0,
+            'total_tokens': 0,
+            'latency_s': 0.0,
+            'prompt_tokens_est': 0,
+        }
+
+    def record(self, endpoint: str, latency_s: float, retries: int, status: Optional[int],
+               usage: Optional[Dict[str, Any]] = None, error: Optional[str] = None,
+               prompt_tokens_est: int = 0):
+        usage = usage or {}
+        entry = {
+            'ts': time.time(),
+            'endpoint': endpoint,
+            'latency_ms': round(latency_s * 1000, 1),
+            'retries': retries,
+            'status': status,
+            'prompt_tokens': int(usage.get('prompt_tokens') or 0),
+            'completion_tokens': int(usage.get('completion_tokens') or 0),
+            'total_tokens': int(usage.get('total_tokens') or 0),
+            # 本地近似计数：流式响应或上游未返回 usage 时仍可估算输入规模
+            'prompt_tokens_est': prompt_tokens_est,
+            'error': error,
+        }
+        with self._lock:
+            self._recent.append(entry)
+            t = self._totals
+            t['calls'] += 1
+            t['errors'] += int(error is not None)
+            t['retries'] += retries
+            t['latency_s'] += latency_s
+            for k in ('prompt_tokens', 'completion_tokens', 'total_tokens', 'prompt_tokens_est'):
+                t[k] += entry[k]
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            totals = dict(self._totals)
+            recent = list(self._recent)
+        latencies = sorted(e['latency_ms'] for e in recent)
+
+        def pct(q: float) -> Optional[float]:
+            return latencies[min(int(q * len(latencies)), len(latencies) - 1)] if latencies else None
+
+        calls = totals['calls']
+        return {
+            'totals': {**totals, 'latency_s': round(totals['latency_s'], 3)},
+            'avg_latency_ms': round(1000 * totals['latency_s'] / calls, 1) if calls else None,
+            'p50_latency_ms': pct(0.5),
+            'p95_latency_ms': pct(0.95),
+            'recent': recent[-20:],
+        }
+
+
+class LLMHTTPClient:
+    """
+    共享的 LLM HTTP 客户端
+
+    - requests.Session + HTTPAdapter 连接池，跨调用复用 TCP/TLS 连接
+    - BoundedSemaphore 限制同时在途的请求数
+    - 429/5xx 与连接错误按指数退避（full jitter）重试，优先遵循 Retry-After
+    - 连接超时与读取超时分开配置
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 4,
+        max_retries: int = 3,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 60.0,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+        metrics: Optional[LLMMetrics] = None
+    ):
+        self.max_retries = max_retries
+        self.timeout = (connect_timeout, read_timeout)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.metrics = metrics or LLMMetrics()
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency, max_retries=0)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+
+    def _backoff(self, attempt: int, response: Optional[requests.Response]) -> float:
+        if response is not None:
+            retry_after = response.headers.get('Retry-After')
+            if retry_after:
+                try:
+                    return min(float(retry_after), self.backoff_max)
+                except ValueError:
+                    pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def post_json(self, url: str, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None,
+                  stream: bool = False) -> Tuple[requests.Response, int]:
+        """
+        POST JSON，失败按策略重试
+
+        Args:
+            url: 请求地址
+            payload: JSON 请求体
+            headers: 请求头
+            stream: 流式读取响应（调用方负责关闭响应）
+
+        Returns:
+            (响应, 重试次数)；非流式响应的 usage 字段计入指标
+
+        Raises:
+            requests.HTTPError / requests.RequestException: 重试耗尽或不可重试的错误
+        """
+        endpoint = url.rsplit('/', 1)[-1]
+        if 'messages' in payload:
+            prompt_est = count_message_tokens(payload['messages'])
+        else:
+            inputs = payload.get('input') or []
+            prompt_est = sum(count_tokens(t) for t in ([inputs] if isinstance(inputs, str) else inputs))
+        start = time.perf_counter()
+        retries = 0
+        response: Optional[requests.Response] = None
+        try:
+            while True:
+                error: Optional[Exception] = None
+                response = None
+                with self._slots:
+                    try:
+                        response = self._session.post(url, json=payload, headers=headers,
+                                                      timeout=self.timeout, stream=stream)
+                    except (requests.ConnectionError, requests.Timeout) as e:
+                        error = e
+                retryable = error is not None or response.status_code in RETRY_STATUS
+                if not retryable or retries >= self.max_retries:
+                    break
+                if response is not None:
+                    response.close()
+                # 退避等待不占用并发槽位
+                time.sleep(self._backoff(retries, response))
+                retries += 1
+
+            if error is not None:
+                raise error
+            response.raise_for_status()
+        except Exception as e:
+            status = response.status_code if response is not None else None
+            self.metrics.record(endpoint, time.perf_counter() - start, retries, status, error=str(e),
+                                prompt_tokens_est=prompt_est)
+            raise
+
+        usage = None
+        if not stream:
+            try:
+                usage = response.json().get('usage')
+            except ValueError:
+                pass
+        self.metrics.record(endpoint, time.perf_counter() - start, retries, response.status_code, usage,
+                            prompt_tokens_est=prompt_est)
+        return response, retries
+
+
+# 全局共享客户端（所有 LLM 服务实例复用同一连接池）
+llm_http_client = LLMHTTPClient(
+    max_concurrency=Config.LLM_MAX_CONCURRENCY,
+    max_retries=Config.LLM_MAX_RETRIES,
+    connect_timeout=Config.LLM_CONNECT_TIMEOUT,
+    read_timeout=Config.LLM_READ_TIMEOUT,
+    backoff_base=Config.LLM_BACKOFF_BASE,
+    backoff_max=Config.LLM_BACKOFF_MAX,
+    metrics=LLMMetrics(Config.LLM_METRICS_WINDOW)
+)
@@ -1,19 +1,46 @@
 """
 LLM服务 - 阿里通义千问Qwen集成
 """
-import requests
 import json
-from typing import List, Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 from config import Config
+from services.llm_client import LLMHTTPClient, llm_http_client
+from services.llm_cache import LLMResponseCache, cache_key, llm_cache
+from services.prompt_builder import prompt_builder
+from services.rule_extractor import merge_constraints, rule_extractor
+
+# 提示词模板版本：修改某方法的提示词时递增，使其缓存自动失效
+PROMPT_VERSIONS = {
+    'parse_constraints': 'v2',
+    'evaluate_candidate': 'v2',
+    'generate_planning_suggestions': 'v2',
+    'parse_constraints_batch': 'v1',
+}
+
+# 约束解析输出字段说明（单文档与批量解析共用）
+_CONSTRAINT_FIELDS = """- voltage_constraints: 电压约束
+- capacity_constraints: 容量约束
+- distance_constraints: 距离约束
+- topology_rules: 拓扑规则
+- safety_requirements: 安全要求
+- explanations: 每个约束的解释"""
 
 
 class QwenLLMService:
     """通义千问LLM服务"""
 
-    def __init__(self):
+    def __init__(self, client: Optional[LLMHTTPClient] = None, cache: Optional[LLMResponseCache] = None):
         self.api_key = Config.QWEN_API_KEY
         self.api_base = Config.QWEN_API_BASE
         self.model = Config.QWEN_MODEL
+        # 默认复用全局连接池客户端（keep-alive、限并发、退避重试）
+        self.client = client or llm_http_client
+        self.cache = cache or (llm_cache if Config.LLM_CACHE_ENABLED else None)
+
+    @property
+    def metrics(self):
+        return self.client.metrics
 
     def chat_completion(
         self,
@@ -49,14 +76,126 @@ class QwenLLMService:
             "stream": stream
         }
 
+        if stream:
+            # 兼容旧调用：流式拉取后拼成与非流式一致的响应结构
+            text = "".join(self.chat_completion_stream(messages, temperature, max_tokens))
+            return {"choices": [{"message": {"role": "assistant", "content": text}}]}
+
         try:
-            response = requests.post(url, headers=headers, json=payload, timeout=60)
-            response.raise_for_status()
+            response, _ = self.client.post_json(url, payload, headers=headers)
             return response.json()
         except Exception as e:
             print(f"LLM API调用错误: {e}")
             raise
 
+    def chat_completion_stream(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: int = 2000
+    ) -> Iterator[str]:
+        """
+        流式调用聊天补全，逐个产出增量文本（解析 SSE 的 data: 行，遇到 [DONE] 结束）
+
+        Args:
+            messages: 消息列表
+            temperature: 温度参数
+            max_tokens: 最大token数
+
+        Yields:
+            choices[0].delta.content 增量文本
+        """
+        url = f"{self.api_base}/chat/completions"
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+            "Accept": "text/event-stream"
+        }
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "stream": True
+        }
+        response, _ = self.client.post_json(url, payload, headers=headers, stream=True)
+        # SSE 规定使用 UTF-8；未声明 charset 时 requests 会按 ISO-8859-1 解码
+        response.encoding = 'utf-8'
+        try:
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith('data:'):
+                    # 空行为事件分隔，其余（event:/id:/注释）忽略
+                    continue
+                data = line[5:].strip()
+                if data == '[DONE]':
+                    break
+                try:
+                    chunk = json.loads(data)
+                except json.JSONDecodeError:
+                    continue
+                for choice in chunk.get('choices') or []:
+                    delta = (choice.get('delta') or {}).get('content')
+                    if delta:
+                        yield delta
+        finally:
+            response.close()
+
+    def stream_completion_text(
+        self,
+        method: str,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: int = 2000
+    ) -> Iterator[str]:
+        """cached_completion_text 的流式版本：命中缓存时一次产出全文，否则边收边产出，完整后写入缓存"""
+        key = None
+        if self.cache is not None:
+            key = cache_key(self.model, f"{method}:{PROMPT_VERSIONS.get(method, 'v0')}",
+                            temperature, max_tokens, messages)
+            cached = self.cache.get(key, method)
+            if cached is not None:
+                yield cached
+                return
+        parts = []
+        for delta in self.chat_completion_stream(messages, temperature, max_tokens):
+            parts.append(delta)
+            yield delta
+        text = "".join(parts)
+        if key is not None and text:
+            self.cache.put(key, method, text)
+
+    def cached_completion_text(
+        self,
+        method: str,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: int = 2000
+    ) -> str:
+        """
+        带持久化缓存的聊天补全，返回响应文本
+
+        Args:
+            method: 调用方名称（对应 PROMPT_VERSIONS 的模板版本，亦用于分方法统计命中率）
+            messages: 消息列表
+            temperature: 温度参数
+            max_tokens: 最大token数
+
+        Returns:
+            响应文本（空响应不写入缓存）
+        """
+        key = None
+        if self.cache is not None:
+            key = cache_key(self.model, f"{method}:{PROMPT_VERSIONS.get(method, 'v0')}",
+                            temperature, max_tokens, messages)
+            cached = self.cache.get(key, method)
+            if cached is not None:
+                return cached
+        response = self.chat_completion(messages, temperature=temperature, max_tokens=max_tokens)
+        text = self.extract_text(response)
+        if key is not None and text:
+            self.cache.put(key, method, text)
+        return text
+
     def extract_text(self, response: Dict[str, Any]) -> str:
         """从API响应中提取文本"""
         try:
@@ -65,47 +204,205 @@ class QwenLLMService:
             print(f"解析响应错误: {e}")
             return ""
 
-    def parse_constraints(self, document_text: str) -> Dict[str, Any]:
-        """
-        使用LLM解析文档中的约束条件
-
-        Args:
-            document_text: 文档文本
-
-        Returns:
-            结构化的约束信息
-        """
-        system_prompt = """你是一个电网规划专家。请从给定的文档中提取所有技术约束和规划标准。
+    @staticmethod
+    def _constraint_messages(document_text: str) -> List[Dict[str, str]]:
+        from services.doc_ingest import CONSTRAINT_QUERIES
+        # 超出 token 预算时按与约束查询的相关度装填片段，而非截断开头
+        excerpt, _ = prompt_builder.pack_document(document_text, CONSTRAINT_QUERIES)
+        system_prompt = f"""你是一个电网规划专家。请从给定的文档中提取所有技术约束和规划标准。
 
 输出格式应为JSON，包含以下字段：
-- voltage_constraints: 电压约束
-- capacity_constraints: 容量约束
-- distance_constraints: 距离约束
-- topology_rules: 拓扑规则
-- safety_requirements: 安全要求
-- explanations: 每个约束的解释
+{_CONSTRAINT_FIELDS}
 
 确保输出是有效的JSON格式。"""
 
-        messages = [
+        return [
             {"role": "system", "content": system_prompt},
-            {"role": "user", "content": f"请分析以下文档并提取约束条件：\n\n{document_text[:3000]}"}
+            {"role": "user", "content": f"请分析以下文档并提取约束条件：\n\n{excerpt}"}
         ]
 
-        response = self.chat_completion(messages, temperature=0.3)
-        text = self.extract_text(response)
+    @staticmethod
+    def _batch_constraint_messages(document_texts: List[str]) -> List[Dict[str, str]]:
+        """多文档合并为一次请求：每份文档以 <<<docN>>> / <<</docN>>> 包围，要求按文档编号输出 JSON 对象"""
+        from services.doc_ingest import CONSTRAINT_QUERIES
+        system_prompt = f"""你是一个电网规划专家。下面给出多份文档，每份以 <<<docN>>> 开始、以 <<</docN>>> 结束。
+请分别从每份文档中提取所有技术约束和规划标准，不要混用不同文档的内容。
+
+输出一个JSON对象，键为文档编号（doc1、doc2……），值为该文档的约束，包含以下字段：
+{_CONSTRAINT_FIELDS}
 
+每个文档编号都必须出现在输出中。确保输出是有效的JSON格式。"""
+
+        parts = []
+        for i, text in enumerate(document_texts, 1):
+            excerpt, _ = prompt_builder.pack_document(text, CONSTRAINT_QUERIES)
+            parts.append(f"<<<doc{i}>>>\n{excerpt}\n<<</doc{i}>>>")
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": "请分析以下文档并分别提取约束条件：\n\n" + "\n\n".join(parts)}
+        ]
+
+    @staticmethod
+    def parse_json_output(text: str) -> Any:
+        """解析 LLM 输出的 JSON；不是有效 JSON 时返回原始文本"""
         try:
-            # 尝试解析JSON
-            constraints = json.loads(text)
-            return constraints
+            return json.loads(text)
         except json.JSONDecodeError:
-            # 如果不是有效的JSON，返回原始文本
             return {
                 "raw_text": text,
                 "parsed": False
             }
 
+    def rule_prepass(self, document_text: str) -> Tuple[Optional[Dict[str, Any]], str]:
+        """
+        确定性规则抽取先行
+
+        Args:
+            document_text: 文档文本
+
+        Returns:
+            (规则抽取结果, 需交给 LLM 的文本)；规则抽取关闭时为 (None, 原文)，
+            全部条款已解析或关闭 LLM 补充时文本为空串
+        """
+        if not Config.RULE_EXTRACTOR_ENABLED:
+            return None, document_text
+        rules = rule_extractor.extract(document_text)
+        unresolved = rules['extraction']['unresolved']
+        if not unresolved or not Config.RULE_EXTRACTOR_LLM_FALLBACK:
+            return rules, ""
+        return rules, "\n".join(unresolved)
+
+    def parse_constraints(self, document_text: str) -> Dict[str, Any]:
+        """
+        解析文档中的约束条件：规则抽取先行，仅未解析的约束性条款调用LLM
+
+        Args:
+            document_text: 文档文本
+
+        Returns:
+            结构化的约束信息（规则抽取时含 extraction 字段，记录解析方式与未解析条款）
+        """
+        rules, pending = self.rule_prepass(document_text)
+        if rules is not None and not pending:
+            return rules
+        return self._complete_constraints(rules, lambda: self._llm_constraints(pending))
+
+    def _llm_constraints(self, document_text: str) -> Any:
+        messages = self._constraint_messages(document_text)
+        text = self.cached_completion_text('parse_constraints', messages, temperature=0.3)
+        return self.parse_json_output(text)
+
+    @staticmethod
+    def _complete_constraints(rules: Optional[Dict[str, Any]], llm_call) -> Dict[str, Any]:
+        """调用 LLM 补充规则未解析的部分并合并；规则已解析出部分约束时，LLM 失败降级为仅返回规则结果"""
+        try:
+            parsed = llm_call()
+        except Exception as e:
+            if rules is None or not rules['extraction']['resolved']:
+                raise
+            rules['extraction']['llm_error'] = str(e)
+            return rules
+        return parsed if rules is None else merge_constraints(rules, parsed)
+
+    def _plan_batches(self, pending: List[Tuple[int, str]]) -> List[List[Tuple[int, str]]]:
+        """按文档数上限与 token 预算把待解析文档分组"""
+        from services.prompt_builder import count_tokens
+        batches: List[List[Tuple[int, str]]] = []
+        current: List[Tuple[int, str]] = []
+        used = 0
+        for item in pending:
+            cost = min(count_tokens(item[1]), Config.PROMPT_DOC_TOKEN_BUDGET)
+            full = len(current) >= Config.LLM_BATCH_MAX_DOCS or used + cost > Config.LLM_BATCH_TOKEN_BUDGET
+            if current and full:
+                batches.append(current)
+                current, used = [], 0
+            current.append(item)
+            used += cost
+        if current:
+            batches.append(current)
+        return batches
+
+    def _parse_batch(self, batch: List[Tuple[int, str]]) -> Dict[int, Any]:
+        """
+        一次请求解析一组文档，按文档编号拆分结果
+
+        Returns:
+            {输入序号: 返回该文档 LLM 结果的可调用对象}；合并响应无效或缺少某文档时改为单独请求，
+            整个请求失败时调用即抛出该异常
+        """
+        if len(batch) == 1:
+            idx, text = batch[0]
+            return {idx: lambda: self._llm_constraints(text)}
+        messages = self._batch_constraint_messages([text for _, text in batch])
+        try:
+            text = self.cached_completion_text('parse_constraints_batch', messages, temperature=0.3,
+                                               max_tokens=min(2000 * len(batch), 8000))
+            keyed = self.parse_json_output(text)
+        except Exception as e:
+            error = e
+
+            def fail():
+                raise error
+            return {idx: fail for idx, _ in batch}
+
+        calls = {}
+        for i, (idx, doc_text) in enumerate(batch, 1):
+            value = keyed.get(f"doc{i}") if isinstance(keyed, dict) and keyed.get('parsed') is not False else None
+            if isinstance(value, dict):
+                calls[idx] = lambda v=value: v
+            else:
+                print(f"批量解析响应缺少 doc{i}，改为单独请求")
+                calls[idx] = lambda t=doc_text: self._llm_constraints(t)
+        return calls
+
+    def parse_constraints_batch(
+        self,
+        document_texts: List[str],
+        max_concurrency: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        批量解析多个文档的约束：规则抽取先行，各文档未解析的内容合并进同一次 LLM 请求（按文档编号输出），
+        减少往返与重复的系统提示词；各批次由线程池并发请求；合并响应无效时自动回退为逐文档请求
+
+        Args:
+            document_texts: 文档文本列表
+            max_concurrency: 同时在途的批次数上限（默认 Config.LLM_MAX_CONCURRENCY）
+
+        Returns:
+            与输入一一对应的约束结果
+        """
+        results: List[Optional[Dict[str, Any]]] = [None] * len(document_texts)
+        rules_by_idx: Dict[int, Optional[Dict[str, Any]]] = {}
+        pending: List[Tuple[int, str]] = []
+        for idx, text in enumerate(document_texts):
+            rules, rest = self.rule_prepass(text)
+            if rules is not None and not rest:
+                results[idx] = rules
+            else:
+                rules_by_idx[idx] = rules
+                pending.append((idx, rest))
+
+        batches = self._plan_batches(pending)
+        workers = min(max_concurrency or Config.LLM_MAX_CONCURRENCY, len(batches))
+        if workers <= 1:
+            outcomes = [self._parse_batch(b) for b in batches]
+        else:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='llm-batch') as pool:
+                outcomes = list(pool.map(self._parse_batch, batches))
+
+        for batch, calls in zip(batches, outcomes):
+            for idx, _ in batch:
+                rules = rules_by_idx[idx]
+                results[idx] = self._complete_constraints(rules, calls[idx])
+                if rules is not None:
+                    results[idx]['extraction']['batch_size'] = len(batch)
+        return results
+
+    def parse_constraints_stream(self, document_text: str) -> Iterator[str]:
+        """流式解析约束：逐段产出 LLM 输出文本，调用方拼接后用 parse_json_output 解析"""
+        messages = self._constraint_messages(document_text)
+        return self.stream_completion_text('parse_constraints', messages, temperature=0.3)
+
     def evaluate_candidate(
         self,
         candidate: Dict[str, Any],
@@ -130,10 +427,10 @@ class QwenLLMService:
 - recommendations: [] (改进建议)"""
 
         user_prompt = f"""候选方案：
-{json.dumps(candidate, ensure_ascii=False, indent=2)}
+{prompt_builder.compact_json(candidate)}
 
 约束条件：
-{json.dumps(constraints, ensure_ascii=False, indent=2)}
+{prompt_builder.compact_json(constraints)}
 
 请评估该方案是否满足约束条件。"""
 
@@ -142,8 +439,7 @@ class QwenLLMService:
             {"role": "user", "content": user_prompt}
         ]
 
-        response = self.chat_completion(messages, temperature=0.3)
-        text = self.extract_text(response)
+        text = self.cached_completion_text('evaluate_candidate', messages, temperature=0.3)
 
         try:
             evaluation = json.loads(text)
@@ -181,14 +477,15 @@ class QwenLLMService:
 - priority: 优先级(1-5)
 - reasoning: 理由"""
 
+        # 各段摘要按 token 预算压缩（缩短列表/字符串、降低精度），保证输出为完整 JSON
         user_prompt = f"""GIS数据摘要：
-{json.dumps(gis_data, ensure_ascii=False, indent=2)[:1000]}
+{prompt_builder.compact_json(gis_data)}
 
 负载预测：
-{json.dumps(load_forecast, ensure_ascii=False, indent=2)[:1000]}
+{prompt_builder.compact_json(load_forecast)}
 
 约束条件：
-{json.dumps(constraints, ensure_ascii=False, indent=2)[:1000]}
+{prompt_builder.compact_json(constraints)}
 
 请生成3-5个规划方案建议。"""
 
@@ -197,8 +494,7 @@ class QwenLLMService:
             {"role": "user", "content": user_prompt}
         ]
 
-        response = self.chat_completion(messages, temperature=0.7, max_tokens=3000)
-        text = self.extract_text(response)
+        text = self.cached_completion_text('generate_planning_suggestions', messages, temperature=0.7, max_tokens=3000)
 
         try:
             suggestions = json.loads(text)
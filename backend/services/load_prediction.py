@@ -7,16 +7,213 @@ from datetime import datetime, timedelta
 from typing import Dict, List, Any, Optional
 import json
 import os
+import threading
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
 from config import Config
 
+# 负载CSV的时间戳写入格式（与现有数据文件一致，保证追加后整列格式统一）
+CSV_TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+
+def parse_timestamps(values: pd.Series) -> pd.Series:
+    """
+    解析时间戳为无时区的本地时间（兼容格式混杂的列）
+
+    带时区的时间戳换算到 Config.LOAD_TIMEZONE 后去掉时区；时区混杂（含有/不含时区并存或多个偏移）时报错
+
+    Args:
+        values: 时间戳列
+
+    Returns:
+        datetime64[ns] 列
+    """
+    if pd.api.types.is_datetime64_any_dtype(values):
+        ts = values
+    else:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', FutureWarning)
+            ts = pd.to_datetime(values, format='mixed')
+    if not pd.api.types.is_datetime64_any_dtype(ts):
+        raise ValueError('timestamp 时区不一致：请统一使用本地时间或同一时区')
+    if ts.dt.tz is not None:
+        ts = ts.dt.tz_convert(Config.LOAD_TIMEZONE).dt.tz_localize(None)
+    return ts
+
+
+def read_load_csv(path: str) -> pd.DataFrame:
+    """读取负载CSV，timestamp 列统一为 datetime64"""
+    df = pd.read_csv(path, parse_dates=['timestamp'])
+    df['timestamp'] = parse_timestamps(df['timestamp'])
+    return df
+
+
+def lttb_indices(y: np.ndarray, max_points: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets 降采样，返回保留点的下标（保持曲线形状）
+
+    Args:
+        y: 等间隔序列
+        max_points: 保留点数（含首尾）
+
+    Returns:
+        升序下标数组
+    """
+    n = len(y)
+    if max_points >= n:
+        return np.arange(n)
+    if max_points < 3:
+        return np.linspace(0, n - 1, max(max_points, 1)).astype(int)
+
+    y = np.asarray(y, dtype=float)
+    x = np.arange(n, dtype=float)
+    edges = np.linspace(1, n - 1, max_points - 1).astype(int)
+    out = np.empty(max_points, dtype=int)
+    out[0] = 0
+    out[-1] = n - 1
+    a = 0
+    for i in range(max_points - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # 下一个桶的均值点作为第三顶点
+        nlo, nhi = hi, (edges[i + 2] if i + 2 < len(edges) else n)
+        cx = x[nlo:nhi].mean()
+        cy = y[nlo:nhi].mean()
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(area.argmax())
+        out[i + 1] = a
+    return out
+
+
+def minmax_indices(y: np.ndarray, max_points: int) -> np.ndarray:
+    """
+    按桶保留最小值与最大值的降采样，返回升序下标（保留峰谷）
+
+    Args:
+        y: 等间隔序列
+        max_points: 保留点数上限
+
+    Returns:
+        升序下标数组
+    """
+    n = len(y)
+    if max_points >= n:
+        return np.arange(n)
+    y = np.asarray(y, dtype=float)
+    n_buckets = max(1, max_points // 2)
+    edges = np.linspace(0, n, n_buckets + 1).astype(int)
+    idx = []
+    for lo, hi in zip(edges[:-1], edges[1:]):
+        if hi <= lo:
+            continue
+        seg = y[lo:hi]
+        idx.append(lo + int(seg.argmin()))
+        idx.append(lo + int(seg.argmax()))
+    return np.unique(np.asarray(idx, dtype=int))
+
 
 class LoadPrediction:
     """负载预测系统"""
 
-    def __init__(self):
+    def __init__(self, region: Optional[str] = None):
         self.data_dir = Config.LOAD_DATA_DIR
         os.makedirs(self.data_dir, exist_ok=True)
+        self.region = region or Config.DEFAULT_LOAD_REGION
         self.historical_data = None
+        # 当前数据对应的CSV文件（增量写入时追加到该文件）
+        self.data_file: Optional[str] = None
+        # 增量维护的统计量，避免每次请求全量扫描历史数据
+        self._agg: Optional[Dict[str, Any]] = None
+        # 预测缓存: (horizon_days, method) -> (输入指纹, 预测DataFrame)
+        self._forecast_cache: Dict[tuple, tuple] = {}
+        # 残差缓存: (末时刻, 按日分块的残差矩阵)
+        self._residual_cache: Optional[tuple] = None
+        self._lock = threading.RLock()
+        self.last_access = time.monotonic()
+        # 其它地区的实例（仅默认地区实例维护）：region -> LoadPrediction
+        self._regions: Dict[str, 'LoadPrediction'] = {self.region: self}
+        self._regions_lock = threading.Lock()
+
+    # ---------------- 多地区管理 ----------------
+    def for_region(self, region: Optional[str] = None) -> 'LoadPrediction':
+        """
+        获取指定地区的负载预测实例（懒加载并缓存，空闲地区按策略释放数据）
+
+        Args:
+            region: 地区名（见 Config.LOAD_REGIONS），为空时返回默认地区
+
+        Returns:
+            该地区的 LoadPrediction 实例
+        """
+        region = region or self.region
+        if region not in Config.LOAD_REGIONS:
+            raise ValueError(f'未知地区: {region}')
+        with self._regions_lock:
+            inst = self._regions.get(region)
+            if inst is None:
+                inst = LoadPrediction(region)
+                self._regions[region] = inst
+            inst.last_access = time.monotonic()
+        self._evict_idle_regions(keep=region)
+        return inst
+
+    def loaded_regions(self) -> List[str]:
+        """当前已加载数据的地区"""
+        with self._regions_lock:
+            return [r for r, inst in self._regions.items() if inst.historical_data is not None]
+
+    def release(self) -> None:
+        """释放本地区的历史数据与缓存（再次访问时重新加载）"""
+        with self._lock:
+            self.historical_data = None
+            self._agg = None
+            self._forecast_cache.clear()
+            self._residual_cache = None
+
+    def _evict_idle_regions(self, keep: str) -> List[str]:
+        """释放空闲超时的地区；已加载地区数超过上限时按最近最少使用释放"""
+        now = time.monotonic()
+        idle_seconds = float(getattr(Config, 'LOAD_REGION_IDLE_SECONDS', 1800))
+        max_loaded = int(getattr(Config, 'LOAD_MAX_LOADED_REGIONS', 3))
+        with self._regions_lock:
+            loaded = sorted(
+                (inst for r, inst in self._regions.items() if r != keep and inst.historical_data is not None),
+                key=lambda inst: inst.last_access
+            )
+            evict = [inst for inst in loaded if now - inst.last_access > idle_seconds]
+            remaining = [inst for inst in loaded if inst not in evict]
+            overflow = len(remaining) + 1 - max_loaded
+            if overflow > 0:
+                evict.extend(remaining[:overflow])
+        for inst in evict:
+            inst.release()
+        return [inst.region for inst in evict]
+
+    def summaries_all(self, regions: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        并发计算多个地区的负载摘要
+
+        Args:
+            regions: 地区列表，默认全部已配置地区
+
+        Returns:
+            {region: 摘要或 {'error': ...}}
+        """
+        regions = regions or list(Config.LOAD_REGIONS)
+        workers = max(1, min(len(regions), int(getattr(Config, 'LOAD_MAX_LOADED_REGIONS', 3))))
+
+        def _one(region: str) -> Dict[str, Any]:
+            return self.for_region(region).get_load_summary()
+
+        results: Dict[str, Any] = {}
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {region: pool.submit(_one, region) for region in regions}
+            for region, fut in futures.items():
+                try:
+                    results[region] = fut.result()
+                except Exception as e:
+                    results[region] = {'error': str(e)}
+        return results
 
     def generate_sample_data(self, days: int = 365) -> pd.DataFrame:
         """
@@ -66,31 +263,165 @@ class LoadPrediction:
         return df
 
     def load_historical_data(self) -> pd.DataFrame:
-        """加载历史数据"""
+        """加载本地区历史数据"""
         # ============================================
-        # 切换到真实数据：广东省真实特征负载数据
+        # 使用真实特征负载数据：realistic_<region>_load.csv
         # ============================================
-        real_data_file = os.path.join(self.data_dir, 'realistic_guangdong_load.csv')
+        region_name = Config.LOAD_REGIONS.get(self.region, self.region)
+        real_data_file = os.path.join(self.data_dir, f'realistic_{self.region}_load.csv')
 
         if os.path.exists(real_data_file):
             print(f"✓ 加载真实数据: {real_data_file}")
-            df = pd.read_csv(real_data_file, parse_dates=['timestamp'])
-            print(f"✓ 广东省负载数据: {len(df)}条记录, 平均负载 {df['load_mw'].mean():.2f} MW")
+            df = read_load_csv(real_data_file)
+            print(f"✓ {region_name}负载数据: {len(df)}条记录, 平均负载 {df['load_mw'].mean():.2f} MW")
+            data_file = real_data_file
+        elif self.region != Config.DEFAULT_LOAD_REGION:
+            raise FileNotFoundError(f'未找到{region_name}负载数据: {real_data_file}')
         else:
             # 如果真实数据不存在，回退到模拟数据
             print("⚠ 未找到真实数据，使用模拟数据")
             data_file = os.path.join(self.data_dir, 'historical_load.csv')
 
             if os.path.exists(data_file):
-                df = pd.read_csv(data_file, parse_dates=['timestamp'])
+                df = read_load_csv(data_file)
             else:
                 # 生成示例数据
                 df = self.generate_sample_data(days=730)  # 2年数据
-                df.to_csv(data_file, index=False)
-
-        self.historical_data = df
+                df.to_csv(data_file, index=False, date_format=CSV_TIMESTAMP_FORMAT)
+
+        df = df.sort_values('timestamp').reset_index(drop=True)
+        with self._lock:
+            self.historical_data = df
+            self.data_file = data_file
+            self._agg = self._build_aggregates(df)
+            self._forecast_cache.clear()
+            self._residual_cache = None
         return df
 
+    @staticmethod
+    def _moments(values: np.ndarray) -> tuple:
+        """返回 (count, mean, M2)，用于按批合并方差（Chan并行算法）"""
+        v = values[np.isfinite(values)]
+        if v.size == 0:
+            return 0, 0.0, 0.0
+        mean = float(v.mean())
+        return int(v.size), mean, float(((v - mean) ** 2).sum())
+
+    @staticmethod
+    def _merge_moments(a: tuple, b: tuple) -> tuple:
+        n_a, mean_a, m2_a = a
+        n_b, mean_b, m2_b = b
+        n = n_a + n_b
+        if n == 0:
+            return 0, 0.0, 0.0
+        delta = mean_b - mean_a
+        mean = mean_a + delta * n_b / n
+        m2 = m2_a + m2_b + delta * delta * n_a * n_b / n
+        return n, mean, m2
+
+    def _batch_aggregates(self, df: pd.DataFrame, prev_load: Optional[float]) -> Dict[str, Any]:
+        """计算一批数据的可合并统计量"""
+        y = df['load_mw'].to_numpy(dtype=float)
+        hours = df['timestamp'].dt.hour.to_numpy()
+        weekday = df['timestamp'].dt.weekday.to_numpy() < 5
+
+        prev = np.concatenate([[prev_load], y[:-1]]) if prev_load is not None else np.concatenate([[np.nan], y[:-1]])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            pct = y / prev - 1.0
+
+        return {
+            'load': self._moments(y),
+            'pct': self._moments(pct),
+            'min': float(y.min()),
+            'max': float(y.max()),
+            'hour_sum': np.bincount(hours, weights=y, minlength=24),
+            'hour_count': np.bincount(hours, minlength=24),
+            'weekday_sum': float(y[weekday].sum()),
+            'weekday_count': int(weekday.sum()),
+            'weekend_sum': float(y[~weekday].sum()),
+            'weekend_count': int((~weekday).sum()),
+            'last_load': float(y[-1]),
+            'last_timestamp': df['timestamp'].iloc[-1]
+        }
+
+    def _build_aggregates(self, df: pd.DataFrame) -> Optional[Dict[str, Any]]:
+        if df is None or len(df) == 0:
+            return None
+        return self._batch_aggregates(df, prev_load=None)
+
+    def _merge_aggregates(self, agg: Dict[str, Any], batch: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            'load': self._merge_moments(agg['load'], batch['load']),
+            'pct': self._merge_moments(agg['pct'], batch['pct']),
+            'min': min(agg['min'], batch['min']),
+            'max': max(agg['max'], batch['max']),
+            'hour_sum': agg['hour_sum'] + batch['hour_sum'],
+            'hour_count': agg['hour_count'] + batch['hour_count'],
+            'weekday_sum': agg['weekday_sum'] + batch['weekday_sum'],
+            'weekday_count': agg['weekday_count'] + batch['weekday_count'],
+            'weekend_sum': agg['weekend_sum'] + batch['weekend_sum'],
+            'weekend_count': agg['weekend_count'] + batch['weekend_count'],
+            'last_load': batch['last_load'],
+            'last_timestamp': batch['last_timestamp']
+        }
+
+    def append_measurements(self, measurements: Any, persist: bool = True) -> Dict[str, Any]:
+        """
+        增量追加新的负载量测，并更新统计量与预测缓存
+
+        Args:
+            measurements: 记录列表 [{'timestamp', 'load_mw', ...}] 或列式 {'timestamp': [...], 'load_mw': [...]}
+            persist: 是否追加写入数据CSV
+
+        Returns:
+            {'accepted', 'skipped', 'last_timestamp', 'invalidated_forecasts'}
+        """
+        batch = pd.DataFrame(measurements)
+        if 'timestamp' not in batch.columns or 'load_mw' not in batch.columns:
+            raise ValueError('量测数据需包含 timestamp 与 load_mw 字段')
+        batch['timestamp'] = parse_timestamps(batch['timestamp'])
+        batch['load_mw'] = pd.to_numeric(batch['load_mw'], errors='coerce')
+        total = len(batch)
+        batch = batch.dropna(subset=['timestamp', 'load_mw'])
+
+        with self._lock:
+            if self.historical_data is None:
+                self.load_historical_data()
+            df = self.historical_data
+
+            # 仅接受晚于现有数据的时间点（只追加，不回写历史）
+            last_ts = df['timestamp'].iloc[-1] if len(df) else None
+            batch = batch.sort_values('timestamp').drop_duplicates('timestamp', keep='last')
+            if last_ts is not None:
+                batch = batch[batch['timestamp'] > last_ts]
+            batch = batch.reindex(columns=df.columns).reset_index(drop=True)
+
+            if len(batch) == 0:
+                return {
+                    'accepted': 0,
+                    'skipped': total,
+                    'last_timestamp': str(last_ts) if last_ts is not None else None,
+                    'invalidated_forecasts': 0
+                }
+
+            prev_load = float(df['load_mw'].iloc[-1]) if len(df) else None
+            batch_agg = self._batch_aggregates(batch, prev_load)
+            self.historical_data = pd.concat([df, batch], ignore_index=True)
+            self._agg = batch_agg if self._agg is None else self._merge_aggregates(self._agg, batch_agg)
+
+            if persist and self.data_file:
+                batch.to_csv(self.data_file, mode='a', header=not os.path.exists(self.data_file), index=False,
+                             date_format=CSV_TIMESTAMP_FORMAT)
+
+            invalidated = self._invalidate_stale_forecasts()
+
+            return {
+                'accepted': len(batch),
+                'skipped': total - len(batch),
+                'last_timestamp': str(batch['timestamp'].iloc[-1]),
+                'invalidated_forecasts': invalidated
+            }
+
     def extract_features(self, df: pd.DataFrame) -> Dict[str, Any]:
         """
         提取负载特征
@@ -116,6 +447,36 @@ class LoadPrediction:
 
         return features
 
+    def current_features(self) -> Dict[str, Any]:
+        """
+        基于增量统计量返回当前历史数据的特征（与 extract_features 结果一致）
+
+        Returns:
+            特征字典
+        """
+        with self._lock:
+            if self.historical_data is None:
+                self.load_historical_data()
+            agg = self._agg
+            if agg is None:
+                return self.extract_features(self.historical_data)
+
+            n, mean, m2 = agg['load']
+            pn_, _, pm2 = agg['pct']
+            hour_mean = np.where(agg['hour_count'] > 0, agg['hour_sum'] / np.maximum(agg['hour_count'], 1), np.nan)
+            return {
+                'avg_load': float(mean),
+                'max_load': float(agg['max']),
+                'min_load': float(agg['min']),
+                'std_load': float(np.sqrt(m2 / (n - 1))) if n > 1 else float('nan'),
+                'peak_hour': int(np.nanargmax(hour_mean)),
+                'valley_hour': int(np.nanargmin(hour_mean)),
+                'weekday_avg': float(agg['weekday_sum'] / agg['weekday_count']) if agg['weekday_count'] else float('nan'),
+                'weekend_avg': float(agg['weekend_sum'] / agg['weekend_count']) if agg['weekend_count'] else float('nan'),
+                'growth_rate': self._calculate_growth_rate(self.historical_data),
+                'volatility': float(np.sqrt(pm2 / (pn_ - 1))) if pn_ > 1 else float('nan'),
+            }
+
     def _calculate_growth_rate(self, df: pd.DataFrame) -> float:
         """计算年增长率"""
         if len(df) < 365 * 24:
@@ -143,27 +504,27 @@ class LoadPrediction:
         Returns:
             预测结果DataFrame
         """
-        if self.historical_data is None:
-            self.load_historical_data()
+        with self._lock:
+            if self.historical_data is None:
+                self.load_historical_data()
 
-        df = self.historical_data.copy()
+            # 预测只依赖(末时刻, 基础负载, 增长率)，输入未变化时直接复用缓存
+            inputs = self._forecast_inputs()
+            key = (int(horizon_days), method)
+            cached = self._forecast_cache.get(key)
+            if cached is not None and cached[0] == inputs:
+                return cached[1].copy()
 
-        # 提取特征
-        features = self.extract_features(df)
+        last_date, base_load, growth_rate = inputs
 
         # 简单预测：基于历史趋势
-        last_date = df['timestamp'].max()
         future_dates = pd.date_range(
             start=last_date + timedelta(hours=1),
             periods=horizon_days * 24,
             freq='H'
         )
 
-        # 基础负载（使用最近的平均值）
-        base_load = df.tail(30 * 24)['load_mw'].mean()
-
         # 应用增长率
-        growth_rate = features['growth_rate']
         hours = np.arange(len(future_dates))
         trend = base_load * growth_rate * hours / (365 * 24)
 
@@ -187,57 +548,327 @@ class LoadPrediction:
             'confidence_upper': predicted_load * 1.1
         })
 
-        return prediction_df
+        with self._lock:
+            self._forecast_cache[key] = (inputs, prediction_df)
+        return prediction_df.copy()
+
+    def _forecast_inputs(self) -> tuple:
+        """预测模型的输入指纹：(末时刻, 最近30天平均负载, 年增长率)"""
+        df = self.historical_data
+        base_load = float(df.tail(30 * 24)['load_mw'].mean())
+        return df['timestamp'].iloc[-1], base_load, self._calculate_growth_rate(df)
+
+    def _invalidate_stale_forecasts(self) -> int:
+        """仅移除输入指纹发生变化的预测缓存，返回失效条目数"""
+        with self._lock:
+            if not self._forecast_cache:
+                return 0
+            inputs = self._forecast_inputs()
+            stale = [k for k, (fp, _) in self._forecast_cache.items() if fp != inputs]
+            for k in stale:
+                del self._forecast_cache[k]
+            return len(stale)
+
+    def _daily_residuals(self) -> np.ndarray:
+        """
+        计算历史负荷相对“30天滑动水平 × 周内小时曲线”的相对残差，按日分块
 
-    def identify_overload_areas(
+        Returns:
+            (天数, 24) 的残差矩阵
+        """
+        with self._lock:
+            if self.historical_data is None:
+                self.load_historical_data()
+            df = self.historical_data
+            last_ts = df['timestamp'].iloc[-1]
+            if self._residual_cache is not None and self._residual_cache[0] == last_ts:
+                return self._residual_cache[1]
+
+        y = df['load_mw'].to_numpy(dtype=float)
+        level = pd.Series(y).rolling(30 * 24, center=True, min_periods=24).mean().to_numpy()
+        how = (df['timestamp'].dt.weekday * 24 + df['timestamp'].dt.hour).to_numpy()
+        shape = y / level
+        profile = np.bincount(how, weights=np.nan_to_num(shape), minlength=168) / \
+            np.maximum(np.bincount(how, weights=np.isfinite(shape).astype(float), minlength=168), 1)
+        resid = shape / profile[how] - 1.0
+
+        n_days = len(resid) // 24
+        blocks = resid[len(resid) - n_days * 24:].reshape(n_days, 24)
+        blocks = blocks[np.isfinite(blocks).all(axis=1)]
+        if len(blocks) == 0:
+            blocks = np.zeros((1, 24))
+
+        with self._lock:
+            self._residual_cache = (last_ts, blocks)
+        return blocks
+
+    def generate_load_scenarios(
+        self,
+        horizon_days: int = 365,
+        n_scenarios: Optional[int] = None,
+        seed: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        基于历史残差的日块自助法（block bootstrap），一次性生成多条负荷轨迹
+
+        Args:
+            horizon_days: 预测天数
+            n_scenarios: 场景数，默认取 Config.LOAD_SCENARIO_COUNT
+            seed: 随机种子，默认取 Config.LOAD_SCENARIO_SEED（保证结果可复现）
+
+        Returns:
+            {'timestamps', 'deterministic', 'scenarios'}，scenarios 为 (场景数 × 小时数) 的 float32 数组
+        """
+        n_scenarios = int(n_scenarios or getattr(Config, 'LOAD_SCENARIO_COUNT', 1000))
+        seed = getattr(Config, 'LOAD_SCENARIO_SEED', 42) if seed is None else seed
+
+        prediction = self.predict_future_load(horizon_days)
+        base = prediction['predicted_load_mw'].to_numpy(dtype=float)
+        blocks = self._daily_residuals().astype(np.float32)
+
+        rng = np.random.default_rng(seed)
+        n_days = int(np.ceil(len(base) / 24))
+        picks = rng.integers(0, len(blocks), size=(n_scenarios, n_days))
+        resid = blocks[picks].reshape(n_scenarios, n_days * 24)[:, :len(base)]
+        scenarios = base.astype(np.float32)[None, :] * (1.0 + resid)
+
+        return {
+            'timestamps': prediction['timestamp'],
+            'deterministic': base,
+            'scenarios': scenarios
+        }
+
+    def summarize_scenarios(
+        self,
+        scenarios: Dict[str, Any],
+        quantiles: Optional[List[float]] = None
+    ) -> Dict[str, Any]:
+        """
+        计算场景的分位数带与峰值负荷分布
+
+        Args:
+            scenarios: generate_load_scenarios 的输出
+            quantiles: 分位数列表，默认 [0.05, 0.5, 0.95]
+
+        Returns:
+            {'quantiles', 'bands', 'peak_distribution'}
+        """
+        quantiles = quantiles or [0.05, 0.5, 0.95]
+        matrix = scenarios['scenarios']
+        bands = np.quantile(matrix, quantiles, axis=0)
+        peaks = matrix.max(axis=1).astype(float)
+        hist, edges = np.histogram(peaks, bins=20)
+
+        return {
+            'quantiles': quantiles,
+            'bands': bands,
+            'peak_distribution': {
+                'deterministic_peak': float(scenarios['deterministic'].max()),
+                'mean': float(peaks.mean()),
+                'std': float(peaks.std()),
+                'quantiles': {str(q): float(v) for q, v in zip(quantiles, np.quantile(peaks, quantiles))},
+                'histogram': {'counts': hist.tolist(), 'edges': edges.tolist()}
+            },
+            'peaks': peaks
+        }
+
+    def network_load_factors(self, peaks: np.ndarray) -> Dict[str, Any]:
+        """
+        将场景峰值负荷映射为基线网络的负荷倍率
+
+        基线网络（IEEE 14-bus）没有与本地区负荷对应的绝对量，其母线负荷视为历史平均负荷下的运行点，
+        倍率 = 场景峰值 / 历史平均负荷。这样保留了预测期的负荷增长与峰谷差；若除以确定性峰值，
+        倍率只剩场景间的相对波动（约 1.05~1.09）。
+
+        Args:
+            peaks: 各场景的峰值负荷 (MW)
+
+        Returns:
+            {'factors': 倍率数组, 'reference': 'historical_mean', 'reference_mw': 参考负荷}
+        """
+        reference = float(self.current_features()['avg_load'])
+        if not np.isfinite(reference) or reference <= 0:
+            raise ValueError('历史平均负荷无效，无法映射场景负荷')
+        return {
+            'factors': np.asarray(peaks, dtype=float) / reference,
+            'reference': 'historical_mean',
+            'reference_mw': reference
+        }
+
+    def downsample_prediction(
         self,
         prediction: pd.DataFrame,
-        capacity_threshold: float = 0.9
-    ) -> List[Dict[str, Any]]:
+        max_points: int,
+        method: str = 'lttb'
+    ) -> Dict[str, Any]:
         """
-        识别可能过载的区域
+        服务端降采样并输出列式数组，减少长周期预测的传输与序列化开销
 
         Args:
-            prediction: 预测数据
-            capacity_threshold: 容量阈值
+            prediction: predict_future_load 的输出
+            max_points: 最大输出点数
+            method: 'lttb' 或 'minmax'
 
         Returns:
-            过载区域列表
+            {列名: 列表} 的列式结构，timestamp 为 ISO-8601 字符串
         """
-        # 基于GIS网络位置动态生成过载区域，确保与网络在同一城市范围
+        y = prediction['predicted_load_mw'].to_numpy(dtype=float)
+        if method == 'minmax':
+            idx = minmax_indices(y, int(max_points))
+        else:
+            idx = lttb_indices(y, int(max_points))
+
+        sampled = prediction.iloc[idx]
+        columns: Dict[str, Any] = {}
+        for col in sampled.columns:
+            if col == 'timestamp':
+                columns[col] = sampled[col].dt.strftime('%Y-%m-%dT%H:%M:%S').tolist()
+            else:
+                columns[col] = np.round(sampled[col].to_numpy(dtype=float), 3).tolist()
+        return columns
+
+    @staticmethod
+    def _area_capacity(voltage_kv: float) -> float:
+        """按电压等级给出区域粗略供电容量（MW），取原随机区间的中值以保证结果稳定。"""
+        v = float(voltage_kv or 110)
+        if v >= 220:
+            return 1500.0
+        if v >= 110:
+            return 1150.0
+        return 800.0
+
+    def _bus_allocation(self, network: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        按 net.load 的母线有功占比计算负荷分配因子
+
+        Args:
+            network: GIS网络摘要（含 substations/buses 与 loads）
+
+        Returns:
+            {'areas': [...], 'shares': ndarray(n_areas,)}，仅包含挂有负荷的母线
+        """
+        substations = [s for s in (network.get('substations') or []) if s.get('location')]
+        bus_p: Dict[str, float] = {}
+        for ld in network.get('loads') or []:
+            b = ld.get('bus')
+            bid = f"bus_{b}" if isinstance(b, int) else str(b)
+            p = ld.get('p_mw', ld.get('load_mw', 0.0))
+            bus_p[bid] = bus_p.get(bid, 0.0) + float(p or 0.0)
+
+        areas = []
+        weights = []
+        for sub in substations:
+            p = bus_p.get(sub['id'], 0.0)
+            if p <= 0:
+                continue
+            loc = sub['location']
+            v = sub.get('voltage_kv') or sub.get('voltage_level') or 110
+            areas.append({
+                'id': f"area_{sub['id']}",
+                'name': sub.get('name_zh') or sub.get('name') or sub['id'],
+                'bus_id': sub['id'],
+                'capacity': self._area_capacity(v),
+                'lat': float(loc['lat']),
+                'lon': float(loc['lon'])
+            })
+            weights.append(p)
+
+        w = np.asarray(weights, dtype=float)
+        shares = w / w.sum() if w.size and w.sum() > 0 else w
+        return {'areas': areas, 'shares': shares}
+
+    @staticmethod
+    def _zone_bbox(feature: Dict[str, Any]) -> Optional[tuple]:
+        try:
+            ring = feature['geometry']['coordinates'][0]
+        except (KeyError, IndexError, TypeError):
+            return None
+        lons = [float(p[0]) for p in ring]
+        lats = [float(p[1]) for p in ring]
+        return min(lats), max(lats), min(lons), max(lons)
+
+    def _zone_allocation(self, network: Dict[str, Any], zones: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        将母线分配因子聚合到区域网格；若区域设置了 baseline_load_mw，则以其为分配权重
+
+        Args:
+            network: GIS网络摘要
+            zones: 区域划分（GeoJSON FeatureCollection）
+
+        Returns:
+            {'areas': [...], 'shares': ndarray(n_areas,)}，仅包含有负荷的区域
+        """
+        bus = self._bus_allocation(network)
+        features = (zones or {}).get('features') or []
+        bboxes = [self._zone_bbox(f) for f in features]
+
+        n = len(features)
+        bus_share = np.zeros(n)
+        capacity = np.zeros(n)
+        for area, share in zip(bus['areas'], bus['shares']):
+            for k, bb in enumerate(bboxes):
+                if bb and bb[0] <= area['lat'] <= bb[1] and bb[2] <= area['lon'] <= bb[3]:
+                    bus_share[k] += share
+                    capacity[k] += area['capacity']
+                    break
+
+        baseline = np.array([
+            float((f.get('properties') or {}).get('baseline_load_mw') or 0.0) for f in features
+        ])
+        weights = baseline if baseline.sum() > 0 else bus_share
+
+        areas = []
+        keep = []
+        for k, f in enumerate(features):
+            if weights[k] <= 0 or bboxes[k] is None:
+                continue
+            props = f.get('properties') or {}
+            lat0, lat1, lon0, lon1 = bboxes[k]
+            areas.append({
+                'id': f"area_{props.get('zone_id') or k + 1}",
+                'name': props.get('name') or f'区域{k + 1}',
+                'zone_id': props.get('zone_id'),
+                # 区域内无母线时按最低电压等级给出容量
+                'capacity': float(capacity[k]) if capacity[k] > 0 else self._area_capacity(0),
+                'lat': (lat0 + lat1) / 2,
+                'lon': (lon0 + lon1) / 2
+            })
+            keep.append(k)
+
+        w = weights[keep]
+        shares = w / w.sum() if w.size and w.sum() > 0 else w
+        return {'areas': areas, 'shares': shares}
+
+    def predict_spatial_load(
+        self,
+        prediction: pd.DataFrame,
+        level: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        将系统级预测按确定性分配因子分解到母线或区域
+
+        Args:
+            prediction: predict_future_load 的输出
+            level: 'bus' 或 'zone'，默认取 Config.SPATIAL_FORECAST_LEVEL
+
+        Returns:
+            {'level', 'areas', 'shares', 'timestamps', 'matrix'}，
+            其中 matrix 为 (区域数 × 小时数) 的二维数组
+        """
+        level = level or getattr(Config, 'SPATIAL_FORECAST_LEVEL', 'bus')
         try:
             # 延迟导入避免循环依赖
             from services.gis_service import gis_service  # type: ignore
             network = gis_service.get_network_summary()
-            substations = [s for s in (network.get('substations') or []) if s.get('location')]
+            if level == 'zone':
+                alloc = self._zone_allocation(network, gis_service.get_zones_geojson())
+            else:
+                alloc = self._bus_allocation(network)
         except Exception:
-            substations = []
+            alloc = {'areas': [], 'shares': np.zeros(0)}
 
-        areas = []
-        if substations:
-            # 取最多5个站点，在其附近少量扰动生成区域点
-            import random
-            for i, sub in enumerate(substations[:5]):
-                loc = sub['location']
-                lat = float(loc['lat']) + float(np.random.uniform(-0.02, 0.02))
-                lon = float(loc['lon']) + float(np.random.uniform(-0.02, 0.02))
-                # 粗略容量：按电压等级设上下限
-                v = sub.get('voltage_kv') or sub.get('voltage_level') or 110
-                if float(v) >= 220:
-                    cap = float(np.random.uniform(1200, 1800))
-                elif float(v) >= 110:
-                    cap = float(np.random.uniform(800, 1500))
-                else:
-                    cap = float(np.random.uniform(600, 1000))
-                areas.append({
-                    'id': f'area_{i+1}',
-                    'name': sub.get('name_zh') or sub.get('name') or f'区域{i+1}',
-                    'capacity': cap,
-                    'lat': lat,
-                    'lon': lon
-                })
-        else:
-            # 回退：使用广州附近坐标（与示例拓扑一致）
+        if not alloc['areas']:
+            # 回退：使用广州附近坐标（与示例拓扑一致），按容量比例分配
             areas = [
                 {'id': 'area_1', 'name': '城东区', 'capacity': 1200, 'lat': 23.13, 'lon': 113.28},
                 {'id': 'area_2', 'name': '城西区', 'capacity': 1000, 'lat': 23.12, 'lon': 113.24},
@@ -245,35 +876,71 @@ class LoadPrediction:
                 {'id': 'area_4', 'name': '城北区', 'capacity': 1100, 'lat': 23.16, 'lon': 113.27},
                 {'id': 'area_5', 'name': '开发区', 'capacity': 800, 'lat': 23.14, 'lon': 113.30},
             ]
+            caps = np.array([a['capacity'] for a in areas], dtype=float)
+            alloc = {'areas': areas, 'shares': caps / caps.sum()}
+
+        system = prediction['predicted_load_mw'].to_numpy(dtype=float)
+        matrix = np.outer(alloc['shares'], system)
+
+        return {
+            'level': level,
+            'areas': alloc['areas'],
+            'shares': alloc['shares'],
+            'timestamps': prediction['timestamp'],
+            'matrix': matrix
+        }
+
+    def identify_overload_areas(
+        self,
+        prediction: pd.DataFrame,
+        capacity_threshold: float = 0.9,
+        level: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        识别可能过载的区域（基于空间负荷预测矩阵，结果可复现）
 
-        max_predicted = prediction['predicted_load_mw'].max()
+        Args:
+            prediction: 预测数据
+            capacity_threshold: 容量阈值
+            level: 空间粒度 'bus' 或 'zone'
+
+        Returns:
+            过载区域列表
+        """
+        spatial = self.predict_spatial_load(prediction, level=level)
+        areas = spatial['areas']
+        matrix = spatial['matrix']
+        if not areas or matrix.size == 0:
+            return []
+
+        capacity = np.array([a['capacity'] for a in areas], dtype=float)
+        peak = matrix.max(axis=1)
+        peak_hour = matrix.argmax(axis=1)
+        loading = peak / capacity
+        timestamps = spatial['timestamps'].reset_index(drop=True)
 
         overload_areas = []
-        for area in areas:
-            # 为每个区域分配负载（简化：按比例分配）
-            area_load = max_predicted * np.random.uniform(0.15, 0.35)
-
-            if area_load / area['capacity'] > capacity_threshold:
-                overload_areas.append({
-                    **area,
-                    'predicted_load': float(area_load),
-                    'loading_rate': float(area_load / area['capacity']),
-                    'overload_amount': float(area_load - area['capacity'] * capacity_threshold),
-                    'priority': 'high' if area_load / area['capacity'] > 1.0 else 'medium'
-                })
+        for i in np.flatnonzero(loading > capacity_threshold):
+            area = areas[i]
+            overload_areas.append({
+                **area,
+                'predicted_load': float(peak[i]),
+                'loading_rate': float(loading[i]),
+                'overload_amount': float(peak[i] - capacity[i] * capacity_threshold),
+                'peak_time': timestamps.iloc[int(peak_hour[i])].strftime('%Y-%m-%dT%H:%M:%S'),
+                'priority': 'high' if loading[i] > 1.0 else 'medium'
+            })
 
         return sorted(overload_areas, key=lambda x: x['loading_rate'], reverse=True)
 
     def get_load_summary(self) -> Dict[str, Any]:
         """获取负载摘要"""
-        if self.historical_data is None:
-            self.load_historical_data()
-
-        features = self.extract_features(self.historical_data)
+        features = self.current_features()
         prediction = self.predict_future_load(horizon_days=365)
         overload_areas = self.identify_overload_areas(prediction)
 
         return {
+            'region': self.region,
             'current_features': features,
             'future_prediction': {
                 'max_load': float(prediction['predicted_load_mw'].max()),
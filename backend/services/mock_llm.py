@@ -0,0 +1,341 @@
+"""
+本地模拟 LLM 服务 - OpenAI 兼容接口（/v1/chat/completions 含 SSE 流式、/v1/embeddings、/v1/models），
+可配置延迟与错误率，支持从夹具目录回放 / 录制真实响应，用于离线压测与 CI
+
+用法（在 backend/ 下）：
+  python -m services.mock_llm --port 8090 --latency-ms 200 --error-rate 0.05
+  python -m services.mock_llm --mode record --upstream https://dashscope.aliyuncs.com/compatible-mode/v1
+应用侧设置 LLM_MOCK=1（或 QWEN_API_BASE=http://127.0.0.1:8090/v1）即指向该服务
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+
+from config import Config
+from services.llm_cache import cache_key
+from services.prompt_builder import count_message_tokens, count_tokens
+
+MODES = ('replay', 'record', 'synthetic')
+_ERROR_STATUS = (429, 500, 503)
+_BATCH_DOC = re.compile(r"<<<(doc\d+)>>>\n(.*?)\n<<</\1>>>", re.S)
+
+
+def fixture_key(payload: Dict[str, Any]) -> str:
+    """夹具键：与请求内容（模型、消息、采样参数）一一对应，与是否流式无关"""
+    return cache_key(
+        payload.get('model', ''), 'fixture', float(payload.get('temperature', 0.7)),
+        int(payload.get('max_tokens', 2000)), payload.get('messages') or []
+    )
+
+
+def _synthetic_content(messages: List[Dict[str, str]]) -> str:
+    """无夹具时按提示词类型合成结构合法的响应"""
+    system = next((m.get('content') or '' for m in messages if m.get('role') == 'system'), '')
+    user = next((m.get('content') or '' for m in reversed(messages) if m.get('role') == 'user'), '')
+    if '技术约束' in system:
+        from services.rule_extractor import rule_extractor
+        docs = _BATCH_DOC.findall(user)
+        if docs:
+            # 批量解析：按文档编号输出
+            keyed = {}
+            for doc_id, text in docs:
+                keyed[doc_id] = rule_extractor.extract(text)
+                keyed[doc_id].pop('extraction', None)
+            return json.dumps(keyed, ensure_ascii=False)
+        result = rule_extractor.extract(user)
+        result.pop('extraction', None)
+        return json.dumps(result, ensure_ascii=False)
+    if '评估给定的规划方案' in system:
+        return json.dumps({'compliant': True, 'violations': [], 'score': 80, 'recommendations': []},
+                          ensure_ascii=False)
+    if '扩展方案' in system:
+        return json.dumps([
+            {'type': 'reinforcement', 'location': '负载最高的线路', 'equipment': '线路增容',
+             'capacity': '100MVA', 'priority': 1, 'reasoning': '模拟响应'},
+            {'type': 'expansion', 'location': '负荷中心附近', 'equipment': '110kV变电站',
+             'capacity': '2×50MVA', 'priority': 2, 'reasoning': '模拟响应'},
+        ], ensure_ascii=False)
+    return f"（模拟响应）已收到：{user[:50]}"
+
+
+class MockLLMServer:
+    """
+    模拟 LLM 服务
+
+    - replay: 命中夹具则回放，否则合成响应
+    - record: 转发到上游真实服务并把响应写入夹具目录（已有夹具直接回放）
+    - synthetic: 始终合成响应
+    """
+
+    def __init__(
+        self,
+        host: str = '127.0.0.1',
+        port: int = 8090,
+        mode: str = 'replay',
+        fixtures_dir: Optional[str] = None,
+        latency_ms: float = 200.0,
+        jitter_ms: float = 50.0,
+        chunk_ms: float = 20.0,
+        error_rate: float = 0.0,
+        retry_after: Optional[float] = None,
+        upstream: Optional[str] = None,
+        seed: Optional[int] = None
+    ):
+        if mode not in MODES:
+            raise ValueError(f"未知模式: {mode}（可选 {', '.join(MODES)}）")
+        self.host = host
+        self.port = port
+        self.mode = mode
+        self.fixtures_dir = fixtures_dir or Config.LLM_MOCK_FIXTURES_DIR
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.chunk_ms = chunk_ms
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.upstream = upstream
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.stats = {'requests': 0, 'errors_injected': 0, 'replayed': 0, 'recorded': 0, 'synthetic': 0}
+        self._httpd: Optional[ThreadingHTTPServer] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    def _count(self, field: str):
+        with self._stats_lock:
+            self.stats[field] += 1
+
+    def _random(self) -> float:
+        with self._rng_lock:
+            return self._rng.random()
+
+    def _sleep_latency(self):
+        delay = self.latency_ms + (2 * self._random() - 1) * self.jitter_ms
+        if delay > 0:
+            time.sleep(delay / 1000.0)
+
+    def _fixture_path(self, key: str) -> str:
+        return os.path.join(self.fixtures_dir, f"{key}.json")
+
+    def _load_fixture(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self._fixture_path(key)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)['response']
+
+    def _save_fixture(self, key: str, payload: Dict[str, Any], response: Dict[str, Any]):
+        os.makedirs(self.fixtures_dir, exist_ok=True)
+        request = {k: payload.get(k) for k in ('model', 'messages', 'temperature', 'max_tokens')}
+        tmp = self._fixture_path(key) + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'request': request, 'response': response}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self._fixture_path(key))
+
+    def _record(self, payload: Dict[str, Any], authorization: Optional[str]) -> Dict[str, Any]:
+        if not self.upstream:
+            raise RuntimeError('record 模式需要指定 upstream')
+        body = {**payload, 'stream': False}
+        if not authorization or authorization.strip() == 'Bearer':
+            authorization = f"Bearer {Config.QWEN_API_KEY}"
+        headers = {'Content-Type': 'application/json', 'Authorization': authorization}
+        resp = requests.post(f"{self.upstream.rstrip('/')}/chat/completions", json=body, headers=headers,
+                             timeout=(Config.LLM_CONNECT_TIMEOUT, Config.LLM_READ_TIMEOUT))
+        resp.raise_for_status()
+        return resp.json()
+
+    def completion(self, payload: Dict[str, Any], authorization: Optional[str] = None) -> Dict[str, Any]:
+        """按模式得到完整（非流式）的 chat.completion 响应"""
+        messages = payload.get('messages') or []
+        key = fixture_key(payload)
+        if self.mode != 'synthetic':
+            cached = self._load_fixture(key)
+            if cached is not None:
+                self._count('replayed')
+                return cached
+            if self.mode == 'record':
+                response = self._record(payload, authorization)
+                self._save_fixture(key, payload, response)
+                self._count('recorded')
+                return response
+        self._count('synthetic')
+        content = _synthetic_content(messages)
+        prompt_tokens = count_message_tokens(messages)
+        completion_tokens = count_tokens(content)
+        return {
+            'id': f"chatcmpl-mock-{uuid.uuid4().hex[:12]}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': payload.get('model', 'mock'),
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content},
+                         'finish_reason': 'stop'}],
+            'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                      'total_tokens': prompt_tokens + completion_tokens},
+        }
+
+    def embeddings(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        from services.dense_index import HashingEmbedder
+        inputs = payload.get('input') or []
+        inputs = [inputs] if isinstance(inputs, str) else list(inputs)
+        vectors = HashingEmbedder(Config.EMBEDDING_DIM).embed(inputs) if inputs else []
+        tokens = sum(count_tokens(t) for t in inputs)
+        return {
+            'object': 'list',
+            'model': payload.get('model', 'mock'),
+            'data': [{'object': 'embedding', 'index': i, 'embedding': v.tolist()} for i, v in enumerate(vectors)],
+            'usage': {'prompt_tokens': tokens, 'total_tokens': tokens},
+        }
+
+    def injected_error(self) -> Optional[Tuple[int, Dict[str, Any]]]:
+        if self.error_rate <= 0 or self._random() >= self.error_rate:
+            return None
+        self._count('errors_injected')
+        status = _ERROR_STATUS[int(self._random() * len(_ERROR_STATUS))]
+        return status, {'error': {'message': '模拟错误', 'type': 'mock_error', 'code': status}}
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, status: int, body: Any, headers: Optional[Dict[str, str]] = None):
+                data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(data)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _write_chunk(self, text: str):
+                data = text.encode('utf-8')
+                self.wfile.write(b'%x\r\n' % len(data) + data + b'\r\n')
+                self.wfile.flush()
+
+            def _send_stream(self, response: Dict[str, Any]):
+                content = response['choices'][0]['message']['content'] or ''
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream; charset=utf-8')
+                self.send_header('Cache-Control', 'no-cache')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                base = {'id': response.get('id'), 'object': 'chat.completion.chunk', 'model': response.get('model')}
+                for start in range(0, len(content), 8):
+                    chunk = {**base, 'choices': [{'index': 0, 'delta': {'content': content[start:start + 8]}}]}
+                    self._write_chunk(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n")
+                    if server.chunk_ms > 0:
+                        time.sleep(server.chunk_ms / 1000.0)
+                final = {**base, 'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}],
+                         'usage': response.get('usage')}
+                self._write_chunk(f"data: {json.dumps(final, ensure_ascii=False)}\n\n")
+                self._write_chunk("data: [DONE]\n\n")
+                self.wfile.write(b'0\r\n\r\n')
+
+            def do_GET(self):
+                if self.path.rstrip('/') == '/v1/models':
+                    self._send_json(200, {'object': 'list', 'data': [{'id': Config.QWEN_MODEL, 'object': 'model'}]})
+                elif self.path.rstrip('/') == '/stats':
+                    with server._stats_lock:
+                        self._send_json(200, dict(server.stats))
+                else:
+                    self._send_json(404, {'error': {'message': f'未知路径: {self.path}'}})
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                try:
+                    payload = json.loads(self.rfile.read(length) or b'{}')
+                except json.JSONDecodeError as e:
+                    self._send_json(400, {'error': {'message': f'请求体不是有效 JSON: {e}'}})
+                    return
+                path = self.path.rstrip('/')
+                if path not in ('/v1/chat/completions', '/v1/embeddings'):
+                    self._send_json(404, {'error': {'message': f'未知路径: {self.path}'}})
+                    return
+                server._count('requests')
+                server._sleep_latency()
+                error = server.injected_error()
+                if error is not None:
+                    status, body = error
+                    headers = None
+                    if status == 429 and server.retry_after is not None:
+                        headers = {'Retry-After': str(server.retry_after)}
+                    self._send_json(status, body, headers)
+                    return
+                try:
+                    if path == '/v1/embeddings':
+                        self._send_json(200, server.embeddings(payload))
+                        return
+                    response = server.completion(payload, self.headers.get('Authorization'))
+                except Exception as e:
+                    self._send_json(502, {'error': {'message': str(e), 'type': 'mock_upstream_error'}})
+                    return
+                if payload.get('stream'):
+                    self._send_stream(response)
+                else:
+                    self._send_json(200, response)
+
+        return Handler
+
+    def start(self) -> 'MockLLMServer':
+        """在后台线程启动（供基准脚本与测试进程内使用）"""
+        self._httpd = ThreadingHTTPServer((self.host, self.port), self._handler())
+        self._httpd.daemon_threads = True
+        self.port = self._httpd.server_address[1]
+        threading.Thread(target=self._httpd.serve_forever, name='mock-llm', daemon=True).start()
+        return self
+
+    def serve_forever(self):
+        self._httpd = ThreadingHTTPServer((self.host, self.port), self._handler())
+        self._httpd.daemon_threads = True
+        print(f"模拟 LLM 服务: {self.base_url}（模式 {self.mode}，夹具 {self.fixtures_dir}）")
+        self._httpd.serve_forever()
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+
+def main():
+    ap = argparse.ArgumentParser(description='OpenAI 兼容的本地模拟 LLM 服务')
+    ap.add_argument('--host', default=Config.LLM_MOCK_HOST)
+    ap.add_argument('--port', type=int, default=Config.LLM_MOCK_PORT)
+    ap.add_argument('--mode', choices=MODES, default='replay')
+    ap.add_argument('--fixtures', default=Config.LLM_MOCK_FIXTURES_DIR)
+    ap.add_argument('--latency-ms', type=float, default=Config.LLM_MOCK_LATENCY_MS)
+    ap.add_argument('--jitter-ms', type=float, default=50.0)
+    ap.add_argument('--chunk-ms', type=float, default=20.0, help='流式响应相邻 chunk 的间隔')
+    ap.add_argument('--error-rate', type=float, default=Config.LLM_MOCK_ERROR_RATE)
+    ap.add_argument('--retry-after', type=float, default=None, help='注入 429 时返回的 Retry-After（秒）')
+    ap.add_argument('--upstream', default=os.getenv('LLM_MOCK_UPSTREAM'), help='record 模式转发的真实服务地址')
+    ap.add_argument('--seed', type=int, default=None)
+    args = ap.parse_args()
+
+    MockLLMServer(
+        host=args.host, port=args.port, mode=args.mode, fixtures_dir=args.fixtures,
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, chunk_ms=args.chunk_ms,
+        error_rate=args.error_rate, retry_after=args.retry_after, upstream=args.upstream, seed=args.seed
+    ).serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,7 @@
 """
 潮流计算和N-1校验模块
 """
+import copy
 import numpy as np
 import pandas as pd
 from typing import Dict, List, Any, Optional
@@ -18,6 +19,7 @@ class PowerFlowAnalysis:
 
     def __init__(self):
         self.network = None
+        self.network_version = 0  # 基线网络每次重建递增，供依赖基线潮流的缓存判断失效
         self.create_sample_network()
 
     def create_sample_network(self):
@@ -29,6 +31,7 @@ class PowerFlowAnalysis:
         except Exception:
             pass
         self.network = net
+        self.network_version += 1
 
     def _run_power_flow_on(self, net: pp.pandapowerNet) -> Dict[str, Any]:
         """
@@ -293,9 +296,8 @@ class PowerFlowAnalysis:
                 best_id = bid
         return best_id
 
-    def _inject_new_line(self, net: pp.pandapowerNet, candidate: Dict[str, Any], gis_data: Dict[str, Any]) -> Dict[str, Any]:
-        length_km = float(candidate.get('length_km') or candidate.get('distance_to_existing') or 5.0)
-        vn = float(candidate.get('voltage_level') or 110)
+    def _candidate_line_buses(self, candidate: Dict[str, Any], gis_data: Dict[str, Any]) -> tuple:
+        """新建线路候选的两端母线（pandapower 母线索引）；无法确定时抛出 ValueError"""
         # choose from/to buses
         from_bus = None
         sid = candidate.get('from_substation_id') or candidate.get('substation_id')
@@ -327,28 +329,30 @@ class PowerFlowAnalysis:
                     to_bus = to_bus_alt
             if from_bus is None or to_bus is None or from_bus == to_bus:
                 raise ValueError('cannot determine from/to bus for new_line')
+        return from_bus, to_bus
 
+    @staticmethod
+    def _line_params(vn: float) -> Dict[str, float]:
         # per-km parameters (rough)
         if vn >= 100:
-            r_ohm_per_km = 0.06
-            x_ohm_per_km = 0.32
-            c_nf_per_km = 10.0
-            max_i_ka = 0.6
-        else:
-            r_ohm_per_km = 0.15
-            x_ohm_per_km = 0.35
-            c_nf_per_km = 8.0
-            max_i_ka = 0.4
+            return {'r_ohm_per_km': 0.06, 'x_ohm_per_km': 0.32, 'c_nf_per_km': 10.0, 'max_i_ka': 0.6}
+        return {'r_ohm_per_km': 0.15, 'x_ohm_per_km': 0.35, 'c_nf_per_km': 8.0, 'max_i_ka': 0.4}
 
+    def _inject_new_line(self, net: pp.pandapowerNet, candidate: Dict[str, Any], gis_data: Dict[str, Any]) -> Dict[str, Any]:
+        length_km = float(candidate.get('length_km') or candidate.get('distance_to_existing') or 5.0)
+        vn = float(candidate.get('voltage_level') or 110)
+        from_bus, to_bus = self._candidate_line_buses(candidate, gis_data)
+
+        params = self._line_params(vn)
         idx = pp.create_line_from_parameters(
             net,
             from_bus=from_bus,
             to_bus=to_bus,
             length_km=length_km,
-            r_ohm_per_km=r_ohm_per_km,
-            x_ohm_per_km=x_ohm_per_km,
-            c_nf_per_km=c_nf_per_km,
-            max_i_ka=max_i_ka,
+            r_ohm_per_km=params['r_ohm_per_km'],
+            x_ohm_per_km=params['x_ohm_per_km'],
+            c_nf_per_km=params['c_nf_per_km'],
+            max_i_ka=params['max_i_ka'],
             name=f"cand_line_{from_bus}_{to_bus}",
             df=1.0,
             type='ol',
@@ -447,6 +451,267 @@ class PowerFlowAnalysis:
 
         return {'type': 'new_substation', 'new_bus': int(new_bus), 'connect_to': int(nearest_id), 'length_km': length_km}
 
+    def _clone_network(self) -> pp.pandapowerNet:
+        # 新版 pandapower 移除了 net.deepcopy()
+        if hasattr(self.network, 'deepcopy'):
+            return self.network.deepcopy()
+        return copy.deepcopy(self.network)
+
+    @staticmethod
+    def _get_gis_data() -> Dict[str, Any]:
+        try:
+            # 延迟导入以获得GIS坐标
+            from services.gis_service import gis_service  # type: ignore
+            return gis_service.get_network_summary()
+        except Exception:
+            return {'substations': []}
+
+    def _apply_candidate(self, net: pp.pandapowerNet, candidate: Dict[str, Any], gis_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """将候选方案注入给定网络，返回注入信息（失败时返回 error）"""
+        try:
+            if candidate.get('type') == 'new_line':
+                return self._inject_new_line(net, candidate, gis_data)
+            elif candidate.get('type') == 'substation_expansion':
+                return self._inject_substation_expansion(net, candidate)
+            elif candidate.get('type') == 'new_substation':
+                return self._inject_new_substation(net, candidate, gis_data)
+        except Exception as e:
+            return {'error': str(e)}
+        return None
+
+    @staticmethod
+    def _scenario_levels(peak_factors: np.ndarray, n_levels: int) -> tuple:
+        """将峰值负荷倍率样本离散为等概率的若干水平，返回 (水平, 概率)"""
+        factors = np.sort(np.asarray(peak_factors, dtype=float))
+        n_levels = max(1, min(int(n_levels), len(factors)))
+        groups = np.array_split(factors, n_levels)
+        levels = np.array([g.mean() for g in groups])
+        probs = np.array([len(g) for g in groups], dtype=float) / len(factors)
+        return levels, probs
+
+    def _overload_profile_on(self, net: pp.pandapowerNet, levels: np.ndarray, probs: np.ndarray) -> Dict[str, Any]:
+        """
+        在各负荷水平下运行潮流，统计过载/越限概率
+
+        不收敛的水平计入过载/越限概率并单独给出 non_converged_probability；
+        其最大负载率为 None，期望最大负载率只在收敛水平的概率质量上归一化（全部不收敛时为 None）
+        """
+        base_p = net.load['p_mw'].to_numpy(dtype=float).copy()
+        base_q = net.load['q_mvar'].to_numpy(dtype=float).copy()
+        p_overload = 0.0
+        p_violation = 0.0
+        expected_excess = 0.0
+        p_non_converged = 0.0
+        loading_sum = 0.0
+        converged_mass = 0.0
+        per_level = []
+        try:
+            for level, prob in zip(levels, probs):
+                net.load['p_mw'] = base_p * level
+                net.load['q_mvar'] = base_q * level
+                res = self._run_power_flow_on(net)
+                violations = res.get('violations', []) if res.get('converged') else []
+                overloads = [v for v in violations if v.get('type') == 'overload']
+                overloaded = (not res.get('converged')) or bool(overloads)
+                if overloaded:
+                    p_overload += prob
+                if not res.get('converged'):
+                    p_non_converged += prob
+                if (not res.get('converged')) or violations:
+                    p_violation += prob
+                excess = sum(float(v.get('excess', 0.0)) for v in overloads)
+                expected_excess += prob * excess
+                max_loading = self._max_branch_loading(net) if res.get('converged') else float('nan')
+                if np.isfinite(max_loading):
+                    loading_sum += prob * max_loading
+                    converged_mass += prob
+                else:
+                    max_loading = None
+                per_level.append({
+                    'load_factor': float(level),
+                    'probability': float(prob),
+                    'converged': bool(res.get('converged')),
+                    'overloads': len(overloads),
+                    'violations': len(violations),
+                    'max_loading_percent': max_loading
+                })
+        finally:
+            net.load['p_mw'] = base_p
+            net.load['q_mvar'] = base_q
+
+        return {
+            'overload_probability': float(p_overload),
+            'violation_probability': float(p_violation),
+            'expected_overload_excess': float(expected_excess),
+            'expected_max_loading_percent': float(loading_sum / converged_mass) if converged_mass > 0 else None,
+            'non_converged_probability': float(p_non_converged),
+            'levels': per_level
+        }
+
+    @staticmethod
+    def _max_branch_loading(net: pp.pandapowerNet) -> float:
+        """线路与变压器的最大负载率 (%)"""
+        values = [float(net.res_line['loading_percent'].max())] if len(net.res_line) else []
+        if hasattr(net, 'res_trafo') and len(net.res_trafo):
+            values.append(float(net.res_trafo['loading_percent'].max()))
+        return max(values) if values else float('nan')
+
+    def screen_candidates_probabilistic(
+        self,
+        candidates: List[Dict[str, Any]],
+        peak_factors: np.ndarray,
+        n_levels: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        基于负荷场景峰值分布的概率潮流筛查，按过载概率对候选方案排序
+
+        Args:
+            candidates: 候选方案列表
+            peak_factors: 各场景峰值对应的基线网络负荷倍率（见 LoadPrediction.network_load_factors）
+            n_levels: 离散负荷水平数，默认取 Config.SCENARIO_SCREENING_LEVELS
+
+        Returns:
+            {'baseline': 基线网络的概率指标, 'candidates': 结果列表}；
+            成功注入的方案按 (过载概率, 越限概率, 期望过载量, 不收敛概率, 期望最大负载率) 升序排列并给出 rank，
+            注入失败或类型不支持的方案不做潮流，排在最后，screened=False、rank=None 并带 error
+        """
+        levels, probs = self._scenario_levels(
+            peak_factors,
+            n_levels or getattr(Config, 'SCENARIO_SCREENING_LEVELS', 8)
+        )
+        gis_data = self._get_gis_data()
+
+        baseline = self._overload_profile_on(self._clone_network(), levels, probs)
+
+        results = []
+        failed = []
+        for candidate in candidates:
+            net = self._clone_network()
+            injection = self._apply_candidate(net, candidate, gis_data)
+            if injection is None or 'error' in injection:
+                failed.append({
+                    'candidate': candidate,
+                    'screened': False,
+                    'rank': None,
+                    'error': (injection or {}).get('error') or f"不支持的方案类型: {candidate.get('type')}"
+                })
+                continue
+            profile = self._overload_profile_on(net, levels, probs)
+            results.append({
+                'candidate': candidate,
+                'screened': True,
+                **profile,
+                'injection': injection
+            })
+
+        results.sort(key=lambda r: (
+            r['overload_probability'],
+            r['violation_probability'],
+            r['expected_overload_excess'],
+            r['non_converged_probability'],
+            r['expected_max_loading_percent'] if r['expected_max_loading_percent'] is not None else float('inf')
+        ))
+        for i, r in enumerate(results):
+            r['rank'] = i + 1
+
+        return {'baseline': baseline, 'candidates': results + failed}
+
+    def _dc_sensitivities(self) -> Dict[str, Any]:
+        """
+        基线网络的直流潮流灵敏度：支路基线潮流、额定容量、PTDF 及母线间戴维南电抗所需的 X 矩阵
+
+        X 为去除平衡节点后的节点电纳矩阵之逆（平衡节点行列补零），均为标幺值
+        """
+        from pandapower.pypower.idx_brch import BR_STATUS, BR_X, F_BUS, PF, RATE_A, T_BUS, TAP
+        from pandapower.pypower.idx_bus import BUS_TYPE, REF, VA
+
+        net = self._clone_network()
+        pp.rundcpp(net)
+        ppc = net._ppc
+        base_mva = float(ppc['baseMVA'])
+        bus, branch = ppc['bus'], ppc['branch']
+        nb = bus.shape[0]
+        f = branch[:, F_BUS].real.astype(int)
+        t = branch[:, T_BUS].real.astype(int)
+        tap = branch[:, TAP].real
+        tap = np.where(tap == 0, 1.0, tap)
+        b = branch[:, BR_STATUS].real / (branch[:, BR_X].real * tap)
+
+        # 支路-节点关联矩阵与节点电纳矩阵
+        A = np.zeros((len(b), nb))
+        A[np.arange(len(b)), f] = 1.0
+        A[np.arange(len(b)), t] = -1.0
+        B = A.T @ (b[:, None] * A)
+        slack = int(np.flatnonzero(bus[:, BUS_TYPE].real == REF)[0])
+        keep = np.arange(nb) != slack
+        X = np.zeros((nb, nb))
+        X[np.ix_(keep, keep)] = np.linalg.inv(B[np.ix_(keep, keep)])
+
+        return {
+            'base_mva': base_mva,
+            'theta': np.deg2rad(bus[:, VA].real),
+            'flow_mw': branch[:, PF].real,
+            'rate_mva': branch[:, RATE_A].real,
+            'ptdf': (b[:, None] * A) @ X,
+            'X': X,
+            'bus_lookup': net._pd2ppc_lookups['bus'],
+            'vn_kv': net.bus['vn_kv'],
+        }
+
+    def new_line_relief(self, candidates: List[Dict[str, Any]], gis_data: Optional[Dict[str, Any]] = None) -> np.ndarray:
+        """
+        新建线路对最重载支路的缓解程度（直流灵敏度估算，不逐个注入求解潮流）
+
+        新线路 k（a→b，电纳 b_k）的潮流 f_k = b_k·(θa-θb) / (1 + b_k·(X_aa+X_bb-2X_ab))，
+        其余支路潮流变化 Δf = -f_k·(PTDF[:,a] - PTDF[:,b])
+
+        Args:
+            candidates: 候选方案列表
+            gis_data: GIS数据（用于按位置确定母线），默认取当前网络摘要
+
+        Returns:
+            长度为 n 的数组：最大支路负载率下降的百分比（0~100）；非新建线路或无法确定母线处为 NaN
+        """
+        gis_data = gis_data if gis_data is not None else self._get_gis_data()
+        relief = np.full(len(candidates), np.nan)
+        rows, a_bus, b_bus, x_ohm, vn_bus = [], [], [], [], []
+        for i, candidate in enumerate(candidates):
+            if candidate.get('type') != 'new_line':
+                continue
+            try:
+                from_bus, to_bus = self._candidate_line_buses(candidate, gis_data)
+                length_km = float(candidate.get('length_km') or candidate.get('distance_to_existing') or 5.0)
+                params = self._line_params(float(candidate.get('voltage_level') or 110))
+            except (TypeError, ValueError):
+                continue
+            rows.append(i)
+            a_bus.append(from_bus)
+            b_bus.append(to_bus)
+            x_ohm.append(params['x_ohm_per_km'] * length_km)
+            vn_bus.append(from_bus)
+        if not rows:
+            return relief
+
+        sens = self._dc_sensitivities()
+        lookup = sens['bus_lookup']
+        a = lookup[np.asarray(a_bus)]
+        b = lookup[np.asarray(b_bus)]
+        # 线路电抗折算为标幺值（按起点母线额定电压）
+        vn_kv = sens['vn_kv'].loc[np.asarray(vn_bus)].to_numpy(dtype=float)
+        b_k = 1.0 / (np.asarray(x_ohm) * sens['base_mva'] / vn_kv ** 2)
+
+        theta, X, ptdf = sens['theta'], sens['X'], sens['ptdf']
+        thevenin = X[a, a] + X[b, b] - 2 * X[a, b]
+        f_k = b_k * (theta[a] - theta[b]) / (1.0 + b_k * thevenin)
+        flows = sens['flow_mw'][:, None] - (ptdf[:, a] - ptdf[:, b]) * f_k * sens['base_mva']
+
+        rated = sens['rate_mva'] > 0
+        base_peak = np.max(np.abs(sens['flow_mw'][rated]) / sens['rate_mva'][rated])
+        new_peak = np.max(np.abs(flows[rated]) / sens['rate_mva'][rated, None], axis=0)
+        if base_peak > 0:
+            relief[rows] = np.clip(100.0 * (1.0 - new_peak / base_peak), 0.0, 100.0)
+        return relief
+
     def evaluate_candidate_with_power_flow(
         self,
         candidate: Dict[str, Any]
@@ -461,24 +726,8 @@ class PowerFlowAnalysis:
             评估结果
         """
         # 真实校核：克隆基线网络，将候选方案注入，再运行潮流与N-1
-        net = self.network.deepcopy()
-        injection = None
-        try:
-            # 延迟导入以获得GIS坐标
-            from services.gis_service import gis_service  # type: ignore
-            gis_data = gis_service.get_network_summary()
-        except Exception:
-            gis_data = {'substations': []}
-
-        try:
-            if candidate.get('type') == 'new_line':
-                injection = self._inject_new_line(net, candidate, gis_data)
-            elif candidate.get('type') == 'substation_expansion':
-                injection = self._inject_substation_expansion(net, candidate)
-            elif candidate.get('type') == 'new_substation':
-                injection = self._inject_new_substation(net, candidate, gis_data)
-        except Exception as e:
-            injection = {'error': str(e)}
+        net = self._clone_network()
+        injection = self._apply_candidate(net, candidate, self._get_gis_data())
 
         power_flow_results = self._run_power_flow_on(net)
 
@@ -0,0 +1,218 @@
+"""
+提示词构建 - 本地近似分词计数，按 token 预算装填检索排序后的文档片段与压缩后的 JSON 摘要
+"""
+from __future__ import annotations
+
+import json
+import math
+import re
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config import Config
+
+# 近似分词：CJK 单字、连续字母、连续数字、其余单个非空白符号
+_CJK = r"\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff"
+_TOKEN_PIECES = re.compile(rf"[{_CJK}]|[A-Za-z]+|\d+|[^\sA-Za-z\d{_CJK}]")
+
+# 逐级压缩 JSON 的参数：(列表保留项数, 字符串保留字数, 浮点小数位)
+_SHRINK_LEVELS = (
+    (None, None, 4),
+    (20, 400, 3),
+    (10, 200, 3),
+    (5, 100, 2),
+    (3, 60, 2),
+    (1, 30, 1),
+)
+
+
+def count_tokens(text: str) -> int:
+    """
+    近似 token 数（按 Qwen 等 BPE 分词器的经验比例，偏保守）
+
+    CJK 字符各计 1；英文单词每 4 个字母计 1；数字每 3 位计 1；标点等符号各计 1
+    """
+    n = 0
+    for piece in _TOKEN_PIECES.findall(text or ''):
+        c = piece[0]
+        if c.isascii() and c.isalpha():
+            n += math.ceil(len(piece) / 4)
+        elif c.isascii() and c.isdigit():
+            n += math.ceil(len(piece) / 3)
+        else:
+            n += 1
+    return n
+
+
+def count_message_tokens(messages: Sequence[Dict[str, Any]]) -> int:
+    """聊天消息列表的近似 token 数（每条消息另计角色与分隔开销）"""
+    return sum(count_tokens(str(m.get('content') or '')) + 4 for m in messages) + 2
+
+
+def truncate_to_tokens(text: str, budget: int) -> str:
+    """按 token 预算截断文本（二分查找字符长度）"""
+    if count_tokens(text) <= budget:
+        return text
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if count_tokens(text[:mid]) <= budget:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo]
+
+
+def _shrink(obj: Any, max_items: Optional[int], max_chars: Optional[int], ndigits: int) -> Any:
+    if isinstance(obj, dict):
+        return {k: _shrink(v, max_items, max_chars, ndigits) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        items = [_shrink(v, max_items, max_chars, ndigits) for v in obj[:max_items]]
+        if max_items is not None and len(obj) > max_items:
+            items.append(f"...(共{len(obj)}项)")
+        return items
+    if isinstance(obj, float):
+        return round(obj, ndigits)
+    if isinstance(obj, str) and max_chars is not None and len(obj) > max_chars:
+        return obj[:max_chars] + "…"
+    return obj
+
+
+def _dumps(obj: Any) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'), default=str)
+
+
+def _with_omitted(obj: Any, kept: int, last: Any = None) -> Any:
+    """保留容器前 kept 项（last 不为 None 时追加为裁剪后的下一项），其余以省略标记代替"""
+    items = list(obj.items()) if isinstance(obj, dict) else list(obj)
+    head = items[:kept]
+    if last is not None:
+        head.append((items[kept][0], last) if isinstance(obj, dict) else last)
+    omitted = len(items) - len(head)
+    if isinstance(obj, dict):
+        out = dict(head)
+        if omitted:
+            out['…'] = f"省略{omitted}项"
+        return out
+    return head + ([f"...(省略{omitted}项)"] if omitted else [])
+
+
+def _fit_json(obj: Any, budget: int) -> Any:
+    """
+    把对象裁剪到 token 预算内且保持合法 JSON：容器保留前部条目（二分查找条数），
+    下一条递归裁剪后尽量放入，其余以省略标记代替；标量或空容器仍超出时返回 None
+    """
+    if count_tokens(_dumps(obj)) <= budget:
+        return obj
+    if not isinstance(obj, (dict, list)) or not obj:
+        return None
+    lo, hi = 0, len(obj) - 1
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if count_tokens(_dumps(_with_omitted(obj, mid))) <= budget:
+            lo = mid
+        else:
+            hi = mid - 1
+    best = _with_omitted(obj, lo)
+    used = count_tokens(_dumps(best))
+    if used > budget:
+        return None
+    # 下一条裁剪后放入剩余预算（放入后省略数减少一项，开销按最坏情况留出）
+    nxt = list(obj.values())[lo] if isinstance(obj, dict) else obj[lo]
+    if isinstance(nxt, (dict, list)) and nxt:
+        part = _fit_json(nxt, budget - used - 4)
+        if part is not None:
+            candidate = _with_omitted(obj, lo, part)
+            if count_tokens(_dumps(candidate)) <= budget:
+                return candidate
+    return best
+
+
+class PromptBuilder:
+    """按 token 预算组装 LLM 提示词内容"""
+
+    def __init__(self, doc_budget: int = 2000, summary_budget: int = 400):
+        self.doc_budget = doc_budget
+        self.summary_budget = summary_budget
+
+    def pack_document(
+        self,
+        text: str,
+        queries: Sequence[str],
+        budget: Optional[int] = None
+    ) -> Tuple[str, Dict[str, Any]]:
+        """
+        装填文档片段：未超预算时原文返回，否则按与查询的相关度贪心选入chunk，再按原文顺序拼接
+
+        Args:
+            text: 文档文本
+            queries: 检索查询（如 CONSTRAINT_QUERIES）
+            budget: token 预算（默认 doc_budget）
+
+        Returns:
+            (装填后的文本, {'tokens', 'budget', 'source_tokens', 'chunks_total', 'chunks_used'})
+        """
+        from services.doc_ingest import get_chunk_matrix
+
+        budget = budget or self.doc_budget
+        source_tokens = count_tokens(text)
+        info = {'tokens': source_tokens, 'budget': budget, 'source_tokens': source_tokens,
+                'chunks_total': None, 'chunks_used': None}
+        if source_tokens <= budget:
+            return text, info
+
+        cm = get_chunk_matrix(text)
+        if cm is None:
+            packed = truncate_to_tokens(text, budget)
+            info['tokens'] = count_tokens(packed)
+            return packed, info
+
+        # 每个chunk取对各查询相似度的最大值作为价值
+        value = cm.scores(queries).max(axis=1)
+        chunk_tokens = [count_tokens(c) for c in cm.chunks]
+        chosen: List[int] = []
+        remaining = budget
+        for i in np.argsort(-value, kind='stable'):
+            cost = chunk_tokens[i] + 2  # 片段分隔开销
+            if cost <= remaining:
+                chosen.append(int(i))
+                remaining -= cost
+        if not chosen:
+            # 单个chunk就超出预算：截断最相关的那个
+            best = int(np.argmax(value))
+            parts = [truncate_to_tokens(cm.chunks[best], budget - 2)]
+        else:
+            parts = [cm.chunks[i] for i in sorted(chosen)]
+        packed = "\n…\n".join(parts)
+        info.update(tokens=count_tokens(packed), chunks_total=len(cm.chunks), chunks_used=max(len(chosen), 1))
+        return packed, info
+
+    def compact_json(self, obj: Any, budget: Optional[int] = None) -> str:
+        """
+        紧凑序列化 JSON 摘要：超预算时逐级缩短列表/字符串、降低浮点精度，
+        仍超出则丢弃容器尾部条目（以省略标记说明），始终返回合法 JSON
+
+        Args:
+            obj: 待序列化对象
+            budget: token 预算（默认 summary_budget）
+
+        Returns:
+            不超过预算的 JSON 文本；什么都放不下时返回省略说明对象（预算过小时为 {}）
+        """
+        budget = budget or self.summary_budget
+        shrunk = obj
+        for max_items, max_chars, ndigits in _SHRINK_LEVELS:
+            shrunk = _shrink(obj, max_items, max_chars, ndigits)
+            text = _dumps(shrunk)
+            if count_tokens(text) <= budget:
+                return text
+        fitted = _fit_json(json.loads(_dumps(shrunk)), budget)
+        if fitted is not None:
+            return _dumps(fitted)
+        summary = _dumps({'…': '超出预算已省略'})
+        return summary if count_tokens(summary) <= budget else '{}'
+
+
+# 全局实例
+prompt_builder = PromptBuilder(Config.PROMPT_DOC_TOKEN_BUDGET, Config.PROMPT_SUMMARY_TOKEN_BUDGET)
@@ -1,12 +1,31 @@
 """
-文档检索服务 - 使用向量数据库进行文档检索
+文档检索服务 - chunk级稀疏倒排索引（BM25）+ 稠密向量（IVF）混合检索
 """
 import os
-import json
 from typing import List, Dict, Any, Optional
 import numpy as np
 from pathlib import Path
-import pickle
+import threading
+import time
+
+from config import Config
+from services.doc_ingest import split_into_chunks
+from services.sparse_index import BM25Index, top_k_indices
+from services.dense_index import EmbeddingCache, IVFIndex, content_hash, get_embedder
+from services.vector_store import TextStore, VectorStore
+
+# 索引格式版本：3 = chunk级BM25倒排索引（哈希词表，支持增量）
+# 4 = 目录格式（.npy + 文本块 + JSON 元数据，启动时 mmap 映射）
+# 5 = 增加稠密向量段（IVF）与chunk内容哈希
+# 6 = BM25 增量段改为与 main 相同的 词项 × chunk 布局
+# 7 = chunk 内容哈希存为定长字节 V20（S20 会截掉末尾的 0 字节）
+INDEX_VERSION = 7
+
+# 以 mmap 只读方式打开的数组：main 段倒排表/向量只在查询命中时才被读入
+_MMAP_ARRAYS = (
+    'main_indptr', 'main_indices', 'main_data', 'chunk_doc', 'chunk_id', 'chunk_hash',
+    'dense_main', 'dense_list_ids'
+)
 
 
 class DocumentRetrieval:
@@ -15,13 +34,25 @@ class DocumentRetrieval:
     def __init__(self, documents_dir: str, vector_db_path: str):
         self.documents_dir = documents_dir
         self.vector_db_path = vector_db_path
+        self.store = VectorStore(vector_db_path)
         self.documents = []
-        self.embeddings = []
+        self.doc_text = TextStore()
+        self.chunk_text = TextStore()
+        self.chunk_doc = np.zeros(0, dtype=np.int32)
+        self.chunk_id = np.zeros(0, dtype=np.int32)
+        self.chunk_hash = np.zeros(0, dtype='V20')
+        self.bm25 = None
+        self.dense = None
+        self.embeddings = EmbeddingCache(get_embedder(), Config.EMBEDDING_CACHE_SIZE)
         self.index = None
+        self._lock = threading.RLock()
+        self._save_lock = threading.Lock()
+        self._save_pending = False
+        self._saver = None
 
         # 创建目录
         os.makedirs(documents_dir, exist_ok=True)
-        os.makedirs(os.path.dirname(vector_db_path), exist_ok=True)
+        os.makedirs(vector_db_path, exist_ok=True)
 
         # 加载已有索引
         self.load_index()
@@ -175,97 +206,358 @@ class DocumentRetrieval:
             })
 
     def create_embeddings(self):
-        """创建文档嵌入（简化版，使用TF-IDF）"""
-        from sklearn.feature_extraction.text import TfidfVectorizer
-
+        """创建chunk级稀疏倒排索引（字符n-gram哈希词表 + BM25）"""
         if len(self.documents) == 0:
             self.load_documents()
 
-        # 使用TF-IDF创建向量
-        vectorizer = TfidfVectorizer(max_features=384)
-        texts = [doc['content'] for doc in self.documents]
-        self.embeddings = vectorizer.fit_transform(texts).toarray()
-
-        # 保存向量化器
-        self.vectorizer = vectorizer
+        docs = self.documents
+        chunked = [split_into_chunks(doc['content']) for doc in docs]
+        # 所有chunk合并成批次嵌入（缓存命中的不再请求）
+        all_texts = [t for texts in chunked for t in texts]
+        all_vectors = self.embeddings.embed(all_texts)
+
+        with self._lock:
+            self.bm25 = BM25Index()
+            self.dense = IVFIndex(all_vectors.shape[1], Config.DENSE_NPROBE, Config.DENSE_IVF_MIN_CHUNKS)
+            self.doc_text = TextStore()
+            self.chunk_text = TextStore()
+            self.chunk_doc = np.zeros(0, dtype=np.int32)
+            self.chunk_id = np.zeros(0, dtype=np.int32)
+            self.chunk_hash = np.zeros(0, dtype='V20')
+            self.documents = []
+            start = 0
+            for doc, texts in zip(docs, chunked):
+                self._index_document(doc, texts, all_vectors[start:start + len(texts)])
+                start += len(texts)
+            self.bm25.compact()
+            self.dense.compact()
+
+    def _chunk_document(self, content: str, texts: Optional[List[str]] = None):
+        """切块并计算嵌入（不持锁，远程嵌入请求不阻塞检索）"""
+        texts = texts if texts is not None else split_into_chunks(content)
+        return texts, self.embeddings.embed(texts)
+
+    def _index_document(self, doc: Dict[str, Any], texts: List[str], vectors: np.ndarray) -> int:
+        """追加文档的chunk到稀疏/稠密索引增量段，返回chunk数（调用方持有锁）"""
+        doc_idx = len(self.documents)
+        self.documents.append({k: v for k, v in doc.items() if k != 'content'})
+        self.doc_text.extend([doc['content']])
+        self.bm25.add(texts)
+        self.dense.add(vectors)
+        self.chunk_text.extend(texts)
+        self.chunk_doc = np.concatenate([self.chunk_doc, np.full(len(texts), doc_idx, dtype=np.int32)])
+        self.chunk_id = np.concatenate([self.chunk_id, np.arange(len(texts), dtype=np.int32)])
+        self.chunk_hash = np.concatenate([self.chunk_hash, np.array([content_hash(t) for t in texts], dtype='V20')])
+        return len(texts)
+
+    def _find_document(self, path: str) -> Optional[int]:
+        for i, doc in enumerate(self.documents):
+            if doc['path'] == path and not doc.get('deleted'):
+                return i
+        return None
+
+    def add_document(self, path: str, content: str, filename: Optional[str] = None,
+                     chunks: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        增量添加（或替换）一个文档，立即可检索
 
-    def build_index(self):
-        """构建向量索引"""
-        if len(self.embeddings) == 0:
-            self.create_embeddings()
+        Args:
+            path: 文档路径（作为文档唯一标识）
+            content: 文档文本
+            filename: 显示用文件名
+            chunks: 已切好的chunk（摄取流水线流式切块时传入，省去再次切块）
 
-        # 简单的向量索引（实际应用中可以使用FAISS）
+        Returns:
+            {'filename', 'chunks'}
+        """
+        if self.bm25 is None:
+            self.build_index()
+        filename = filename or os.path.basename(path)
+        texts, vectors = self._chunk_document(content, chunks)
+        with self._lock:
+            old = self._find_document(path)
+            if old is not None:
+                self._remove_document_at(old)
+            n_chunks = self._index_document({
+                'path': path,
+                'filename': filename,
+                'content': content,
+                'type': self._get_document_type(filename)
+            }, texts, vectors)
+            self._refresh_index_meta()
+        self._schedule_save()
+        return {'filename': filename, 'chunks': n_chunks}
+
+    def _remove_document_at(self, doc_idx: int) -> int:
+        self.documents[doc_idx]['deleted'] = True
+        ids = np.flatnonzero(self.chunk_doc == doc_idx)
+        self.dense.remove(ids)
+        return self.bm25.remove(ids)
+
+    def remove_document(self, path: str) -> bool:
+        """从索引中删除文档（墓碑标记，后台压缩时物理移除）"""
+        if self.bm25 is None:
+            self.build_index()
+        with self._lock:
+            doc_idx = self._find_document(path)
+            if doc_idx is None:
+                return False
+            self._remove_document_at(doc_idx)
+            self._refresh_index_meta()
+        self._schedule_save()
+        return True
+
+    def sync_with_disk(self) -> Dict[str, int]:
+        """与文档目录对齐：索引新出现的txt，删除已不存在的文档"""
+        on_disk = {str(p) for p in Path(self.documents_dir).rglob('*.txt')}
+        with self._lock:
+            indexed = {d['path'] for d in self.documents if not d.get('deleted')}
+        added = removed = 0
+        for path in sorted(on_disk - indexed):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.add_document(path, f.read())
+            added += 1
+        for path in sorted(indexed - on_disk):
+            if self.remove_document(path):
+                removed += 1
+        return {'added': added, 'removed': removed}
+
+    def _needs_compact(self) -> bool:
+        """墓碑比例或增量段超过阈值（调用方持有锁）"""
+        bm25 = self.bm25
+        n = max(bm25.n_chunks, 1)
+        return (
+            bm25.n_deleted / n > Config.INDEX_COMPACT_DELETED_RATIO or
+            bm25.n_delta > Config.INDEX_COMPACT_DELTA_CHUNKS
+        )
+
+    def _schedule_save(self):
+        """标记索引待保存；由单个后台线程延迟合并写盘，不为每次增删单独起线程"""
+        with self._lock:
+            self._save_pending = True
+            if self._saver is not None:
+                return
+            self._saver = threading.Thread(target=self._save_worker, daemon=True)
+            self._saver.start()
+
+    def _save_worker(self):
+        """等待变更平息后保存一代索引（超过阈值时先压缩），直到没有新的变更"""
+        while True:
+            time.sleep(Config.INDEX_SAVE_DELAY_SECONDS)
+            with self._lock:
+                if not self._save_pending:
+                    self._saver = None
+                    return
+                self._save_pending = False
+                need_compact = self._needs_compact()
+            try:
+                if need_compact:
+                    self.compact()
+                self.save_index()
+            except Exception as e:
+                print(f"保存索引失败: {e}")
+
+    def compact(self):
+        """压缩索引：合并增量段，物理移除已删除的文档与chunk"""
+        with self._lock:
+            keep = self.bm25.compact()
+            self.dense.compact(keep)
+            live_docs = np.array([i for i, d in enumerate(self.documents) if not d.get('deleted')], dtype=np.int64)
+            doc_map = np.full(len(self.documents), -1, dtype=np.int32)
+            doc_map[live_docs] = np.arange(len(live_docs), dtype=np.int32)
+            self.documents = [self.documents[i] for i in live_docs]
+            self.doc_text.select(live_docs)
+            self.chunk_text.select(keep)
+            self.chunk_doc = doc_map[np.asarray(self.chunk_doc)[keep]]
+            self.chunk_id = np.asarray(self.chunk_id)[keep]
+            self.chunk_hash = np.asarray(self.chunk_hash)[keep]
+            self._refresh_index_meta()
+
+    def _refresh_index_meta(self):
         self.index = {
-            'embeddings': self.embeddings,
-            'documents': self.documents
+            'version': INDEX_VERSION,
+            'n_documents': len(self.documents),
+            'n_chunks': len(self.chunk_doc)
         }
 
-        # 保存索引
-        self.save_index()
+    def build_index(self):
+        """构建检索索引；已有索引时仅与文档目录做增量同步"""
+        if self.bm25 is None:
+            self.create_embeddings()
+            with self._lock:
+                self._refresh_index_meta()
+            # 保存索引
+            self.save_index()
+        else:
+            self.sync_with_disk()
 
     def save_index(self):
-        """保存索引到文件"""
-        with open(self.vector_db_path, 'wb') as f:
-            pickle.dump({
-                'index': self.index,
-                'vectorizer': self.vectorizer
-            }, f)
+        """保存索引为新的一代目录（写完后原子切换 CURRENT，读者不会看到半写状态）"""
+        with self._save_lock:
+            with self._lock:
+                meta = {
+                    'index_version': INDEX_VERSION,
+                    'bm25': self.bm25.params(),
+                    'dense': {**self.dense.params(), 'model': self.embeddings.model},
+                    'documents': [dict(d) for d in self.documents]
+                }
+                arrays = {
+                    **self.bm25.to_arrays(),
+                    **self.dense.to_arrays(),
+                    'chunk_doc': np.array(self.chunk_doc),
+                    'chunk_id': np.array(self.chunk_id),
+                    'chunk_hash': np.array(self.chunk_hash)
+                }
+                texts = {'doc_text': self.doc_text.snapshot(), 'chunk_text': self.chunk_text.snapshot()}
+            self.store.save(meta, arrays, texts)
 
     def load_index(self):
-        """加载索引"""
-        if os.path.exists(self.vector_db_path):
-            try:
-                with open(self.vector_db_path, 'rb') as f:
-                    data = pickle.load(f)
-                    self.index = data['index']
-                    self.vectorizer = data['vectorizer']
-                    self.documents = self.index['documents']
-                    self.embeddings = self.index['embeddings']
-                return True
-            except Exception as e:
-                print(f"加载索引失败: {e}")
+        """映射磁盘索引（旧版 pickle 索引不再读取，启动时重建）"""
+        try:
+            loaded = self.store.load(mmap_arrays=_MMAP_ARRAYS)
+            if loaded is None:
+                return False
+            meta, arrays, texts = loaded
+            if meta.get('index_version') != INDEX_VERSION:
+                return False
+            with self._lock:
+                self.bm25 = BM25Index.from_arrays(meta['bm25'], arrays)
+                self.documents = meta['documents']
+                self.doc_text = texts['doc_text']
+                self.chunk_text = texts['chunk_text']
+                self.chunk_doc = arrays['chunk_doc']
+                self.chunk_id = arrays['chunk_id']
+                self.chunk_hash = arrays['chunk_hash']
+                if meta['dense'].get('model') == self.embeddings.model:
+                    self.dense = IVFIndex.from_arrays(meta['dense'], arrays)
+                    self.embeddings.attach(self.chunk_hash[:self.dense.n_main], self.dense.main)
+                else:
+                    # 嵌入模型已更换：稀疏索引照常使用，向量按chunk文本重新嵌入
+                    self._rebuild_dense()
+                self._refresh_index_meta()
+            return True
+        except Exception as e:
+            print(f"加载索引失败: {e}")
         return False
 
-    def search(self, query: str, top_k: int = 3) -> List[Dict[str, Any]]:
+    def _rebuild_dense(self):
+        vectors = self.embeddings.embed([self.chunk_text.get(i) for i in range(len(self.chunk_text))])
+        self.dense = IVFIndex(vectors.shape[1], Config.DENSE_NPROBE, Config.DENSE_IVF_MIN_CHUNKS)
+        self.dense.add(vectors)
+        # 保持与稀疏索引相同的下标与墓碑
+        self.dense.compact(np.arange(self.dense.n_vectors))
+        self.dense.alive = self.bm25.alive.copy()
+
+    def _hybrid_search(self, query: str, query_vec: np.ndarray, top_k: int):
         """
-        搜索相关文档
+        BM25 与向量相似度加权融合：两路各召回若干候选，取并集后补齐另一路得分，
+        BM25 分按本次查询最大值归一到 [0, 1]，余弦相似度截断到 [0, 1]（调用方持有锁）
+        """
+        n_cand = max(top_k * Config.HYBRID_CANDIDATES, 20)
+        sparse_scores = self.bm25.score(query)
+        sparse_ids = top_k_indices(sparse_scores, n_cand)
+        sparse_ids = sparse_ids[sparse_scores[sparse_ids] > 0]
+        dense_ids, _ = self.dense.search(query_vec, n_cand)
+        ids = np.union1d(sparse_ids, dense_ids)
+        if len(ids) == 0:
+            return ids, np.zeros(0, dtype=np.float32)
+
+        s = sparse_scores[ids]
+        s = s / s.max() if s.max() > 0 else s
+        d = np.clip(self.dense.similarity(query_vec, ids), 0.0, 1.0)
+        w = Config.HYBRID_DENSE_WEIGHT
+        fused = (1.0 - w) * s + w * d
+        order = top_k_indices(fused, top_k)
+        return ids[order], fused[order]
+
+    def search(self, query: str, top_k: int = 3, mode: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        搜索相关文档片段（chunk级）
 
         Args:
             query: 查询文本
             top_k: 返回前k个结果
+            mode: sparse / dense / hybrid，默认 Config.RETRIEVAL_MODE
 
         Returns:
-            相关文档列表
+            相关片段列表（含所属文档信息，content 为片段文本）
         """
         if self.index is None:
             self.build_index()
+        mode = mode or Config.RETRIEVAL_MODE
+        if mode not in ('sparse', 'dense', 'hybrid'):
+            raise ValueError(f"未知检索模式: {mode}")
+        query_vec = self.embeddings.embed([query])[0] if mode != 'sparse' else None
+
+        with self._lock:
+            if mode == 'sparse':
+                idx, scores = self.bm25.search(query, top_k)
+            elif mode == 'dense':
+                idx, scores = self.dense.search(query_vec, top_k)
+            else:
+                idx, scores = self._hybrid_search(query, query_vec, top_k)
+            hits = [
+                (self.documents[int(self.chunk_doc[i])], int(self.chunk_id[i]), self.chunk_text.get(i), score)
+                for i, score in zip(idx, scores)
+            ]
 
-        # 将查询转换为向量
-        query_vector = self.vectorizer.transform([query]).toarray()[0]
+        results = []
+        for doc, chunk_id, text, score in hits:
+            results.append({
+                'path': doc['path'],
+                'filename': doc['filename'],
+                'type': doc['type'],
+                'chunk_id': chunk_id,
+                'content': text,
+                'score': float(score)
+            })
 
-        # 计算相似度
-        similarities = np.dot(self.embeddings, query_vector)
+        return results
 
-        # 获取top_k结果
-        top_indices = np.argsort(similarities)[-top_k:][::-1]
+    def search_documents(self, query: str, top_k: int = 3, chunks_per_doc: int = 3) -> List[Dict[str, Any]]:
+        """
+        按文档聚合的检索：文档得分取其最佳片段得分，content 为该文档命中的片段（按原文顺序）
 
-        results = []
-        for idx in top_indices:
-            doc = self.documents[idx].copy()
-            doc['score'] = float(similarities[idx])
-            results.append(doc)
+        Args:
+            query: 查询文本
+            top_k: 返回前k个文档
+            chunks_per_doc: 每个文档最多保留的片段数
 
-        return results
+        Returns:
+            相关文档列表
+        """
+        hits = self.search(query, top_k=top_k * chunks_per_doc * 4)
+        grouped: Dict[str, Dict[str, Any]] = {}
+        for hit in hits:
+            g = grouped.setdefault(hit['path'], {
+                'path': hit['path'],
+                'filename': hit['filename'],
+                'type': hit['type'],
+                'score': hit['score'],
+                'chunks': []
+            })
+            if len(g['chunks']) < chunks_per_doc:
+                g['chunks'].append((hit['chunk_id'], hit['content']))
+
+        docs = sorted(grouped.values(), key=lambda d: d['score'], reverse=True)[:top_k]
+        for d in docs:
+            d['content'] = "\n".join(text for _, text in sorted(d.pop('chunks')))
+        return docs
 
     def get_all_documents(self) -> List[Dict[str, Any]]:
-        """获取所有文档"""
-        if len(self.documents) == 0:
-            self.load_documents()
-        return self.documents
+        """获取所有文档（正文按需从文本存储读取）"""
+        if self.bm25 is None:
+            if len(self.documents) == 0:
+                self.load_documents()
+            return [d for d in self.documents if not d.get('deleted')]
+        with self._lock:
+            return [
+                {**d, 'content': self.doc_text.get(i)}
+                for i, d in enumerate(self.documents) if not d.get('deleted')
+            ]
 
 
 # 初始化检索系统
-from config import Config
 retrieval_service = DocumentRetrieval(
     Config.DOCUMENTS_DIR,
     Config.VECTOR_DB_PATH
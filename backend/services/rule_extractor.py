@@ -0,0 +1,375 @@
+"""
+确定性约束规则抽取 - 预编译正则识别电压偏差/负载率/距离/N-1/容量/可靠性等条款，
+输出与 LLM parse_constraints 相同的 JSON 结构；识别不了的约束性条款留给 LLM 补充
+"""
+from __future__ import annotations
+
+import copy
+import re
+import time
+import unicodedata
+from typing import Any, Callable, Dict, List, Optional
+
+# ---- 分句 ----
+# 句末标点 / 空行 / 下一行以条款编号开头（1. / 4.1 / (1) / 一、 / 第X章）时断句
+_CLAUSE_BREAK = re.compile(
+    r"[。；;！？!?]|\n\s*\n|\n(?=\s*(?:\d+(?:\.\d+)*[.、)）]?\s|[(（]\d+[)）]|[一二三四五六七八九十]+、"
+    r"|第[一二三四五六七八九十百零\d]+[章节条]))"
+)
+# 不短于该字数且以文字结尾的行、或以逗号/冒号结尾的行视为未完（PDF 排版折行），与下一行拼接
+_WRAP_MIN_CHARS = 20
+_CONTINUATION_PUNCT = set("，,、：:")
+# 行尾为公式编号/引导点（“×100%......(1)”）、页码或句末标点时该行已完整
+_LINE_COMPLETE = re.compile(r"(?:\.{3,}|…{2,})\s*(?:[(（]\d+[)）])?$|[(（]\d+[)）]$|^\d+$|[。；;！？!?.)）]$")
+_ITEM_PREFIX = re.compile(
+    r"^\s*(?:\d+(?:\.\d+)*[.、)）]?\s+|[(（]\d+[)）]\s*|[一二三四五六七八九十]+、\s*|第[一二三四五六七八九十百零\d]+条\s*)"
+)
+
+# ---- 数值 ----
+_PERCENT = re.compile(r"([±+\-−]?)\s*(\d+(?:\.\d+)?)\s*%")
+_VOLTAGE_LEVEL = re.compile(r"(\d+(?:\.\d+)?)\s*(kV|V)(?![A-Za-z])\s*(及以上|及以下|以上|以下)?", re.I)
+_LENGTH = re.compile(r"(\d+(?:\.\d+)?)\s*(km|公里|千米|m|米)(?![A-Za-z²/])", re.I)
+_UNIT_CAPACITY = re.compile(r"(\d+)\s*[×xX*]\s*(\d+(?:\.\d+)?)\s*(MVA|kVA|MW)", re.I)
+_RANGE = re.compile(r"(\d+(?:\.\d+)?)\s*[~～\-—至到]\s*(\d+(?:\.\d+)?)")
+
+# ---- 条款类别 ----
+_VOLTAGE_DEVIATION = re.compile(r"电压[^，,]{0,12}?(?:偏差|偏移)|(?:偏差|偏移)[^，,]{0,6}电压")
+# 计算公式与仪器测量误差条款中的百分数不是偏差限值
+_FORMULA = re.compile(r"[=×]|\.{3,}|…{2,}")
+_MEASUREMENT_ERROR = re.compile(r"测量误差|准确度|精度")
+_LOADING = re.compile(r"负载率|负荷率|载流率|负载水平")
+_TRAFO = re.compile(r"主变|变压器")
+_LINE = re.compile(r"线路|导线|电缆|馈线")
+_EMERGENCY = re.compile(r"重载|高峰|紧急|事故|短时")
+_N_MINUS_1 = re.compile(r"N\s*-\s*1(?!\d)", re.I)
+_N_MINUS_1_NEGATED = re.compile(r"(?:不要求|无需|不需|不必|不考虑|可不)[^，,]{0,6}N\s*-\s*1", re.I)
+_DISTANCE = re.compile(r"距离|间距|净距|半径")
+_STATION_SPACING = re.compile(r"(?:变电站|站址|新站)[^，,]{0,10}(?:间距|之间|距离)|站间")
+_CAPACITY = re.compile(r"容量")
+_RESERVE = re.compile(r"备用|裕度")
+_CAPACITY_RATIO = re.compile(r"容载比")
+_RELIABILITY = re.compile(r"供电可靠(?:性|率)|可靠率")
+_TOPOLOGY = re.compile(r"环网|双回|单回|辐射|双电源|手拉手|联络|分段|接线")
+
+# ---- 约束方向 ----
+_UPPER = re.compile(r"不超过|不大于|不高于|不应超过|不宜超过|不得超过|≤|<=|以内|上限|控制在|最大")
+_LOWER = re.compile(r"不低于|不小于|不少于|不应小于|不宜小于|不得小于|≥|>=|下限|最小|(?<!及)以上")
+# 约束性措辞：未被任何规则识别、但含这些措辞的条款才交给 LLM
+_NORMATIVE = re.compile(
+    r"(?<![供适响对反效相感])应|宜|须|不得|严禁|禁止|不超过|不低于|不小于|不大于|不高于|不少于"
+    r"|满足|≤|≥|<=|>=|限值|上限|下限"
+)
+
+
+def split_clauses(text: str) -> List[str]:
+    """
+    把文档切成条款（NFKC 归一化全角字符，合并排版折行，去掉条款编号）
+
+    Args:
+        text: 文档文本
+
+    Returns:
+        非空条款列表
+    """
+    text = unicodedata.normalize('NFKC', text or '').replace('\r', '')
+    clauses = []
+    for part in _CLAUSE_BREAK.split(text):
+        for clause in _join_wrapped_lines(part.split('\n')):
+            clause = _ITEM_PREFIX.sub("", clause).strip(" ：:，,")
+            if clause:
+                clauses.append(clause)
+    return clauses
+
+
+def _join_wrapped_lines(lines: List[str]) -> List[str]:
+    """
+    以逗号/冒号结尾、或较长且未以公式编号/句末标点收尾的行视为排版折行，与下一行拼接；
+    短行（如逐行列出的条目）、公式行、页码行各自成句；下一行以条款编号开头时不拼接
+    """
+    out: List[str] = []
+    buf = ''
+    for line in (ln.strip() for ln in lines):
+        if not line:
+            continue
+        if buf and _ITEM_PREFIX.match(line):
+            out.append(buf)
+            buf = ''
+        buf += line
+        wrapped = line[-1] in _CONTINUATION_PUNCT or (
+            len(line) >= _WRAP_MIN_CHARS and not _LINE_COMPLETE.search(line)
+        )
+        if not wrapped:
+            out.append(buf)
+            buf = ''
+    if buf:
+        out.append(buf)
+    return out
+
+
+def _ratio(num: str) -> float:
+    return round(float(num) / 100.0, 6)
+
+
+def _voltage_level(clause: str) -> str:
+    """条款中的电压等级，统一以 kV 表示（220V -> 0.22kV），保留“及以上/及以下”"""
+    m = _VOLTAGE_LEVEL.search(clause)
+    if not m:
+        return ''
+    kv = float(m.group(1)) if m.group(2).lower() == 'kv' else float(m.group(1)) / 1000.0
+    return f"{kv:g}kV{m.group(3) or ''}"
+
+
+def _fmt_percent(v: float) -> str:
+    return f"{v * 100:g}%"
+
+
+def empty_result() -> Dict[str, Any]:
+    """与 LLM 解析输出一致的空结构"""
+    return {
+        'voltage_constraints': [],
+        'capacity_constraints': [],
+        'distance_constraints': [],
+        'topology_rules': [],
+        'safety_requirements': [],
+        'explanations': {},
+    }
+
+
+class RuleExtractor:
+    """
+    确定性约束抽取器
+
+    每个条款依次交给各类规则；一个条款可命中多条规则（如 “N-1故障时线路负载率不超过100%”
+    同时给出 N-1 要求与 N-1 负载率上限）。全部规则都未命中、但带约束性措辞的条款记为未解析。
+    """
+
+    def __init__(self):
+        self._rules: List[Callable[[str, Dict[str, Any]], bool]] = [
+            self._voltage_deviation,
+            self._loading,
+            self._n_minus_1,
+            self._distance,
+            self._capacity,
+            self._reliability,
+            self._topology,
+        ]
+
+    @staticmethod
+    def _explain(result: Dict[str, Any], field: str, clause: str):
+        sources = result['explanations'].setdefault(field, [])
+        if clause not in sources:
+            sources.append(clause)
+
+    def _voltage_deviation(self, clause: str, result: Dict[str, Any]) -> bool:
+        if not _VOLTAGE_DEVIATION.search(clause):
+            return False
+        if _FORMULA.search(clause) or _MEASUREMENT_ERROR.search(clause):
+            return False
+        pcts = _PERCENT.findall(clause)
+        # 没有电压等级的偏差条款（如“供电电压偏差的限值”）无法落到具体等级，交给 LLM
+        level = _voltage_level(clause)
+        if not pcts or not level:
+            return False
+        values = [_ratio(num) for _, num in pcts]
+        if '之和' in clause:
+            # “正、负偏差绝对值之和不超过10%” 折算为单侧 ±5%
+            dev = max(values) / 2
+            limit = f"±{_fmt_percent(dev)}"
+        else:
+            dev = max(values)
+            limit = ",".join(f"{sign.replace('−', '-')}{num}%" for sign, num in pcts)
+        result['voltage_constraints'].append({
+            'voltage_level': level,
+            'deviation_limit': limit,
+            'max_deviation': round(dev, 6),
+            'rule': clause,
+        })
+        self._explain(result, 'voltage_constraints', clause)
+        return True
+
+    def _loading(self, clause: str, result: Dict[str, Any]) -> bool:
+        if not _LOADING.search(clause):
+            return False
+        pcts = _PERCENT.findall(clause)
+        if not pcts or (_LOWER.search(clause) and not _UPPER.search(clause)):
+            return False
+        if _TRAFO.search(clause):
+            field = 'trafo_loading'
+        elif _LINE.search(clause):
+            field = 'line_loading'
+        else:
+            return False
+        if _N_MINUS_1.search(clause):
+            key = 'n_minus_1_max_percent'
+        elif _EMERGENCY.search(clause):
+            key = 'emergency_max_percent'
+        else:
+            key = 'max_percent'
+        value = _ratio(pcts[0][1])
+        limits = result.setdefault(field, {})
+        # 同类条款重复出现时取更严格的值
+        limits[key] = min(limits.get(key, value), value)
+        self._explain(result, f"{field}.{key}", clause)
+        return True
+
+    def _n_minus_1(self, clause: str, result: Dict[str, Any]) -> bool:
+        if not _N_MINUS_1.search(clause):
+            return False
+        enabled = not _N_MINUS_1_NEGATED.search(clause)
+        current = result.get('n_minus_1')
+        if current is None:
+            result['n_minus_1'] = {'enabled': enabled, 'rule': clause}
+        elif enabled and not current['enabled']:
+            current.update(enabled=True, rule=clause)
+        self._explain(result, 'n_minus_1', clause)
+        return True
+
+    def _distance(self, clause: str, result: Dict[str, Any]) -> bool:
+        if not _DISTANCE.search(clause):
+            return False
+        m = _LENGTH.search(clause)
+        if not m:
+            return False
+        value, unit = float(m.group(1)), m.group(2).lower()
+        km = value if unit in ('km', '公里', '千米') else value / 1000.0
+        if _LOWER.search(clause):
+            bound = 'min'
+        elif _UPPER.search(clause) or '半径' in clause:
+            bound = 'max'
+        else:
+            # 未写方向的净距（如“与建筑物净距：5米”）按下限处理
+            bound = 'min'
+        item: Dict[str, Any] = {
+            'voltage_level': _voltage_level(clause),
+            f'{bound}_distance_m': round(km * 1000.0, 3),
+            'rule': clause,
+        }
+        if _STATION_SPACING.search(clause) and not _LINE.search(clause):
+            item[f'{bound}_new_substation_km'] = round(km, 6)
+        result['distance_constraints'].append(item)
+        self._explain(result, 'distance_constraints', clause)
+        return True
+
+    def _capacity(self, clause: str, result: Dict[str, Any]) -> bool:
+        item: Optional[Dict[str, Any]] = None
+        units = _UNIT_CAPACITY.findall(clause)
+        if units and _CAPACITY.search(clause):
+            item = {
+                'voltage_level': _voltage_level(clause),
+                'item': '主变容量',
+                'options': [
+                    {'units': int(n), 'unit_capacity': float(c), 'unit': u, 'total': int(n) * float(c)}
+                    for n, c, u in units
+                ],
+            }
+        elif _CAPACITY_RATIO.search(clause):
+            rng = _RANGE.search(clause[_CAPACITY_RATIO.search(clause).end():])
+            if rng:
+                item = {'voltage_level': _voltage_level(clause), 'item': '容载比',
+                        'min': float(rng.group(1)), 'max': float(rng.group(2))}
+        elif _CAPACITY.search(clause) and _RESERVE.search(clause) and _LOWER.search(clause):
+            pcts = _PERCENT.findall(clause)
+            if pcts:
+                item = {'item': '备用容量', 'min_percent': _ratio(pcts[0][1])}
+        if item is None:
+            return False
+        item['rule'] = clause
+        result['capacity_constraints'].append(item)
+        self._explain(result, 'capacity_constraints', clause)
+        return True
+
+    def _reliability(self, clause: str, result: Dict[str, Any]) -> bool:
+        m = _RELIABILITY.search(clause)
+        if not m:
+            return False
+        pcts = _PERCENT.findall(clause)
+        if not pcts:
+            return False
+        result['safety_requirements'].append({
+            'item': '供电可靠性',
+            'scope': re.split(r"[，,]", clause[:m.start()])[-1].strip(' 的'),
+            'min_percent': _ratio(pcts[0][1]),
+            'rule': clause,
+        })
+        self._explain(result, 'safety_requirements', clause)
+        return True
+
+    def _topology(self, clause: str, result: Dict[str, Any]) -> bool:
+        if not (_TOPOLOGY.search(clause) and _NORMATIVE.search(clause)):
+            return False
+        result['topology_rules'].append({'rule': clause})
+        self._explain(result, 'topology_rules', clause)
+        return True
+
+    def extract(self, text: str) -> Dict[str, Any]:
+        """
+        规则抽取文档中的约束条件
+
+        Args:
+            text: 文档文本
+
+        Returns:
+            与 parse_constraints 相同结构的约束；另含 extraction 字段：
+            {'method': 'rules', 'clauses', 'resolved', 'unresolved': [未解析的约束性条款（去重，保持原序）], 'elapsed_ms'}
+        """
+        start = time.perf_counter()
+        result = empty_result()
+        clauses = split_clauses(text)
+        resolved = 0
+        unresolved: List[str] = []
+        for clause in clauses:
+            # 不短路：一个条款可同时命中多条规则
+            hits = [rule(clause, result) for rule in self._rules]
+            if any(hits):
+                resolved += 1
+            elif _NORMATIVE.search(clause) and clause not in unresolved:
+                unresolved.append(clause)
+        result['extraction'] = {
+            'method': 'rules',
+            'clauses': len(clauses),
+            'resolved': resolved,
+            'unresolved': unresolved,
+            'elapsed_ms': round((time.perf_counter() - start) * 1000, 2),
+        }
+        return result
+
+
+def _is_empty(value: Any) -> bool:
+    return value is None or value == {} or value == [] or value == ''
+
+
+def merge_constraints(rules: Dict[str, Any], llm: Any) -> Dict[str, Any]:
+    """
+    合并规则抽取结果与 LLM 对未解析条款的解析结果（规则结果优先，LLM 只补缺）
+
+    Args:
+        rules: RuleExtractor.extract 的输出
+        llm: LLM 输出（parse_json_output 的结果）
+
+    Returns:
+        合并后的约束；extraction.method 记为 'rules+llm'
+    """
+    merged = copy.deepcopy(rules)
+    extraction = merged.setdefault('extraction', {})
+    extraction['method'] = 'rules+llm'
+    if not isinstance(llm, dict):
+        extraction['llm_output'] = llm
+        return merged
+    if llm.get('parsed') is False:
+        extraction['llm_raw_text'] = llm.get('raw_text')
+        return merged
+    for key, value in llm.items():
+        if key == 'extraction':
+            continue
+        current = merged.get(key)
+        if _is_empty(current):
+            merged[key] = value
+        elif isinstance(current, list) and isinstance(value, list):
+            merged[key] = current + value
+        elif isinstance(current, dict) and isinstance(value, dict):
+            merged[key] = {**value, **current}
+    return merged
+
+
+# 全局实例
+rule_extractor = RuleExtractor()
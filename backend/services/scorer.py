@@ -1,13 +1,18 @@
 """
 轻量级评分器 - 融合负载时间序列特征与GIS/拓扑特征
 """
+import hashlib
 import numpy as np
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional, Sequence
 from config import Config
 try:
     from .settings_service import settings  # package import
 except Exception:  # pragma: no cover
     from services.settings_service import settings  # module import
+try:
+    from .scoring_features import feature_store  # package import
+except Exception:  # pragma: no cover
+    from services.scoring_features import feature_store  # module import
 try:
     from ..ml.runtime import MLScorer  # when imported as package
 except Exception:
@@ -16,6 +21,174 @@ except Exception:
     except Exception:
         MLScorer = None  # type: ignore
 
+# 候选类型编码（CandidateTable.type_code）
+TYPE_CODES = {'new_substation': 0, 'substation_expansion': 1, 'new_line': 2}
+TYPE_OTHER = 3
+
+
+def _num(value: Any) -> float:
+    """数值字段转 float；缺失/None/非数值记为 NaN（由各特征按原逻辑代入默认值）"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    return np.nan
+
+
+_PLAIN_NUMERIC = {int, float, type(None)}
+
+
+def _numeric_column(values: Sequence[Any]) -> tuple:
+    """
+    一列原始值转 float64（语义同 _num）
+
+    Returns:
+        (数组, 是否含非数值) ；全为 int/float/None 时整列交给 NumPy 转换（None -> NaN）
+    """
+    if _PLAIN_NUMERIC.issuperset(map(type, values)):
+        return np.array(values, dtype=np.float64).reshape(len(values)), False
+    return np.fromiter(map(_num, values), dtype=np.float64, count=len(values)), True
+
+
+def _factorize(values: Sequence[Any]) -> tuple:
+    """
+    因子化为整数编码（-1 表示缺失或不可哈希）
+
+    Returns:
+        (编码数组, {值: 编码}, 是否含不可哈希值)
+    """
+    index: Dict[Any, int] = {}
+    try:
+        codes = np.fromiter(
+            (-1 if v is None else index.setdefault(v, len(index)) for v in values),
+            dtype=np.int64, count=len(values)
+        )
+        return codes, index, False
+    except TypeError:
+        index = {}
+        codes = np.full(len(values), -1, dtype=np.int64)
+        for i, v in enumerate(values):
+            if v is not None and _hashable(v):
+                codes[i] = index.setdefault(v, len(index))
+        return codes, index, True
+
+
+def _location_columns(values: Sequence[Any]) -> tuple:
+    """坐标字典取 (lat, lon) 两列；非字典或非数值坐标记为 NaN，并返回是否存在此类值"""
+    n = len(values)
+    lat = np.full(n, np.nan)
+    lon = np.full(n, np.nan)
+    present = [i for i, v in enumerate(values) if v is not None]
+    if not present:
+        return lat, lon, False
+    locs = [values[i] for i in present]
+    if not all(isinstance(v, dict) for v in locs):
+        irregular = True
+        locs = [v if isinstance(v, dict) else {} for v in locs]
+    else:
+        irregular = False
+    lat[present], lat_irregular = _numeric_column([v.get('lat') for v in locs])
+    lon[present], lon_irregular = _numeric_column([v.get('lon') for v in locs])
+    return lat, lon, irregular or lat_irregular or lon_irregular
+
+
+class CandidateTable:
+    """
+    候选方案的列式表示：一次性把候选字典转为 NumPy 列，供批量评分
+
+    数值列缺失记为 NaN；substation_id 因子化为整数编码，薄弱节点判断可向量化。
+    摘要（特征列缓存键）只由各列与编码计算，覆盖 NUMERIC_FIELDS、voltage_level、type 与
+    KEY_FIELDS；自定义特征若按原字典读取其它字段，需把字段加入 KEY_FIELDS
+    """
+
+    NUMERIC_FIELDS = (
+        'capacity_mva', 'additional_capacity', 'distance_to_existing', 'length_km', 'estimated_cost_m'
+    )
+    # 特征按原字典读取的标识与坐标字段（ML 评分与线路潮流缓解量用到），参与摘要
+    ID_FIELDS = ('substation_id', 'from_substation_id', 'to_substation_id')
+    LOCATION_FIELDS = ('location', 'from_location', 'to_location')
+    KEY_FIELDS = ID_FIELDS + LOCATION_FIELDS
+
+    def __init__(self, candidates: List[Dict[str, Any]]):
+        self.candidates = candidates
+        self.n = n = len(candidates)
+        fields = ('type', *self.NUMERIC_FIELDS, *self.KEY_FIELDS)
+        # 单次遍历取出全部字段再按列转置；电压等级缺失按 110kV，显式的 None/非数值为 NaN
+        rows = [(*map(c.get, fields), c.get('voltage_level', 110)) for c in candidates]
+        raw = dict(zip((*fields, 'voltage_level'), zip(*rows))) if n else {}
+        empty: tuple = ()
+
+        self.type_code = np.fromiter(
+            (TYPE_CODES.get(t, TYPE_OTHER) for t in raw.get('type', empty)), dtype=np.int8, count=n
+        )
+        self.columns: Dict[str, np.ndarray] = {}
+        # 含非数值原始值的字段：列中记为 NaN，但特征可能按原值解析，摘要需区分
+        self._irregular: List[str] = []
+        for f in (*self.NUMERIC_FIELDS, 'voltage_level'):
+            self.columns[f], irregular = _numeric_column(raw.get(f, empty))
+            if irregular:
+                self._irregular.append(f)
+
+        self._key_codes: Dict[str, np.ndarray] = {}
+        self._key_index: Dict[str, Dict[Any, int]] = {}
+        for f in self.ID_FIELDS:
+            self._key_codes[f], self._key_index[f], irregular = _factorize(raw.get(f, empty))
+            if irregular:
+                self._irregular.append(f)
+        self._locations: Dict[str, tuple] = {}
+        for f in self.LOCATION_FIELDS:
+            lat, lon, irregular = _location_columns(raw.get(f, empty))
+            self._locations[f] = (lat, lon)
+            if irregular:
+                self._irregular.append(f)
+
+        # substation_id 因子化（-1 表示缺失或不可哈希）
+        self._sub_codes = self._key_index['substation_id']
+        self.substation_code = self._key_codes['substation_id']
+        self._digest: Optional[str] = None
+
+    @property
+    def digest(self) -> str:
+        """候选集内容摘要（特征列缓存键），首次访问时由各列的字节与编码表计算"""
+        if self._digest is None:
+            h = hashlib.blake2b(digest_size=16)
+            h.update(np.int64(self.n).tobytes())
+            h.update(self.type_code.tobytes())
+            for f in (*self.NUMERIC_FIELDS, 'voltage_level'):
+                h.update(self.columns[f].tobytes())
+            for f in self.ID_FIELDS:
+                h.update(self._key_codes[f].tobytes())
+                h.update(repr(list(self._key_index[f])).encode('utf-8'))
+            for f in self.LOCATION_FIELDS:
+                for col in self._locations[f]:
+                    h.update(col.tobytes())
+            # 少见的非数值/不可哈希原始值无法由列区分，退回对该字段原值的 repr
+            for f in self._irregular:
+                values = [c.get(f, 110) if f == 'voltage_level' else c.get(f) for c in self.candidates]
+                h.update(f.encode('utf-8'))
+                h.update(repr(values).encode('utf-8'))
+            self._digest = h.hexdigest()
+        return self._digest
+
+    def col(self, name: str, default: float) -> np.ndarray:
+        """数值列，缺失处代入默认值"""
+        x = self.columns[name]
+        return np.where(np.isnan(x), default, x)
+
+    def mask(self, type_name: str) -> np.ndarray:
+        return self.type_code == TYPE_CODES[type_name]
+
+    def substation_in(self, ids) -> np.ndarray:
+        """substation_id 是否属于给定集合"""
+        wanted = [self._sub_codes[i] for i in ids if _hashable(i) and i in self._sub_codes]
+        return np.isin(self.substation_code, wanted)
+
+
+def _hashable(x: Any) -> bool:
+    try:
+        hash(x)
+        return True
+    except TypeError:
+        return False
+
 
 class CandidateScorer:
     """候选方案评分器"""
@@ -280,6 +453,114 @@ class CandidateScorer:
             }
         }
 
+    def feature_names(self) -> List[str]:
+        """参与评分的特征：加权求和的各项（SCORER_WEIGHTS 的键）+ 成本效益 + ML（启用时）"""
+        return list(self.weights) + ['cost_efficiency'] + (['ml'] if self.ml is not None else [])
+
+    def feature_columns(
+        self,
+        table: CandidateTable,
+        load_features: Dict[str, Any],
+        gis_data: Dict[str, Any],
+        topology: Dict[str, Any],
+        constraints: Dict[str, Any],
+        names: Optional[Sequence[str]] = None
+    ) -> Dict[str, np.ndarray]:
+        """
+        取特征列（经特征注册表计算并缓存，候选集与依赖版本不变时直接复用）
+
+        Args:
+            table: 候选方案列式表
+            load_features: 负载特征
+            gis_data: GIS数据
+            topology: 拓扑信息
+            constraints: 约束条件
+            names: 特征名，默认 feature_names()
+
+        Returns:
+            {特征名: 长度为 n 的只读数组}
+        """
+        ctx = {
+            'load_features': load_features,
+            'gis_data': gis_data,
+            'topology': topology,
+            'constraints': constraints,
+            'ml': self.ml,
+        }
+        return feature_store.columns(list(names or self.feature_names()), table, ctx)
+
+    def sweep(self, columns: Dict[str, np.ndarray], weight_sets: Sequence[Dict[str, float]]) -> np.ndarray:
+        """
+        多组权重下的总分（一次矩阵乘法）：规则分 = W × F^T，再乘成本效益系数并融合 ML 分
+
+        Args:
+            columns: 特征列（需含各组权重涉及的特征与 cost_efficiency）
+            weight_sets: 权重字典列表，缺省项按 0 计
+
+        Returns:
+            形状为 (权重组数, n) 的总分矩阵
+        """
+        names = list(dict.fromkeys(k for w in weight_sets for k in w))
+        F = np.column_stack([columns[k] for k in names]) if names else np.zeros((len(columns['cost_efficiency']), 0))
+        W = np.asarray([[float(w.get(k, 0.0)) for k in names] for w in weight_sets], dtype=np.float64).reshape(len(weight_sets), len(names))
+        total = (F @ W.T).T * (0.5 + columns['cost_efficiency'] / 200)
+
+        ml = columns.get('ml')
+        if ml is not None:
+            w = float(getattr(Config, 'ML_SCORE_WEIGHT', 0.3))
+            has_ml = ~np.isnan(ml)
+            total = np.where(has_ml, (1.0 - w) * total + w * np.nan_to_num(ml), total)
+        return total
+
+    def score_batch(
+        self,
+        table: CandidateTable,
+        load_features: Dict[str, Any],
+        gis_data: Dict[str, Any],
+        topology: Dict[str, Any],
+        constraints: Dict[str, Any]
+    ) -> Dict[str, np.ndarray]:
+        """
+        批量评分：特征列由特征注册表按类型掩码做数组运算（逐项与 score_candidate 一致），
+        规则分为特征矩阵与权重向量的乘积
+
+        Args:
+            table: 候选方案列式表
+            load_features: 负载特征
+            gis_data: GIS数据
+            topology: 拓扑信息
+            constraints: 约束条件
+
+        Returns:
+            {特征名: 长度为 n 的数组}，含各加权特征/cost_efficiency/total，
+            启用ML时另含 ml（无ML分处为 NaN）
+        """
+        out = dict(self.feature_columns(table, load_features, gis_data, topology, constraints))
+        out['total'] = self.sweep(out, [self.weights])[0]
+        return out
+
+    @staticmethod
+    def top_k_order(total: np.ndarray, top_k: int) -> np.ndarray:
+        """
+        按总分（保留两位小数）降序取前 k 个下标，同分保持输入顺序（与稳定排序一致）
+
+        argpartition 选出候选后只对这 k 个排序
+        """
+        n = len(total)
+        k = min(top_k, n)
+        if k <= 0:
+            return np.zeros(0, dtype=np.int64)
+        key = np.round(total, 2)
+        if k < n:
+            part = np.argpartition(-key, k - 1)[:k]
+            kth = key[part].min()
+            above = np.flatnonzero(key > kth)
+            ties = np.flatnonzero(key == kth)[:k - len(above)]
+            idx = np.concatenate([above, ties])
+        else:
+            idx = np.arange(n)
+        return idx[np.lexsort((idx, -key[idx]))]
+
     def rank_candidates(
         self,
         candidates: List[Dict[str, Any]],
@@ -306,29 +587,20 @@ class CandidateScorer:
         if top_k is None:
             top_k = Config.TOP_K_CANDIDATES
 
-        # 对每个候选方案评分
-        scored_candidates = []
-        for candidate in candidates:
-            scored = self.score_candidate(
-                candidate,
-                load_features,
-                gis_data,
-                topology,
-                constraints
-            )
-            scored_candidates.append(scored)
-
-        # 按总分排序
-        scored_candidates.sort(
-            key=lambda x: x['scores']['total'],
-            reverse=True
-        )
-
-        # 添加排名
-        for i, candidate in enumerate(scored_candidates):
-            candidate['rank'] = i + 1
-
-        return scored_candidates[:top_k]
+        # 列式批量评分，仅为入选的前 k 个构造结果
+        table = CandidateTable(candidates)
+        columns = self.score_batch(table, load_features, gis_data, topology, constraints)
+        order = self.top_k_order(columns['total'], top_k)
+
+        ranked = []
+        for rank, i in enumerate(order.tolist(), 1):
+            scores = {name: round(float(columns[name][i]), 2) for name in
+                      list(self.weights) + ['cost_efficiency']}
+            if 'ml' in columns and not np.isnan(columns['ml'][i]):
+                scores['ml'] = round(float(columns['ml'][i]), 2)
+            scores['total'] = round(float(columns['total'][i]), 2)
+            ranked.append({'candidate': candidates[i], 'scores': scores, 'rank': rank})
+        return ranked
 
 
 # 全局实例
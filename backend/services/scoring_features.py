@@ -0,0 +1,301 @@
+"""
+评分特征注册表与特征列缓存
+
+每个特征声明计算函数、依赖的上下文输入（负载特征、GIS 数据、拓扑、运行态设置、网络版本、ML 基线）
+以及依赖的其他特征；计算出的特征列按 (特征, 候选集摘要, 各依赖输入的版本/摘要) 缓存，
+调整权重或做消融时只需重算加权和
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+from config import Config
+try:
+    from .settings_service import settings  # package import
+except Exception:  # pragma: no cover
+    from services.settings_service import settings  # module import
+
+# 特征计算函数：(候选列式表, 上下文, 依赖特征列) -> 长度为 n 的数组
+FeatureFn = Callable[[Any, Dict[str, Any], Dict[str, np.ndarray]], np.ndarray]
+
+
+def _digest(obj: Any) -> str:
+    text = json.dumps(obj, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def _network_version(ctx: Dict[str, Any]) -> Tuple[int, int]:
+    from services.gis_service import gis_service
+    from services.power_flow import power_flow
+    return (gis_service.network_version, power_flow.network_version)
+
+
+def _ml_version(ctx: Dict[str, Any]) -> Any:
+    ml = ctx.get('ml')
+    if ml is None or not ml.available():
+        return None
+    # 基线指标后台刷新期间沿用旧值，按实际使用的基线版本区分缓存
+    return (id(ml), ml._base_key)
+
+
+# 上下文输入 -> 其版本/摘要（作为缓存键的一部分）
+CONTEXT_INPUTS: Dict[str, Callable[[Dict[str, Any]], Any]] = {
+    'load_features': lambda ctx: _digest(ctx.get('load_features') or {}),
+    'gis_data': lambda ctx: _digest(ctx.get('gis_data') or {}),
+    'topology': lambda ctx: _digest(ctx.get('topology') or {}),
+    'settings': lambda ctx: settings.version,
+    'network': _network_version,
+    'ml': _ml_version,
+}
+
+
+class ScoringFeature:
+    """评分特征声明"""
+
+    def __init__(
+        self,
+        name: str,
+        compute: FeatureFn,
+        inputs: Sequence[str] = (),
+        depends: Sequence[str] = (),
+        description: str = ''
+    ):
+        unknown = [i for i in inputs if i not in CONTEXT_INPUTS]
+        if unknown:
+            raise ValueError(f'未知的上下文输入: {unknown}')
+        self.name = name
+        self.compute = compute
+        self.inputs = tuple(inputs)
+        self.depends = tuple(depends)
+        self.description = description
+
+
+class FeatureRegistry:
+    """评分特征注册表"""
+
+    def __init__(self):
+        self._features: Dict[str, ScoringFeature] = {}
+
+    def register(
+        self,
+        name: str,
+        inputs: Sequence[str] = (),
+        depends: Sequence[str] = (),
+        description: str = '',
+        replace: bool = False
+    ) -> Callable[[FeatureFn], FeatureFn]:
+        """
+        装饰器：注册特征计算函数
+
+        Args:
+            name: 特征名（与 SCORER_WEIGHTS 的键对应）
+            inputs: 依赖的上下文输入（见 CONTEXT_INPUTS）
+            depends: 依赖的其他特征，计算时以 {名称: 列} 传入
+            description: 说明
+            replace: 是否允许覆盖同名特征
+        """
+        def decorator(fn: FeatureFn) -> FeatureFn:
+            if name in self._features and not replace:
+                raise ValueError(f'评分特征已注册: {name}')
+            self._features[name] = ScoringFeature(name, fn, inputs, depends, description)
+            return fn
+        return decorator
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._features
+
+    def get(self, name: str) -> ScoringFeature:
+        if name not in self._features:
+            raise KeyError(f'未注册的评分特征: {name}')
+        return self._features[name]
+
+    def names(self) -> List[str]:
+        return list(self._features)
+
+    def resolve(self, names: Iterable[str]) -> List[ScoringFeature]:
+        """按依赖关系排序（依赖在前），检测循环依赖"""
+        order: List[ScoringFeature] = []
+        state: Dict[str, int] = {}  # 1=访问中, 2=已完成
+
+        def visit(name: str):
+            if state.get(name) == 2:
+                return
+            if state.get(name) == 1:
+                raise ValueError(f'评分特征存在循环依赖: {name}')
+            state[name] = 1
+            feature = self.get(name)
+            for dep in feature.depends:
+                visit(dep)
+            state[name] = 2
+            order.append(feature)
+
+        for name in names:
+            visit(name)
+        return order
+
+
+class FeatureStore:
+    """特征列缓存（LRU），键为 (特征, 候选集摘要, 依赖输入版本, 依赖特征的键)"""
+
+    def __init__(self, registry: FeatureRegistry, max_columns: int = 64):
+        self.registry = registry
+        self.max_columns = max_columns
+        self._cache: 'OrderedDict[Tuple, np.ndarray]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def columns(self, names: Sequence[str], table: Any, ctx: Dict[str, Any]) -> Dict[str, np.ndarray]:
+        """
+        取特征列：命中缓存直接复用，否则按依赖顺序计算并缓存
+
+        Args:
+            names: 需要的特征名
+            table: 候选方案列式表（CandidateTable）
+            ctx: 上下文（load_features/gis_data/topology/constraints/ml）
+
+        Returns:
+            {特征名: 只读数组}，仅含 names 中的特征
+        """
+        input_keys: Dict[str, Any] = {}
+        keys: Dict[str, Tuple] = {}
+        cols: Dict[str, np.ndarray] = {}
+        for feature in self.registry.resolve(names):
+            for i in feature.inputs:
+                if i not in input_keys:
+                    input_keys[i] = CONTEXT_INPUTS[i](ctx)
+            key = (
+                feature.name,
+                table.digest,
+                tuple(input_keys[i] for i in feature.inputs),
+                tuple(keys[d] for d in feature.depends),
+            )
+            keys[feature.name] = key
+            with self._lock:
+                col = self._cache.get(key)
+                if col is not None:
+                    self._cache.move_to_end(key)
+                    self.hits += 1
+            if col is None:
+                col = np.asarray(
+                    feature.compute(table, ctx, {d: cols[d] for d in feature.depends}), dtype=np.float64
+                )
+                col.setflags(write=False)
+                with self._lock:
+                    self.misses += 1
+                    self._cache[key] = col
+                    while len(self._cache) > self.max_columns:
+                        self._cache.popitem(last=False)
+            cols[feature.name] = col
+        return {name: cols[name] for name in names}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'columns': len(self._cache), 'hits': self.hits, 'misses': self.misses}
+
+
+feature_registry = FeatureRegistry()
+
+
+# ---------------------------------------------------------------------------
+# 内置特征（逐项与 CandidateScorer.calculate_* 一致）
+# ---------------------------------------------------------------------------
+
+@feature_registry.register('load_growth', inputs=('load_features',), description='负载增长得分')
+def _load_growth(table, ctx, deps):
+    growth_rate = (ctx.get('load_features') or {}).get('growth_rate', 0.05)
+    return np.select(
+        [table.mask('new_substation'), table.mask('substation_expansion'), table.mask('new_line')],
+        [
+            np.minimum(100, growth_rate * 1000 + table.col('capacity_mva', 100) / 2),
+            np.minimum(100, growth_rate * 800 + table.col('additional_capacity', 50) / 2),
+            np.minimum(100, growth_rate * 600 + table.col('capacity_mva', 50) / 3),
+        ],
+        default=50.0
+    )
+
+
+@feature_registry.register('distance', description='距离得分（指数衰减；扩容距离为 0 即满分）')
+def _distance(table, ctx, deps):
+    distance = np.select(
+        [table.mask('new_substation'), table.mask('new_line'), table.mask('substation_expansion')],
+        [table.col('distance_to_existing', 10), table.col('length_km', 10), 0.0],
+        default=5.0
+    )
+    return 100 * np.exp(-distance / 10)
+
+
+@feature_registry.register('topology', inputs=('topology',), description='拓扑得分（薄弱节点加分）')
+def _topology(table, ctx, deps):
+    score = np.select(
+        [table.mask('new_substation'), table.mask('new_line'), table.mask('substation_expansion')],
+        [85.0, 75.0, 60.0],
+        default=50.0
+    )
+    score = score + 15 * table.substation_in((ctx.get('topology') or {}).get('weak_nodes', []))
+    return np.minimum(100, score)
+
+
+@feature_registry.register('constraint', inputs=('settings',), description='约束满足得分（运行态设置阈值）')
+def _constraint(table, ctx, deps):
+    is_sub = table.mask('new_substation')
+    is_exp = table.mask('substation_expansion')
+    valid_levels = settings.get('VOLTAGE_LEVELS', Config.VOLTAGE_LEVELS)
+    score = np.full(table.n, 100.0)
+    levels = np.asarray([v for v in valid_levels if isinstance(v, (int, float))], dtype=np.float64)
+    score -= 30 * ~np.isin(table.columns['voltage_level'], levels)
+    cap = np.select([is_sub, is_exp], [table.col('capacity_mva', 0), table.col('additional_capacity', 0)], 0.0)
+    score -= 20 * ((is_sub | is_exp) & (cap < 50))
+    station_distance = table.col('distance_to_existing', 0)
+    min_d = float(settings.get('MIN_NEW_STATION_DISTANCE_KM', 1.0))
+    max_d = float(settings.get('MAX_NEW_STATION_DISTANCE_KM', 25.0))
+    score -= 5 * (is_sub & (station_distance < min_d))
+    score -= 15 * (is_sub & (station_distance >= min_d) & (station_distance > max_d))
+    return np.maximum(0, score)
+
+
+@feature_registry.register('cost_efficiency', description='成本效益（单位容量造价分档）')
+def _cost_efficiency(table, ctx, deps):
+    capacity = np.where(table.mask('substation_expansion'),
+                        table.col('additional_capacity', 0), table.col('capacity_mva', 0))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        unit_cost = table.col('estimated_cost_m', 50) / capacity
+    return np.select(
+        [capacity <= 0, unit_cost < 0.3, unit_cost < 0.5, unit_cost < 0.8],
+        [50.0, 100.0, 90.0, 70.0],
+        default=50.0
+    )
+
+
+@feature_registry.register('ml', inputs=('network', 'gis_data', 'topology', 'ml'), description='ML 评分（无模型或预测失败处为 NaN）')
+def _ml(table, ctx, deps):
+    ml = ctx.get('ml')
+    scores = None
+    if ml is not None:
+        try:
+            scores = ml.score_batch(table.candidates, ctx.get('gis_data') or {}, ctx.get('topology') or {})
+        except Exception:
+            scores = None
+    return np.full(table.n, np.nan) if scores is None else scores
+
+
+@feature_registry.register('line_relief', inputs=('network', 'gis_data'),
+                           description='新建线路对最重载支路的缓解百分比（直流灵敏度；非线路方案为 0）')
+def _line_relief(table, ctx, deps):
+    from services.power_flow import power_flow
+    relief = power_flow.new_line_relief(table.candidates, ctx.get('gis_data'))
+    return np.nan_to_num(relief, nan=0.0)
+
+
+# 全局实例
+feature_store = FeatureStore(feature_registry, Config.SCORER_FEATURE_CACHE_COLUMNS)
@@ -3,7 +3,7 @@
 """
 from __future__ import annotations
 
-from typing import Any, Dict, Optional
+from typing import Any, Callable, Dict, List, Optional
 import re
 
 from config import Config
@@ -15,6 +15,9 @@ class SettingsService:
         self.overrides: Dict[str, Any] = {}
         # 最近一次应用的原始约束（保留可追溯）
         self.last_constraints: Optional[Dict[str, Any]] = None
+        # 覆盖项版本号：每次 apply/reset 递增，依赖阈值的缓存（如 ML 基线指标）据此判断失效
+        self.version = 0
+        self._listeners: List[Callable[[int], None]] = []
 
     def get(self, key: str, default: Any) -> Any:
         return self.overrides.get(key, default)
@@ -22,9 +25,22 @@ class SettingsService:
     def all(self) -> Dict[str, Any]:
         return dict(self.overrides)
 
+    def on_change(self, callback: Callable[[int], None]) -> None:
+        """注册覆盖项变更回调（参数为新版本号）"""
+        self._listeners.append(callback)
+
+    def _bump_version(self) -> None:
+        self.version += 1
+        for callback in list(self._listeners):
+            try:
+                callback(self.version)
+            except Exception:
+                pass
+
     def reset(self) -> Dict[str, Any]:
         self.overrides.clear()
         self.last_constraints = None
+        self._bump_version()
         return self.all()
 
     @staticmethod
@@ -221,6 +237,8 @@ class SettingsService:
             self.overrides['MAX_NEW_STATION_DISTANCE_KM'] = mx
             applied['MAX_NEW_STATION_DISTANCE_KM'] = mx
 
+        if applied:
+            self._bump_version()
         return applied
 
 
@@ -0,0 +1,250 @@
+"""
+稀疏倒排索引 - 字符n-gram分词 + BM25打分（chunk级检索）
+"""
+from __future__ import annotations
+
+import re
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+from scipy import sparse
+
+_SPACE_RE = re.compile(r"\s+")
+
+# 哈希词表维度：固定词表，增量添加文档时无需重新拟合
+N_FEATURES = 2 ** 20
+
+
+def normalize_text(text: str) -> str:
+    """去除空白并转小写；中文按字符切分，空白对n-gram无意义"""
+    return _SPACE_RE.sub("", text or "").lower()
+
+
+def make_vectorizer(ngram_range: Tuple[int, int] = (1, 2)):
+    """字符n-gram哈希词频向量器（无状态，无需拟合）"""
+    from sklearn.feature_extraction.text import HashingVectorizer
+    return HashingVectorizer(
+        analyzer='char',
+        ngram_range=ngram_range,
+        preprocessor=normalize_text,
+        n_features=N_FEATURES,
+        alternate_sign=False,
+        norm=None,
+        dtype=np.float32
+    )
+
+
+def top_k_indices(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """用 argpartition 取前k个下标（按分数降序），避免全量排序"""
+    n = len(scores)
+    if n == 0 or top_k <= 0:
+        return np.zeros(0, dtype=int)
+    if top_k >= n:
+        return np.argsort(scores)[::-1]
+    part = np.argpartition(scores, n - top_k)[n - top_k:]
+    return part[np.argsort(scores[part])[::-1]]
+
+
+class BM25Index:
+    """
+    BM25 倒排索引（支持增量添加与墓碑删除）
+
+    - main: 已合并段，CSR（词项 × chunk）存储原始词频
+    - delta: 增量段，同为 CSR（词项 × chunk），新增chunk按列追加；查询与删除都只做行切片/一次批量切片
+    - alive: 墓碑标记，删除仅置位，compact() 时物理移除
+    BM25 权重在查询时仅对命中词项的倒排表计算。
+    """
+
+    def __init__(self, ngram_range: Tuple[int, int] = (1, 2), k1: float = 1.5, b: float = 0.75):
+        self.ngram_range = ngram_range
+        self.k1 = k1
+        self.b = b
+        self.vectorizer = self._make_vectorizer()
+        self._reset()
+
+    def _reset(self):
+        self.main = sparse.csr_matrix((N_FEATURES, 0), dtype=np.float32)
+        self.delta = sparse.csr_matrix((N_FEATURES, 0), dtype=np.float32)
+        self.doc_freq = np.zeros(N_FEATURES, dtype=np.float32)
+        self.doc_len = np.zeros(0, dtype=np.float32)
+        self.alive = np.zeros(0, dtype=bool)
+        self._prepare()
+
+    def _make_vectorizer(self):
+        return make_vectorizer(self.ngram_range)
+
+    @property
+    def n_chunks(self) -> int:
+        return len(self.alive)
+
+    @property
+    def n_main(self) -> int:
+        return self.main.shape[1]
+
+    @property
+    def n_delta(self) -> int:
+        return self.delta.shape[1]
+
+    @property
+    def n_deleted(self) -> int:
+        return int((~self.alive).sum())
+
+    def fit(self, texts: List[str]) -> 'BM25Index':
+        """对chunk文本全量建立索引"""
+        self._reset()
+        self.add(texts)
+        self.compact()
+        return self
+
+    def add(self, texts: List[str]) -> range:
+        """
+        追加chunk到增量段
+
+        Returns:
+            新chunk的下标范围
+        """
+        start = self.n_chunks
+        if not texts:
+            return range(start, start)
+        counts = self.vectorizer.transform(texts).tocsr()
+        counts.sum_duplicates()
+        self.delta = sparse.hstack([self.delta, counts.T.tocsr()], format='csr')
+        self.doc_len = np.concatenate([self.doc_len, np.asarray(counts.sum(axis=1), dtype=np.float32).ravel()])
+        self.alive = np.concatenate([self.alive, np.ones(counts.shape[0], dtype=bool)])
+        self.doc_freq += np.bincount(counts.indices, minlength=N_FEATURES).astype(np.float32)
+        self._prepare()
+        return range(start, self.n_chunks)
+
+    def _chunk_terms(self, ids: np.ndarray) -> np.ndarray:
+        """一组chunk包含的全部词项（每段各做一次批量列切片，按chunk重复出现）"""
+        in_main = ids < self.n_main
+        return np.concatenate([
+            self.main[:, ids[in_main]].tocoo().row,
+            self.delta[:, ids[~in_main] - self.n_main].tocoo().row
+        ])
+
+    def remove(self, chunk_indices) -> int:
+        """墓碑删除chunk，返回实际删除数"""
+        ids = np.unique(np.asarray(list(chunk_indices), dtype=np.int64))
+        ids = ids[(ids >= 0) & (ids < self.n_chunks)]
+        ids = ids[self.alive[ids]]
+        if len(ids) == 0:
+            return 0
+        self.alive[ids] = False
+        self.doc_freq -= np.bincount(self._chunk_terms(ids), minlength=N_FEATURES).astype(np.float32)
+        self._prepare()
+        return len(ids)
+
+    def compact(self) -> np.ndarray:
+        """
+        合并增量段并物理移除墓碑chunk
+
+        Returns:
+            保留的旧chunk下标（新下标 = 在该数组中的位置）
+        """
+        keep = np.flatnonzero(self.alive)
+        self.main = sparse.hstack([self.main, self.delta], format='csr')[:, keep]
+        self.delta = sparse.csr_matrix((N_FEATURES, 0), dtype=np.float32)
+        self.doc_len = self.doc_len[keep]
+        self.alive = np.ones(len(keep), dtype=bool)
+        self.doc_freq = np.diff(self.main.indptr).astype(np.float32)
+        self._prepare()
+        return keep
+
+    def params(self) -> Dict[str, Any]:
+        return {'ngram_range': list(self.ngram_range), 'k1': self.k1, 'b': self.b, 'n_features': N_FEATURES,
+                'n_main': self.n_main}
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """导出为扁平数组（供 VectorStore 写入 .npy）"""
+        return {
+            'main_indptr': self.main.indptr,
+            'main_indices': self.main.indices,
+            'main_data': self.main.data,
+            'delta_indptr': self.delta.indptr,
+            'delta_indices': self.delta.indices,
+            'delta_data': self.delta.data,
+            'doc_freq': self.doc_freq,
+            'doc_len': self.doc_len,
+            'alive': self.alive,
+        }
+
+    @classmethod
+    def from_arrays(cls, params: Dict[str, Any], arrays: Dict[str, np.ndarray]) -> 'BM25Index':
+        """
+        由扁平数组还原索引；main 段分量可以是 mmap 数组，查询时只读入命中的倒排表
+
+        Raises:
+            ValueError: 哈希维度与当前实现不一致
+        """
+        if int(params.get('n_features', N_FEATURES)) != N_FEATURES:
+            raise ValueError("n_features 与当前索引实现不一致")
+        index = cls(tuple(params['ngram_range']), params['k1'], params['b'])
+        n_chunks = len(arrays['alive'])
+        n_main = int(params['n_main'])
+        index.main = sparse.csr_matrix(
+            (arrays['main_data'], arrays['main_indices'], arrays['main_indptr']),
+            shape=(N_FEATURES, n_main), copy=False)
+        index.delta = sparse.csr_matrix(
+            (np.array(arrays['delta_data']), np.array(arrays['delta_indices']), np.array(arrays['delta_indptr'])),
+            shape=(N_FEATURES, n_chunks - n_main))
+        index.doc_freq = np.array(arrays['doc_freq'], dtype=np.float32)
+        index.doc_len = np.array(arrays['doc_len'], dtype=np.float32)
+        index.alive = np.array(arrays['alive'], dtype=bool)
+        index._prepare()
+        return index
+
+    def _prepare(self):
+        """预计算查询时不变的量：idf 与每个chunk的长度归一项"""
+        n = max(int(self.alive.sum()), 1)
+        live_len = self.doc_len[self.alive]
+        avgdl = float(live_len.mean()) if len(live_len) else 1.0
+        self.idf = np.log1p((n - self.doc_freq + 0.5) / (self.doc_freq + 0.5)).astype(np.float32)
+        self.norm = (self.k1 * (1.0 - self.b + self.b * self.doc_len / max(avgdl, 1e-9))).astype(np.float32)
+
+    def _query_terms(self, query: str) -> Tuple[np.ndarray, np.ndarray]:
+        q = self.vectorizer.transform([query]).tocsr()
+        q.sum_duplicates()
+        return q.indices, q.data
+
+    def _bm25(self, terms: np.ndarray, qtf: np.ndarray, term_of: np.ndarray,
+              chunk: np.ndarray, tf: np.ndarray) -> np.ndarray:
+        return self.idf[terms][term_of] * qtf[term_of] * tf * (self.k1 + 1.0) / (tf + self.norm[chunk])
+
+    def score(self, query: str) -> np.ndarray:
+        """返回每个chunk的BM25得分（已删除chunk为0）"""
+        n = self.n_chunks
+        if n == 0:
+            return np.zeros(0, dtype=np.float32)
+        terms, qtf = self._query_terms(query)
+        if len(terms) == 0:
+            return np.zeros(n, dtype=np.float32)
+
+        scores = np.zeros(n, dtype=np.float64)
+        if self.n_main:
+            rows = self.main[terms]
+            # 每个非零项对应的查询词项（用于取 idf 与查询词频）
+            term_of = np.repeat(np.arange(len(terms)), np.diff(rows.indptr))
+            w = self._bm25(terms, qtf, term_of, rows.indices, rows.data)
+            scores += np.bincount(rows.indices, weights=w, minlength=n)
+        if self.n_delta:
+            rows = self.delta[terms]
+            term_of = np.repeat(np.arange(len(terms)), np.diff(rows.indptr))
+            chunk = rows.indices + self.n_main
+            w = self._bm25(terms, qtf, term_of, chunk, rows.data)
+            scores += np.bincount(chunk, weights=w, minlength=n)
+
+        scores[~self.alive] = 0.0
+        return scores.astype(np.float32)
+
+    def search(self, query: str, top_k: int = 3) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        检索得分最高的chunk
+
+        Returns:
+            (chunk下标, 得分)，按得分降序，仅包含得分>0的结果
+        """
+        scores = self.score(query)
+        idx = top_k_indices(scores, top_k)
+        idx = idx[scores[idx] > 0]
+        return idx, scores[idx]
@@ -0,0 +1,153 @@
+"""
+检索索引的磁盘存储 - 版本化目录格式，数组以 .npy 保存并按 mmap 方式打开
+
+目录结构：
+    <root>/CURRENT              当前代（generation）目录名
+    <root>/<gen>/meta.json      格式版本、索引参数、文档元数据
+    <root>/<gen>/<name>.npy     稀疏矩阵分量、稠密向量等数组
+    <root>/<gen>/<name>.bin     偏移索引的文本块（utf-8），偏移量在 <name>_offsets.npy
+"""
+from __future__ import annotations
+
+import copy
+import json
+import os
+import shutil
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+STORE_FORMAT_VERSION = 1
+
+
+class TextStore:
+    """
+    偏移索引的文本存储：磁盘部分通过 mmap 按需读取，新增文本驻留内存
+
+    逻辑下标通过 _order 映射到物理位置（< n_disk 为磁盘，其余为内存），
+    select() 只调整映射，不搬运文本。
+    """
+
+    def __init__(self, blob: Optional[np.ndarray] = None, offsets: Optional[np.ndarray] = None):
+        self._blob = blob
+        self._offsets = offsets if offsets is not None else np.zeros(1, dtype=np.int64)
+        self._n_disk = len(self._offsets) - 1
+        self._mem: List[str] = []
+        self._order = np.arange(self._n_disk, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    def get(self, i: int) -> str:
+        p = int(self._order[i])
+        if p >= self._n_disk:
+            return self._mem[p - self._n_disk]
+        start, end = int(self._offsets[p]), int(self._offsets[p + 1])
+        return bytes(self._blob[start:end]).decode('utf-8')
+
+    def extend(self, texts: List[str]) -> None:
+        base = self._n_disk + len(self._mem)
+        self._mem.extend(texts)
+        self._order = np.concatenate([self._order, np.arange(base, base + len(texts), dtype=np.int64)])
+
+    def snapshot(self) -> 'TextStore':
+        """浅拷贝：_mem 只追加、_order 只整体替换，快照可在锁外安全写出"""
+        return copy.copy(self)
+
+    def select(self, keep: np.ndarray) -> None:
+        self._order = self._order[np.asarray(keep, dtype=np.int64)]
+
+    def write(self, path: str) -> np.ndarray:
+        """按逻辑顺序写出文本块，返回偏移数组（长度 n+1）"""
+        offsets = np.zeros(len(self) + 1, dtype=np.int64)
+        pos = 0
+        with open(path, 'wb') as f:
+            for i in range(len(self)):
+                p = int(self._order[i])
+                if p >= self._n_disk:
+                    data = self._mem[p - self._n_disk].encode('utf-8')
+                else:
+                    data = bytes(self._blob[int(self._offsets[p]):int(self._offsets[p + 1])])
+                f.write(data)
+                pos += len(data)
+                offsets[i + 1] = pos
+        return offsets
+
+
+class VectorStore:
+    """版本化的索引目录：每次保存写入新的一代目录，再原子切换 CURRENT"""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _current(self) -> Optional[str]:
+        try:
+            with open(os.path.join(self.root, 'CURRENT'), 'r', encoding='utf-8') as f:
+                gen = f.read().strip()
+        except OSError:
+            return None
+        path = os.path.join(self.root, gen)
+        return path if gen and os.path.isdir(path) else None
+
+    def exists(self) -> bool:
+        return self._current() is not None
+
+    def save(self, meta: Dict[str, Any], arrays: Dict[str, np.ndarray], texts: Dict[str, TextStore]) -> str:
+        """写入新的一代并切换；旧代目录随后删除（已映射的文件在 POSIX 下仍可读）"""
+        os.makedirs(self.root, exist_ok=True)
+        gen = f"gen-{time.time_ns()}"
+        tmp = os.path.join(self.root, gen + '.tmp')
+        os.makedirs(tmp)
+
+        for name, arr in arrays.items():
+            np.save(os.path.join(tmp, f'{name}.npy'), np.ascontiguousarray(arr))
+        for name, store in texts.items():
+            offsets = store.write(os.path.join(tmp, f'{name}.bin'))
+            np.save(os.path.join(tmp, f'{name}_offsets.npy'), offsets)
+        with open(os.path.join(tmp, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump({**meta, 'format_version': STORE_FORMAT_VERSION,
+                       'arrays': sorted(arrays), 'texts': sorted(texts)}, f, ensure_ascii=False)
+
+        os.replace(tmp, os.path.join(self.root, gen))
+        pointer = os.path.join(self.root, 'CURRENT.tmp')
+        with open(pointer, 'w', encoding='utf-8') as f:
+            f.write(gen)
+        os.replace(pointer, os.path.join(self.root, 'CURRENT'))
+
+        for name in os.listdir(self.root):
+            if name.startswith('gen-') and name != gen:
+                shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+        return gen
+
+    def load(self, mmap_arrays: Iterable[str] = ()) -> Optional[Tuple[Dict[str, Any], Dict[str, np.ndarray], Dict[str, TextStore]]]:
+        """
+        打开当前代
+
+        Args:
+            mmap_arrays: 以 mmap 只读方式打开的数组名；其余数组读入内存（可修改）
+
+        Returns:
+            (meta, arrays, texts)，不存在或格式版本不符时返回 None
+        """
+        path = self._current()
+        if path is None:
+            return None
+        with open(os.path.join(path, 'meta.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('format_version') != STORE_FORMAT_VERSION:
+            return None
+
+        mmap_arrays = set(mmap_arrays)
+        arrays = {}
+        for name in meta.get('arrays', []):
+            mode = 'r' if name in mmap_arrays else None
+            arrays[name] = np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mode)
+
+        texts = {}
+        for name in meta.get('texts', []):
+            offsets = np.load(os.path.join(path, f'{name}_offsets.npy'))
+            blob_path = os.path.join(path, f'{name}.bin')
+            blob = np.memmap(blob_path, dtype=np.uint8, mode='r') if os.path.getsize(blob_path) else None
+            texts[name] = TextStore(blob, offsets)
+        return meta, arrays, texts
@@ -0,0 +1,9 @@
+"""
+pytest 公共配置：从 backend/ 目录导入服务模块（python -m pytest tests）
+"""
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
@@ -0,0 +1,63 @@
+"""
+负载量测增量追加：CSV 追加写入后重新加载，timestamp 仍为 datetime 列
+"""
+import os
+
+import pandas as pd
+import pytest
+
+from config import Config
+from services.load_prediction import LoadPrediction, read_load_csv
+
+
+@pytest.fixture
+def service(tmp_path):
+    """指向临时目录的地区实例，数据取真实CSV的前60天"""
+    src = os.path.join(Config.LOAD_DATA_DIR, f'realistic_{Config.DEFAULT_LOAD_REGION}_load.csv')
+    pd.read_csv(src, nrows=24 * 60).to_csv(tmp_path / os.path.basename(src), index=False)
+    inst = LoadPrediction()
+    inst.data_dir = str(tmp_path)
+    inst.load_historical_data()
+    return inst
+
+
+def test_append_then_reload_keeps_datetime_column(service):
+    last = service.historical_data['timestamp'].iloc[-1]
+    rows = [{'timestamp': str(last + pd.Timedelta(hours=h)), 'load_mw': 5000.0 + h}
+            for h in (1, 2)]
+    assert service.append_measurements(rows)['accepted'] == 2
+
+    service.release()
+    service.load_historical_data()
+    df = service.historical_data
+    assert pd.api.types.is_datetime64_any_dtype(df['timestamp'])
+    assert df['timestamp'].iloc[-1] == last + pd.Timedelta(hours=2)
+    assert service.get_load_summary()['current_features']['max_load'] >= 5002.0
+
+    # 追加的行与原文件时间格式一致
+    raw = pd.read_csv(service.data_file, dtype={'timestamp': str})['timestamp']
+    assert raw.str.len().nunique() == 1
+
+
+def test_mixed_format_csv_is_parsed(tmp_path):
+    path = tmp_path / 'mixed.csv'
+    path.write_text('timestamp,load_mw\n2023-11-18 23:43:31.141491,1\n2030-01-01 00:00:00,2\n')
+    df = read_load_csv(str(path))
+    assert pd.api.types.is_datetime64_any_dtype(df['timestamp'])
+
+
+def test_timezone_aware_input_is_normalized(service):
+    last = service.historical_data['timestamp'].iloc[-1]
+    local = last + pd.Timedelta(hours=1)
+    utc = local.tz_localize(Config.LOAD_TIMEZONE).tz_convert('UTC').isoformat()
+    result = service.append_measurements([{'timestamp': utc, 'load_mw': 4000.0}], persist=False)
+    assert result['accepted'] == 1
+    assert service.historical_data['timestamp'].iloc[-1] == local
+
+
+def test_mixed_timezones_are_rejected(service):
+    with pytest.raises(ValueError):
+        service.append_measurements([
+            {'timestamp': '2099-01-01T00:00:00+08:00', 'load_mw': 1.0},
+            {'timestamp': '2099-01-01 01:00:00', 'load_mw': 1.0},
+        ], persist=False)
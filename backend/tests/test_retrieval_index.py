@@ -0,0 +1,151 @@
+"""
+检索索引增量维护：添加/删除/压缩后与对同一文档集全量重建的索引一致
+"""
+import numpy as np
+import pytest
+
+from config import Config
+from services.retrieval_service import DocumentRetrieval
+from services.sparse_index import BM25Index
+
+
+def _long(text, tag, n=60):
+    """拼接编号段落使文档切成多个chunk"""
+    return "\n".join([text] + [f"{tag}第{i}条 规划说明{i}：按{i * 5}年负荷水平校核。" for i in range(n)])
+
+
+DOCS = {
+    'a_标准.txt': _long("110kV电网电压偏差不超过±7%。\n线路负载率不宜超过80%。\n主变N-1故障时负载率不超过100%。", '标准'),
+    'b_手册.txt': _long("新建变电站与既有站址间距不小于3公里。\n电缆线路与建筑物净距不小于5米。", '手册'),
+    'c_政策.txt': _long("城市中心区供电可靠率不低于99.99%。\n10kV配电网宜采用环网接线。", '政策'),
+}
+EXTRA = ('d_general.txt', _long("220kV主变容量宜选用3×240MVA。\n容载比控制在1.8~2.1之间。", '附录'))
+QUERIES = ['电压偏差', '负载率', '变电站间距', '供电可靠率', '主变容量', '环网接线', '规划说明12', '负荷水平']
+
+
+def _chunk_scores(service, query):
+    """{(文件名, chunk序号): BM25 得分}，仅含未删除且得分>0的chunk"""
+    scores = service.bm25.score(query)
+    out = {}
+    for i in np.flatnonzero((scores > 0) & service.bm25.alive):
+        doc = service.documents[int(service.chunk_doc[i])]
+        out[(doc['filename'], int(service.chunk_id[i]))] = float(scores[i])
+    return out
+
+
+def _make_service(tmp_path, name, files):
+    docs_dir = tmp_path / name / 'docs'
+    docs_dir.mkdir(parents=True)
+    for filename, text in files.items():
+        (docs_dir / filename).write_text(text, encoding='utf-8')
+    service = DocumentRetrieval(str(docs_dir), str(tmp_path / name / 'index'))
+    # 不触发后台压缩/保存线程，由测试显式调用
+    service._schedule_save = lambda: None
+    service.build_index()
+    return service, docs_dir
+
+
+def _assert_consistent(service):
+    n = service.bm25.n_chunks
+    assert len(service.chunk_doc) == len(service.chunk_id) == len(service.chunk_hash) == n
+    assert len(service.chunk_text) == n
+    assert service.dense.n_vectors == n
+    assert np.array_equal(service.dense.alive, service.bm25.alive)
+    for i in np.flatnonzero(service.bm25.alive):
+        doc_idx = int(service.chunk_doc[i])
+        assert not service.documents[doc_idx].get('deleted')
+        assert service.chunk_text.get(int(i)) in service.doc_text.get(doc_idx)
+
+
+def test_bm25_incremental_matches_full_fit():
+    texts = ["电压偏差不超过7%", "线路负载率不宜超过80%", "变电站间距不小于3公里",
+             "供电可靠率不低于99.99%", "主变容量3×240MVA", "环网接线"]
+    index = BM25Index().fit(texts[:3])
+    index.add(texts[3:])
+    index.remove([1, 4])
+    live = [t for i, t in enumerate(texts) if i not in (1, 4)]
+    fresh = BM25Index().fit(live)
+
+    for q in ['负载率', '电压偏差', '容量', '环网']:
+        before = index.score(q)
+        assert np.allclose(before[index.alive], fresh.score(q), atol=1e-5)
+        assert not before[~index.alive].any()
+
+    keep = index.compact()
+    assert keep.tolist() == [0, 2, 3, 5]
+    assert np.array_equal(index.doc_freq, fresh.doc_freq)
+    for q in ['负载率', '电压偏差', '容量', '环网']:
+        assert np.allclose(index.score(q), fresh.score(q), atol=1e-5)
+
+    restored = BM25Index.from_arrays(index.params(), index.to_arrays())
+    assert np.allclose(restored.score('电压偏差'), index.score('电压偏差'))
+
+
+def test_add_remove_compact_matches_rebuild(tmp_path):
+    service, docs_dir = _make_service(tmp_path, 'incremental', DOCS)
+    _assert_consistent(service)
+
+    # 增量添加、替换、删除
+    extra_path = docs_dir / EXTRA[0]
+    extra_path.write_text(EXTRA[1], encoding='utf-8')
+    service.add_document(str(extra_path), EXTRA[1])
+    replaced = DOCS['a_标准.txt'] + "\n500kV电网电压偏差:±3%。"
+    (docs_dir / 'a_标准.txt').write_text(replaced, encoding='utf-8')
+    service.add_document(str(docs_dir / 'a_标准.txt'), replaced)
+    removed_path = docs_dir / 'b_手册.txt'
+    assert service.remove_document(str(removed_path))
+    assert not service.remove_document(str(removed_path))
+    removed_path.unlink()
+    _assert_consistent(service)
+
+    final = {**{k: v for k, v in DOCS.items() if k != 'b_手册.txt'}, 'a_标准.txt': replaced, EXTRA[0]: EXTRA[1]}
+    rebuilt, _ = _make_service(tmp_path, 'rebuilt', final)
+
+    # 墓碑状态下与重建索引得分一致，且不返回已删除文档
+    for q in QUERIES:
+        assert _chunk_scores(service, q) == pytest.approx(_chunk_scores(rebuilt, q), rel=1e-5)
+        assert all(hit['filename'] != 'b_手册.txt' for hit in service.search(q, top_k=10, mode='sparse'))
+
+    service.compact()
+    _assert_consistent(service)
+    assert service.bm25.n_deleted == 0
+    assert sorted(d['filename'] for d in service.documents) == sorted(final)
+    for q in QUERIES:
+        assert _chunk_scores(service, q) == pytest.approx(_chunk_scores(rebuilt, q), rel=1e-5)
+
+    # 保存后重新映射，检索结果不变
+    service.save_index()
+    reloaded = DocumentRetrieval(service.documents_dir, service.vector_db_path)
+    _assert_consistent(reloaded)
+    for q in QUERIES:
+        assert reloaded.search(q, top_k=5) == service.search(q, top_k=5)
+
+
+def test_saves_are_coalesced(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'INDEX_SAVE_DELAY_SECONDS', 0.2)
+    service, docs_dir = _make_service(tmp_path, 'coalesced', DOCS)
+    del service._schedule_save
+    saves = []
+    monkeypatch.setattr(service, 'save_index', lambda: saves.append(service.bm25.n_chunks))
+
+    for i in range(5):
+        path = docs_dir / f'e{i}.txt'
+        path.write_text(f"附加说明{i}：电压偏差校核。", encoding='utf-8')
+        service.add_document(str(path), path.read_text(encoding='utf-8'))
+    service._saver.join(timeout=10)
+
+    # 一个后台线程，多次变更合并为一次保存，且保存的是最终状态
+    assert saves == [service.bm25.n_chunks]
+    assert service._saver is None
+
+
+def test_chunk_hash_keeps_trailing_zero_bytes(tmp_path, monkeypatch):
+    # 末尾为 0 字节的摘要在 S20 中会被截短，导致嵌入缓存查不到
+    digest = bytes(range(1, 19)) + b'\x00\x00'
+    monkeypatch.setattr('services.retrieval_service.content_hash', lambda text: digest)
+    service, _ = _make_service(tmp_path, 'hash', DOCS)
+    assert all(bytes(h) == digest for h in service.chunk_hash)
+
+    service.save_index()
+    reloaded = DocumentRetrieval(service.documents_dir, service.vector_db_path)
+    assert all(bytes(h) == digest for h in reloaded.chunk_hash)
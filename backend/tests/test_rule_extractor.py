@@ -0,0 +1,65 @@
+"""
+规则抽取：随仓库附带的 GB/T 12325 PDF 与示例文档
+"""
+import glob
+import os
+
+import pytest
+
+from config import Config
+from services.rule_extractor import rule_extractor, split_clauses
+
+PDF_PATH = os.path.join(Config.DOCUMENTS_DIR, 'uploads', '12325-2008-gbt-e-300.pdf')
+
+
+@pytest.fixture(scope='module')
+def gbt_result(tmp_path_factory):
+    pytest.importorskip('fitz')
+    from services.doc_ingest import extract_text
+    cache_dir = str(tmp_path_factory.mktemp('extract_cache'))
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(Config, 'EXTRACT_CACHE_DIR', cache_dir)
+        text, _ = extract_text(PDF_PATH)
+    return rule_extractor.extract(text)
+
+
+def test_pdf_voltage_constraints_have_levels(gbt_result):
+    items = gbt_result['voltage_constraints']
+    assert {it['voltage_level'] for it in items} == {'35kV及以上', '20kV及以下', '0.22kV'}
+    for it in items:
+        assert it['voltage_level']
+        assert 0 < it['max_deviation'] < 1.0
+        assert '×' not in it['rule'] and '=' not in it['rule']
+
+
+def test_pdf_unresolved_is_deduplicated(gbt_result):
+    unresolved = gbt_result['extraction']['unresolved']
+    assert len(unresolved) == len(set(unresolved))
+    assert '供电电压偏差的限值' in unresolved
+
+
+def test_formula_and_measurement_error_are_not_limits():
+    text = (
+        "电压偏差(%)=电压测量值-系统标称电压\n"
+        "系统标称电压\n"
+        "×100%........................(1)\n"
+        "对A级性能电压监测仪,可以根据具体情况选择4个不同类型的时间长度计算供电电压偏差:3s、\n"
+        "1min、10min、2h。\n"
+        "A级性能电压监测仪的测量误差不应超过±0.2%。\n"
+        "供电电压偏差不应超过10%。\n"
+    )
+    result = rule_extractor.extract(text)
+    assert result['voltage_constraints'] == []
+    assert '供电电压偏差不应超过10%' in result['extraction']['unresolved']
+
+
+def test_formula_line_is_not_joined_with_next_line():
+    clauses = split_clauses("系统标称电压\n×100%........................(1)\n对A级性能电压监测仪,可以选择时间长度")
+    assert '×100%........................(1)' in clauses
+
+
+@pytest.mark.parametrize('path', sorted(glob.glob(os.path.join(Config.DOCUMENTS_DIR, '*.txt'))))
+def test_sample_documents_voltage_levels(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        result = rule_extractor.extract(f.read())
+    assert all(it['voltage_level'] for it in result['voltage_constraints'])
@@ -0,0 +1,117 @@
+"""
+批量评分：score_batch 与逐个 score_candidate 结果一致；候选集摘要随特征读取的字段变化
+"""
+import copy
+import random
+
+import numpy as np
+import pytest
+
+from services.scorer import CandidateScorer, CandidateTable
+from services.scoring_features import FeatureRegistry, FeatureStore
+
+LOAD_FEATURES = {'growth_rate': 0.06}
+TOPOLOGY = {'weak_nodes': ['bus_3', 'bus_7'], 'node_degrees': {'bus_3': 1, 'bus_7': 2}}
+CONSTRAINTS = {}
+
+
+def _candidates(n=400, seed=7):
+    rng = random.Random(seed)
+    out = []
+    for i in range(n):
+        kind = rng.choice(['new_substation', 'substation_expansion', 'new_line', 'unknown'])
+        c = {'id': f'c{i}', 'type': kind}
+        if rng.random() < 0.8:
+            c['estimated_cost_m'] = round(rng.uniform(5, 120), 2)
+        if kind == 'new_substation':
+            c.update(capacity_mva=rng.choice([40, 100, 240]), distance_to_existing=rng.uniform(0, 40),
+                     substation_id=f'bus_{rng.randrange(10)}')
+        elif kind == 'substation_expansion':
+            c.update(substation_id=rng.choice([f'bus_{rng.randrange(10)}', None]))
+            if rng.random() < 0.7:
+                c['additional_capacity'] = rng.choice([20, 63])
+        elif kind == 'new_line':
+            c.update(length_km=rng.uniform(1, 30))
+            if rng.random() < 0.7:
+                c['capacity_mva'] = rng.choice([50, 100])
+        # 电压等级：缺失 / 合法 / 非法 / 显式 None
+        voltage = rng.choice(['missing', 110, 220, 66, None])
+        if voltage != 'missing':
+            c['voltage_level'] = voltage
+        out.append(c)
+    return out
+
+
+@pytest.fixture(scope='module')
+def rule_scorer():
+    s = CandidateScorer()
+    s.ml = None
+    return s
+
+
+def test_score_batch_matches_score_candidate(rule_scorer):
+    candidates = _candidates()
+    table = CandidateTable(candidates)
+    columns = rule_scorer.score_batch(table, LOAD_FEATURES, {}, TOPOLOGY, CONSTRAINTS)
+
+    for i, c in enumerate(candidates):
+        expected = rule_scorer.score_candidate(c, LOAD_FEATURES, {}, TOPOLOGY, CONSTRAINTS)['scores']
+        for name, value in expected.items():
+            assert round(float(columns[name][i]), 2) == value, (i, name)
+
+
+def test_rank_candidates_matches_sorted_scores(rule_scorer):
+    candidates = _candidates(200, seed=11)
+    ranked = rule_scorer.rank_candidates(candidates, LOAD_FEATURES, {}, TOPOLOGY, CONSTRAINTS, top_k=25)
+    totals = [rule_scorer.score_candidate(c, LOAD_FEATURES, {}, TOPOLOGY, CONSTRAINTS)['scores']['total']
+              for c in candidates]
+    expected = sorted(range(len(candidates)), key=lambda i: -totals[i])[:25]
+    assert [r['candidate']['id'] for r in ranked] == [candidates[i]['id'] for i in expected]
+
+
+def test_digest_tracks_fields_read_by_features():
+    candidates = _candidates(50)
+    digest = CandidateTable(candidates).digest
+    assert CandidateTable(copy.deepcopy(candidates)).digest == digest
+
+    changed = copy.deepcopy(candidates)
+    changed[3]['to_location'] = {'lat': 23.1, 'lon': 113.2}
+    assert CandidateTable(changed).digest != digest
+
+    changed = copy.deepcopy(candidates)
+    changed[5]['voltage_level'] = '110'
+    table = CandidateTable(changed)
+    assert np.isnan(table.columns['voltage_level'][5])
+    assert table.digest != digest
+
+    # 不参与评分的字段不影响摘要
+    changed = copy.deepcopy(candidates)
+    changed[0]['name'] = 'renamed'
+    assert CandidateTable(changed).digest == digest
+
+
+def test_empty_table(rule_scorer):
+    table = CandidateTable([])
+    columns = rule_scorer.score_batch(table, LOAD_FEATURES, {}, TOPOLOGY, CONSTRAINTS)
+    assert columns['total'].shape == (0,)
+
+
+def test_feature_cache_keyed_on_declared_gis_data():
+    registry = FeatureRegistry()
+    calls = []
+
+    @registry.register('n_substations', inputs=('gis_data',))
+    def _n_substations(table, ctx, deps):
+        calls.append(1)
+        return np.full(table.n, float(len(ctx['gis_data']['substations'])))
+
+    store = FeatureStore(registry)
+    table = CandidateTable(_candidates(5))
+    gis_data = {'substations': [{'id': 'bus_1'}]}
+    assert store.columns(['n_substations'], table, {'gis_data': gis_data})['n_substations'][0] == 1
+    store.columns(['n_substations'], table, {'gis_data': copy.deepcopy(gis_data)})
+    assert len(calls) == 1
+
+    gis_data['substations'].append({'id': 'bus_2'})
+    assert store.columns(['n_substations'], table, {'gis_data': gis_data})['n_substations'][0] == 2
+    assert len(calls) == 2
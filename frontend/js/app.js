@@ -394,11 +394,11 @@ async function loadData() {
         const predictionResponse = await fetch(`${API_BASE_URL}/api/load/predict`, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ horizon_days: 30 }),
+            body: JSON.stringify({ horizon_days: 7, max_points: 56 }),
             signal
         });
         const predictionData = await predictionResponse.json();
-        console.log('Prediction API response:', predictionData && predictionData.success, predictionData && predictionData.prediction ? predictionData.prediction.length : 'N/A');
+        console.log('Prediction API response:', predictionData && predictionData.success, predictionData && predictionData.prediction ? (predictionData.total_points || predictionData.prediction.length) : 'N/A');
 
         if (predictionData.success) {
             displayLoadPrediction(predictionData.prediction);
@@ -620,13 +620,17 @@ function displayTopology(topology) {
 
 // 显示负载预测
 function displayLoadPrediction(prediction) {
-    if (!Array.isArray(prediction) || prediction.length === 0) {
+    // 列式结果（服务端已降采样）：{timestamp: [...], predicted_load_mw: [...]}
+    const columnar = prediction && !Array.isArray(prediction) && Array.isArray(prediction.timestamp);
+    if (!columnar && (!Array.isArray(prediction) || prediction.length === 0)) {
         console.warn('displayLoadPrediction: empty prediction array');
         return;
     }
 
-    // 显示7天的详细数据（每3小时1个点，共56个点），以展示日周期波动
-    const sampledData = prediction.filter((_, index) => index % 3 === 0).slice(0, 56);
+    // 显示7天的详细数据（约56个点），以展示日周期波动
+    const sampledData = columnar
+        ? prediction.timestamp.map((ts, i) => ({ timestamp: ts, predicted_load_mw: prediction.predicted_load_mw[i] }))
+        : prediction.filter((_, index) => index % 3 === 0).slice(0, 56);
 
     const labels = sampledData.map((d, i) => {
         try {
@@ -681,11 +685,11 @@ async function runCompleteAnalysis() {
                 const predictionResponse = await fetch(`${API_BASE_URL}/api/load/predict`, {
                     method: 'POST',
                     headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ horizon_days: 30 }),
+                    body: JSON.stringify({ horizon_days: 7, max_points: 56 }),
                     signal
                 });
                 const predictionData = await predictionResponse.json();
-                console.log('Prediction API response (analyze):', predictionData && predictionData.success, predictionData && predictionData.prediction ? predictionData.prediction.length : 'N/A');
+                console.log('Prediction API response (analyze):', predictionData && predictionData.success, predictionData && predictionData.prediction ? (predictionData.total_points || predictionData.prediction.length) : 'N/A');
                 if (predictionData.success) {
                     displayLoadPrediction(predictionData.prediction);
                 }
@@ -1280,8 +1284,10 @@ async function sendChatMessage() {
     addChatMessage(message, 'user');
     input.value = '';
 
+    let reply = null;
     try {
-        const response = await fetch(`${API_BASE_URL}/api/llm/chat`, {
+        // 流式接口：逐段追加到同一条助手消息
+        const response = await fetch(`${API_BASE_URL}/api/llm/chat/stream`, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({
@@ -1291,17 +1297,47 @@ async function sendChatMessage() {
                 ]
             })
         });
-
-        const data = await response.json();
-
-        if (data.success) {
-            addChatMessage(data.response, 'assistant');
-        } else {
-            addChatMessage('抱歉,处理消息时出错。', 'assistant');
-        }
+        if (!response.ok || !response.body) throw new Error(`HTTP ${response.status}`);
+
+        reply = addChatMessage('', 'assistant');
+        await readSSE(response, (event, data) => {
+            if (event === 'delta') {
+                reply.textContent += data.delta;
+                reply.parentElement.scrollTop = reply.parentElement.scrollHeight;
+            } else if (event === 'error') {
+                throw new Error(data.error || 'stream error');
+            }
+        });
+        if (!reply.textContent) reply.textContent = '抱歉,处理消息时出错。';
     } catch (error) {
         console.error('Chat error:', error);
-        addChatMessage('抱歉,无法连接到服务器。', 'assistant');
+        // 已收到部分回复时保留已显示内容
+        if (!reply) addChatMessage('抱歉,无法连接到服务器。', 'assistant');
+        else if (!reply.textContent) reply.textContent = '抱歉,无法连接到服务器。';
+    }
+}
+
+// 读取 fetch 返回的 Server-Sent Events 流，对每个事件回调 onEvent(event, data)
+async function readSSE(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder('utf-8');
+    let buffer = '';
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let sep;
+        while ((sep = buffer.indexOf('\n\n')) !== -1) {
+            const raw = buffer.slice(0, sep);
+            buffer = buffer.slice(sep + 2);
+            let event = 'message';
+            const dataLines = [];
+            for (const line of raw.split('\n')) {
+                if (line.startsWith('event:')) event = line.slice(6).trim();
+                else if (line.startsWith('data:')) dataLines.push(line.slice(5).trim());
+            }
+            if (dataLines.length) onEvent(event, JSON.parse(dataLines.join('\n')));
+        }
     }
 }
 
@@ -1322,18 +1358,14 @@ async function uploadAndParseDoc() {
         // 上传
         const form = new FormData();
         form.append('file', file);
+        form.append('parse', '1');
         const upRes = await fetch(`${API_BASE_URL}/api/uploads`, { method: 'POST', body: form });
         const upData = await upRes.json();
         if (!upData.success) throw new Error(upData.error || '上传失败');
         lastUploadedDocId = upData.doc_id;
-        // 解析
-        const parRes = await fetch(`${API_BASE_URL}/api/constraints/parse_file`, {
-            method: 'POST', headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ doc_id: lastUploadedDocId })
-        });
-        const parData = await parRes.json();
-        if (!parData.success) throw new Error(parData.error || '解析失败');
-        lastParsedConstraints = parData.constraints;
+        // 后台摄取（抽取→切块→索引→解析），轮询任务进度
+        const job = await waitForIngestJob(upData.job_id);
+        lastParsedConstraints = job.result.constraints;
         // 展示
         const box = document.getElementById('llmParseResult');
         box.innerHTML = `<pre style="white-space:pre-wrap;">${escapeHtml(JSON.stringify(lastParsedConstraints, null, 2)).slice(0, 10000)}</pre>`;
@@ -1349,6 +1381,21 @@ async function uploadAndParseDoc() {
     }
 }
 
+async function waitForIngestJob(jobId, intervalMs = 1000) {
+    const stageNames = { extract: '抽取文本', index: '建立索引', parse: 'LLM解析' };
+    while (true) {
+        const res = await fetch(`${API_BASE_URL}/api/jobs/${jobId}`);
+        const data = await res.json();
+        if (!data.success) throw new Error(data.error || '查询任务失败');
+        const job = data.job;
+        if (job.status === 'succeeded') return job;
+        if (job.status === 'failed') throw new Error(job.error || '解析失败');
+        const pages = job.pages_total ? ` ${job.pages_done}/${job.pages_total}页` : '';
+        updateStatus(`${stageNames[job.stage] || '排队中'}${pages} (${Math.round(job.progress * 100)}%)`);
+        await new Promise(resolve => setTimeout(resolve, intervalMs));
+    }
+}
+
 async function applyParsedConstraints() {
     try {
         if (!lastParsedConstraints) {
@@ -1415,6 +1462,7 @@ function addChatMessage(text, role) {
     messageDiv.textContent = text;
     container.appendChild(messageDiv);
     container.scrollTop = container.scrollHeight;
+    return messageDiv;
 }
 
 // 导出函数和变量到全局作用域，供i18n使用